@@ -2,6 +2,7 @@
 Admin API routes for data operations.
 """
 from fastapi import APIRouter, Depends, HTTPException, Query, Request, Body
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
@@ -19,6 +20,7 @@ from models.homework import Homework, SubmissionType
 from models.subscription import Subscription
 from models.settings import AdminSetting
 from services.lead_service import LeadService
+from services.student_service import StudentService
 from services.notification_trigger import NotificationTrigger
 from schemas.response import StandardResponse
 from utils.logger import get_logger
@@ -521,6 +523,7 @@ async def delete_student(student_id: int, db: Session = Depends(db_dependency)):
         logger.info(f"🗑️ Deleting student: {student_id} ({student_name})")
         db.delete(student)
         db.commit()
+        StudentService.invalidate_cached_student(student_id, student_phone)
         
         logger.info(f"✓ Student successfully deleted: {student_id} ({student_name}) - {student_phone}")
         
@@ -748,6 +751,7 @@ async def update_student_status(
         student.status = UserStatus(new_status)
         student.updated_at = datetime.utcnow()
         db.commit()
+        StudentService.invalidate_cached_student(student_id)
         
         logger.info(f"Updated student {student_id} status to {new_status}")
         
@@ -1390,7 +1394,8 @@ async def update_settings(request: Request, data: dict, db: Session = Depends(db
     logger.info(f"=== SETTINGS UPDATE: Received {len(data)} keys ===")
     
     try:
-        updated_count = 0
+        now = datetime.utcnow()
+        rows = []
         
         for key, value in data.items():
             if not key:
@@ -1401,21 +1406,23 @@ async def update_settings(request: Request, data: dict, db: Session = Depends(db
                 value_str = str(value) if value else ""
                 logger.info(f"Saving {key}: {len(value_str)} chars")
             
-            # Get or create setting
-            db_setting = db.query(AdminSetting).filter(AdminSetting.key == key).first()
-            
-            if db_setting:
-                db_setting.value = str(value) if value else None
-                db_setting.updated_at = datetime.utcnow()
-            else:
-                db_setting = AdminSetting(
-                    key=key,
-                    value=str(value) if value else None,
-                    description=f"Setting for {key}"
-                )
-                db.add(db_setting)
-            
-            updated_count += 1
+            rows.append({
+                "key": key,
+                "value": str(value) if value else None,
+                "description": f"Setting for {key}",
+                "created_at": now,
+                "updated_at": now,
+            })
+        
+        if rows:
+            # One upsert for every key instead of a SELECT per key; existing settings
+            # keep their description
+            stmt = mysql_insert(AdminSetting.__table__).values(rows)
+            db.execute(stmt.on_duplicate_key_update(
+                value=stmt.inserted.value,
+                updated_at=stmt.inserted.updated_at,
+            ))
+        updated_count = len(rows)
         
         db.commit()
         logger.info(f"SUCCESS: Updated {updated_count} settings")
@@ -1997,25 +2004,19 @@ async def get_conversation_messages(phone_number: str, db: AsyncSession = Depend
             # Use stored messages if available
             messages = stored_messages
         else:
-            # Get bot settings
+            # Get bot settings (one query for all three keys)
             from sqlalchemy import select
-            bot_name_result = await db.execute(
-                select(AdminSetting).where(AdminSetting.key == "bot_name")
+            settings_result = await db.execute(
+                select(AdminSetting.key, AdminSetting.value).where(
+                    AdminSetting.key.in_(("bot_name", "template_welcome", "template_status"))
+                )
             )
-            bot_name_setting = bot_name_result.scalars().first()
-            bot_name = bot_name_setting.value if bot_name_setting else "EduBot"
+            bot_settings = dict(settings_result.all())
+            bot_name = bot_settings.get("bot_name", "EduBot")
             
-            template_welcome_result = await db.execute(
-                select(AdminSetting).where(AdminSetting.key == "template_welcome")
-            )
-            template_welcome_setting = template_welcome_result.scalars().first()
-            template_welcome = template_welcome_setting.value if template_welcome_setting else "👋 {name}, welcome to {bot_name}!"
+            template_welcome = bot_settings.get("template_welcome", "👋 {name}, welcome to {bot_name}!")
             
-            template_status_result = await db.execute(
-                select(AdminSetting).where(AdminSetting.key == "template_status")
-            )
-            template_status_setting = template_status_result.scalars().first()
-            template_status = template_status_setting.value if template_status_setting else "📋 Status: Awaiting registration\n\nPlease provide:\n1. Your full name\n2. Your class/grade\n3. Email address"
+            template_status = bot_settings.get("template_status", "📋 Status: Awaiting registration\n\nPlease provide:\n1. Your full name\n2. Your class/grade\n3. Email address")
             
             # Check if it's a student or lead and create default conversation
             student_result = await db.execute(
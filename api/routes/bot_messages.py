@@ -9,6 +9,7 @@ import logging
 from config.database import get_db, get_db_sync, ASYNC_MODE
 from models.bot_message import BotMessage, BotMessageWorkflow, BotMessageTemplate
 from services.bot_message_service import BotMessageService, BotMessageWorkflowService
+from services.conversation_service import ConversationService
 from schemas.response import StandardResponse
 
 logger = logging.getLogger(__name__)
@@ -315,6 +316,7 @@ async def update_template(template_id: int, data: dict, db: Session = Depends(db
             template.is_default = data["is_default"]
 
         db.commit()
+        ConversationService.clear_template_cache()
 
         return StandardResponse(
             status="success",
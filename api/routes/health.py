@@ -27,15 +27,13 @@ async def health_status(db: Session = Depends(get_db)):
     - System resources
     """
     try:
-        # Check services
-        db_status, db_msg, db_time = MonitoringService.check_database_health(db)
-        whatsapp_status, whatsapp_msg, _ = MonitoringService.check_whatsapp_health()
-        paystack_status, paystack_msg, _ = MonitoringService.check_paystack_health()
+        # Check services (the DB probe runs off the event loop)
+        checks = await MonitoringService.get_all_health(db)
         
         # Update health status
-        MonitoringService.update_health_status("database", db_status, db_msg, db_time)
-        MonitoringService.update_health_status("whatsapp", whatsapp_status, whatsapp_msg, 0)
-        MonitoringService.update_health_status("paystack", paystack_status, paystack_msg, 0)
+        for service in ("database", "whatsapp", "paystack"):
+            service_status, service_msg, service_time = checks[service]
+            MonitoringService.update_health_status(service, service_status, service_msg, service_time)
         
         # Get health status
         health = MonitoringService.get_health_status()
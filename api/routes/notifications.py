@@ -1,6 +1,7 @@
 """Notification API endpoints for users and admins."""
 
 import logging
+from datetime import datetime
 from typing import Optional, List
 from fastapi import APIRouter, Depends, Body, HTTPException
 from sqlalchemy.orm import Session
@@ -15,14 +16,19 @@ db_dependency = get_db_sync if ASYNC_MODE else get_db
 
 router = APIRouter(prefix="/api/notifications", tags=["notifications"])
 
+# Endpoints are plain `def`: NotificationService does blocking (sync Session) I/O, so FastAPI
+# runs each request in its threadpool instead of stalling the event loop for every round trip.
+
 
 @router.get("/")
-async def get_notifications(
+def get_notifications(
     phone_number: str,
     limit: int = 50,
     offset: int = 0,
     unread_only: bool = False,
     notification_type: Optional[str] = None,
+    before_created_at: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     db: Session = Depends(db_dependency)
 ):
     """
@@ -34,6 +40,7 @@ async def get_notifications(
     - offset: Number to skip (default: 0)
     - unread_only: Only unread (default: false)
     - notification_type: Filter by type (optional)
+    - before_created_at, before_id: Keyset cursor from pagination.next_cursor (optional, replaces offset)
     """
     try:
         notify_type = None
@@ -49,9 +56,19 @@ async def get_notifications(
             limit=limit,
             offset=offset,
             unread_only=unread_only,
-            notification_type=notify_type
+            notification_type=notify_type,
+            before_created_at=before_created_at,
+            before_id=before_id
         )
         
+        next_cursor = None
+        if notifications and len(notifications) == limit:
+            last = notifications[-1]
+            next_cursor = {
+                "before_created_at": last.created_at.isoformat(),
+                "before_id": last.id
+            }
+        
         return {
             "status": "success",
             "data": [
@@ -74,7 +91,8 @@ async def get_notifications(
             "pagination": {
                 "limit": limit,
                 "offset": offset,
-                "total": len(notifications)
+                "total": len(notifications),
+                "next_cursor": next_cursor
             }
         }
     
@@ -87,7 +105,7 @@ async def get_notifications(
 
 
 @router.get("/unread-count")
-async def get_unread_count(
+def get_unread_count(
     phone_number: str,
     db: Session = Depends(db_dependency)
 ):
@@ -111,7 +129,7 @@ async def get_unread_count(
 
 
 @router.get("/stats")
-async def get_notification_stats(
+def get_notification_stats(
     phone_number: str,
     db: Session = Depends(db_dependency)
 ):
@@ -132,7 +150,7 @@ async def get_notification_stats(
 
 
 @router.post("/{notification_id}/mark-as-read")
-async def mark_as_read(
+def mark_as_read(
     notification_id: int,
     db: Session = Depends(db_dependency)
 ):
@@ -160,18 +178,20 @@ async def mark_as_read(
 
 
 @router.post("/mark-all-as-read")
-async def mark_all_as_read(
+def mark_all_as_read(
     phone_number: str,
     db: Session = Depends(db_dependency)
 ):
     """Mark all notifications as read for a user."""
     try:
-        success = NotificationService.mark_all_as_read(phone_number, db)
+        marked = NotificationService.mark_all_as_read(phone_number, db)
         
-        if success:
+        if marked is not None:
             return {
                 "status": "success",
-                "message": "All notifications marked as read"
+                "message": "All notifications marked as read",
+                "marked_count": marked,
+                "unread_count": 0
             }
         else:
             return {
@@ -188,7 +208,7 @@ async def mark_all_as_read(
 
 
 @router.delete("/{notification_id}")
-async def delete_notification(
+def delete_notification(
     notification_id: int,
     db: Session = Depends(db_dependency)
 ):
@@ -216,7 +236,7 @@ async def delete_notification(
 
 
 @router.post("/clear")
-async def clear_notifications(
+def clear_notifications(
     phone_number: str,
     db: Session = Depends(db_dependency)
 ):
@@ -246,7 +266,7 @@ async def clear_notifications(
 # Preferences endpoints
 
 @router.get("/preferences")
-async def get_preferences(
+def get_preferences(
     phone_number: str,
     db: Session = Depends(db_dependency)
 ):
@@ -288,7 +308,7 @@ async def get_preferences(
 
 
 @router.post("/preferences")
-async def update_preferences(
+def update_preferences(
     phone_number: str,
     request_body: dict = Body(...),
     db: Session = Depends(db_dependency)
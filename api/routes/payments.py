@@ -1,6 +1,7 @@
 """
 Payment endpoints - initiation and verification.
 """
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from schemas.payment import PaymentInitiationRequest, PaymentVerificationRequest, PaystackWebhookRequest
@@ -160,7 +161,7 @@ async def verify_payment(
 
         # Verify with Paystack
         try:
-            verification_result = PaystackService.verify_payment(request.reference)
+            verification_result = await PaystackService.verify_payment_async(request.reference)
         except ValueError as e:
             logger.error(f"Paystack verification failed: {str(e)}")
             return StandardResponse(
@@ -245,7 +246,7 @@ async def paystack_webhook(request: Request, db: Session = Depends(db_dependency
         signature = request.headers.get("X-Paystack-Signature", "")
 
         # Verify signature
-        if not PaystackService.verify_webhook_signature(body.decode(), signature):
+        if not PaystackService.verify_webhook_signature(body, signature):
             logger.warning(f"Invalid Paystack webhook signature")
             return StandardResponse(
                 status="error",
@@ -253,8 +254,8 @@ async def paystack_webhook(request: Request, db: Session = Depends(db_dependency
                 error_code="INVALID_SIGNATURE",
             )
 
-        # Parse payload
-        payload = await request.json()
+        # Parse payload from the body already read for the signature check
+        payload = orjson.loads(body)
 
         try:
             webhook_data = PaystackService.process_webhook_payload(payload)
@@ -10,11 +10,39 @@ import logging
 import sys
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 # Base class for all ORM models (define first, before any conditional imports)
 Base = declarative_base()
 
+# Pool for the sync engine used by SessionLocal (services, flusher threads, health checks).
+# These open many short transactions, so connections are kept warm instead of re-handshaking
+# each time; pre_ping drops connections MySQL closed while idle.
+SYNC_POOL_OPTIONS = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_timeout": 30,
+    "pool_pre_ping": True,
+    "pool_recycle": 1800,
+}
+
+
+def _orjson_dumps(value) -> str:
+    """Serialize a JSON column value with orjson (str keys are coerced like the stdlib encoder)."""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# JSON columns (notification data, etc.) go through orjson's C encoder/decoder when it is
+# installed; otherwise SQLAlchemy falls back to the stdlib json module.
+JSON_ENGINE_OPTIONS = (
+    {"json_serializer": _orjson_dumps, "json_deserializer": orjson.loads} if orjson else {}
+)
+
 # ASYNC-FIRST MODE: Force async unless explicitly disabled
 # Railway should use asyncmy driver
 FORCE_ASYNC = os.getenv("FORCE_ASYNC", "true").lower() == "true"
@@ -75,6 +103,7 @@ if ASYNC_MODE:
             async_db_url,
             poolclass=NullPool,
             echo=settings.debug,
+            **JSON_ENGINE_OPTIONS,
             connect_args={
                 "charset": "utf8mb4",
                 "autocommit": True,
@@ -183,8 +212,9 @@ if ASYNC_MODE:
     
     sync_engine = create_engine(
         settings.database_url,
-        poolclass=NullPool,
         echo=settings.debug,
+        **SYNC_POOL_OPTIONS,
+        **JSON_ENGINE_OPTIONS,
         connect_args={
             "charset": "utf8mb4",
             "use_unicode": True,
@@ -220,8 +250,9 @@ else:
         logger.info(f"Creating SYNC database engine (fallback mode)")
         engine = create_engine(
             settings.database_url,
-            poolclass=NullPool,
             echo=settings.debug,
+            **SYNC_POOL_OPTIONS,
+            **JSON_ENGINE_OPTIONS,
             connect_args={
                 "charset": "utf8mb4",
                 "use_unicode": True,
@@ -4,7 +4,7 @@
 import sys
 import logging
 from config.database import Base, engine
-from models.notification import Notification, NotificationPreference
+from models.notification import Notification, NotificationPreference, NotificationCounter
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,6 +20,7 @@ def create_tables():
         logger.info("✓ Notification tables created successfully!")
         logger.info("  - notifications")
         logger.info("  - notification_preferences")
+        logger.info("  - notification_counters")
         return True
         
     except Exception as e:
@@ -97,6 +97,25 @@ async def lifespan(app: FastAPI):
     yield
     # Shutdown
     logger.info("Shutting down WhatsApp Chatbot API")
+    
+    # Write notifications still queued or debounced - the flusher is a daemon thread and
+    # would otherwise die with them
+    try:
+        import asyncio
+        from services.notification_trigger import NotificationTrigger
+        flushed = await asyncio.to_thread(NotificationTrigger.flush_pending, True)
+        logger.info(f"Flushed {flushed} queued notifications on shutdown")
+    except Exception as e:
+        logger.warning(f"Could not flush queued notifications: {e}")
+    
+    # Same for buffered lead message-count updates
+    try:
+        import asyncio
+        from services.lead_service import LeadService
+        flushed = await asyncio.to_thread(LeadService.flush_pending_updates)
+        logger.info(f"Flushed {flushed} buffered lead updates on shutdown")
+    except Exception as e:
+        logger.warning(f"Could not flush lead updates: {e}")
 
 
 # Create FastAPI app
@@ -0,0 +1,56 @@
+"""
+Migration script to add notification de-duplication to an existing database.
+
+Adds notifications.dedup_key and the uq_notif_dedup unique key, and drops
+idx_notif_phone_type, whose columns uq_notif_dedup now leads with.
+Safe to run more than once.
+"""
+import logging
+from sqlalchemy import inspect, text
+from config.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+def add_notification_dedup_key():
+    """Bring the notifications table in line with models/notification.py."""
+    db = SessionLocal()
+    try:
+        inspector = inspect(db.get_bind())
+        columns = {column["name"] for column in inspector.get_columns("notifications")}
+        indexes = {index["name"] for index in inspector.get_indexes("notifications")}
+
+        if "dedup_key" not in columns:
+            db.execute(text("ALTER TABLE notifications ADD COLUMN dedup_key VARCHAR(100) NULL"))
+            logger.info("✓ Added notifications.dedup_key")
+
+        if "uq_notif_dedup" not in indexes:
+            db.execute(text(
+                "CREATE UNIQUE INDEX uq_notif_dedup "
+                "ON notifications (phone_number, notification_type, dedup_key)"
+            ))
+            logger.info("✓ Created uq_notif_dedup")
+
+        if "idx_notif_phone_type" in indexes:
+            db.execute(text("DROP INDEX idx_notif_phone_type ON notifications"))
+            logger.info("✓ Dropped idx_notif_phone_type")
+
+        db.commit()
+        logger.info("✅ notifications table migrated")
+        return True
+
+    except Exception as e:
+        logger.error(f"❌ Error migrating notifications table: {str(e)}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print("Adding dedup_key to notifications...")
+    if add_notification_dedup_key():
+        print("✅ Migration complete!")
+    else:
+        print("❌ Migration failed!")
@@ -73,6 +73,8 @@ class Homework(Base):
 
     # Indexes for faster queries
     __table_args__ = (
+        # Serves get_student_homeworks (student_id = ? ORDER BY created_at DESC LIMIT n):
+        # InnoDB reads this index backwards, so no separate DESC index or filesort is needed
         Index("idx_student_id_created", "student_id", "created_at"),
         Index("idx_payment_type", "payment_type"),
         Index("idx_status", "status"),
@@ -1,6 +1,6 @@
 """Notification model for tracking alerts and messages."""
 
-from sqlalchemy import Column, String, Text, DateTime, Boolean, Integer, Enum as SQLEnum
+from sqlalchemy import DDL, event, Column, String, Text, DateTime, Boolean, Integer, Index, JSON, Enum as SQLEnum
 from sqlalchemy.sql import func
 from datetime import datetime
 from enum import Enum
@@ -60,7 +60,8 @@ class Notification(Base):
     # Content
     title = Column(String(255), nullable=False)
     message = Column(Text, nullable=False)
-    data = Column(Text, nullable=True)  # JSON data (action references, etc.)
+    # JSON data (action references, etc.) - native JSON column; serialized by SQLAlchemy
+    data = Column(JSON(none_as_null=True), nullable=True)
     
     # Status tracking
     is_read = Column(Boolean, default=False, index=True)
@@ -71,15 +72,47 @@ class Notification(Base):
     related_entity_type = Column(String(50), nullable=True)  # homework, chat_support, etc.
     related_entity_id = Column(String(100), nullable=True)
     
+    # Set for one-off events (e.g. a given homework reviewed) so redelivered triggers can't
+    # store the same notification twice; NULL for notifications that may legitimately repeat.
+    # Existing databases: run migrations/add_notification_dedup_key.py
+    dedup_key = Column(String(100), nullable=True)
+    
     # Timestamps
     created_at = Column(DateTime, server_default=func.now(), nullable=False, index=True)
     read_at = Column(DateTime, nullable=True)
     sent_at = Column(DateTime, nullable=True)
     
+    # Indexes for the per-recipient queries in NotificationService
+    __table_args__ = (
+        # Serves list/unread-count/mark-all-read (phone_number = ? [AND is_read = ?] ORDER BY created_at DESC):
+        # InnoDB reads this index backwards, so no separate DESC index or filesort is needed
+        Index("idx_notif_phone_read_created", "phone_number", "is_read", "created_at"),
+        # Rejects duplicate one-off notifications (NULL dedup_keys never collide); its
+        # (phone_number, notification_type) prefix also serves get_notification_stats
+        Index("uq_notif_dedup", "phone_number", "notification_type", "dedup_key", unique=True),
+    )
+    
     def __repr__(self):
         return f"<Notification {self.id}: {self.notification_type} to {self.phone_number}>"
 
 
+# On MySQL, hash-partition notifications by recipient so each user's rows and index entries
+# live in one of 16 smaller partitions and per-user queries prune to a single partition.
+# MySQL requires the partitioning column in every unique key, so the primary key widens to
+# (id, phone_number); id is still AUTO_INCREMENT (and indexed), and the ORM keeps treating it
+# as the identity. Existing deployments can run the same statement once to convert in place.
+NOTIFICATIONS_PARTITION_DDL = (
+    "ALTER TABLE notifications "
+    "DROP PRIMARY KEY, ADD PRIMARY KEY (id, phone_number) "
+    "PARTITION BY KEY (phone_number) PARTITIONS 16"
+)
+event.listen(
+    Notification.__table__,
+    "after_create",
+    DDL(NOTIFICATIONS_PARTITION_DDL).execute_if(dialect="mysql"),
+)
+
+
 class NotificationPreference(Base):
     """Store user notification preferences."""
     
@@ -114,3 +147,16 @@ class NotificationPreference(Base):
     
     def __repr__(self):
         return f"<NotificationPreference {self.phone_number}>"
+
+
+class NotificationCounter(Base):
+    """Per-recipient unread notification count, kept in step with the notifications table."""
+    
+    __tablename__ = "notification_counters"
+    
+    phone_number = Column(String(20), primary_key=True)
+    unread_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<NotificationCounter {self.phone_number}: {self.unread_count}>"
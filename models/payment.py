@@ -62,6 +62,8 @@ class Payment(Base):
     # Indexes for faster queries
     __table_args__ = (
         Index("idx_student_reference", "student_id", "payment_reference"),
+        # has_pending_payment / has_successful_payment: student_id = ? AND status = ?
+        Index("idx_student_status", "student_id", "status"),
         Index("idx_status_created", "status", "created_at"),
         Index("idx_webhook_processed", "webhook_processed"),
     )
@@ -4,19 +4,45 @@ Conversation State Management Service.
 Tracks user conversation state across multiple message exchanges.
 Manages registration, homework submission, and payment flows.
 """
+import functools
 import json
 import logging
+import os
+import re
+import threading
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, NamedTuple, Tuple
 from enum import Enum
 import time
 
 logger = logging.getLogger(__name__)
 
-# Global bot name cache (will be populated from database)
-_bot_name_cache = {'value': 'EduBot', 'timestamp': None}
+# Settings caches below hold a (timestamp, value) tuple that writers replace in one
+# rebind under _settings_cache_lock, so readers never see a half-updated entry and
+# need no lock themselves.
+_settings_cache_lock = threading.RLock()
+
+# Global bot name cache (will be populated from database); timestamp None = never loaded
+_bot_name_cache: Tuple[Optional[float], str] = (None, 'EduBot')
 _BOT_NAME_CACHE_TTL = 3600  # 1 hour
 
+# Whole-table snapshot of BotMessageTemplate rows: (timestamp, {name: content}), or None
+_template_cache: Optional[Tuple[float, Dict[str, str]]] = None
+_TEMPLATE_CACHE_TTL = 300  # 5 minutes
+
+# Fallback feature list shown below the greeting when no template is configured
+_FEATURES_MENU_BODY = (
+    "AVAILABLE FEATURES:\n\n"
+    "[Home] **Home** - Return to home menu\n"
+    "[?] **FAQ** - Get answers to common questions\n"
+    "[Book] **Homework** - Submit your homework\n"
+    "[Chat] **Support** - Chat with our team\n"
+    "[Card] **Subscribe** - View subscription plans\n"
+    "[Info] **Status** - Check your account details\n"
+    "[Help] **Help** - Get help with the bot\n\n"
+    "Just type a command above to get started!"
+)
+
 # Import NotificationTrigger for chat notifications
 try:
     from services.notification_trigger import NotificationTrigger
@@ -47,10 +73,160 @@ class ConversationState(str, Enum):
     IDLE = "idle"  # Idle state waiting for input
 
 
+class Reply(NamedTuple):
+    """Router response - unpacks like the (text, next_state) tuple callers expect."""
+
+    text: str
+    state: Optional[ConversationState]
+
+
+# Static FAQ answers keyed by category (faq_register -> register, ...)
+_FAQ_TABLE = {
+    "register": Reply(
+        "📝 Registration FAQs\n\n"
+        "Q: How do I create an account?\n"
+        "A: Tap 'Register' and follow the prompts. You'll need your name, email, and class/grade.\n\n"
+        "Q: Is registration free?\n"
+        "A: Yes! Creating an account is completely free.\n\n"
+        "Q: Can I change my details later?\n"
+        "A: Contact our support team for account changes.",
+        ConversationState.IDLE,
+    ),
+    "homework": Reply(
+        "📚 Homework FAQs\n\n"
+        "Q: Can I submit homework as text or image?\n"
+        "A: Yes! Choose text for typed answers or image for handwritten/picture submissions.\n\n"
+        "Q: How long does it take to get solutions?\n"
+        "A: A tutor will review and respond within 24 hours.\n\n"
+        "Q: Is there a limit to submissions?\n"
+        "A: Free users can submit with payment per homework. Subscribers have unlimited submissions.",
+        ConversationState.IDLE,
+    ),
+    "payment": Reply(
+        "💳 Payment FAQs\n\n"
+        "Q: What payment methods do you accept?\n"
+        "A: We accept Paystack payments (card, bank transfer, USSD).\n\n"
+        "Q: Is my payment information secure?\n"
+        "A: Yes! We use Paystack's secure payment gateway.\n\n"
+        "Q: Can I get a refund?\n"
+        "A: Refund requests are handled on a case-by-case basis.",
+        ConversationState.IDLE,
+    ),
+    "subscription": Reply(
+        "⭐ Subscription FAQs\n\n"
+        "Q: How much is the monthly subscription?\n"
+        "A: ₦5,000/month for unlimited homework submissions.\n\n"
+        "Q: Can I cancel my subscription?\n"
+        "A: Yes, you can cancel anytime without penalty.\n\n"
+        "Q: Do I get tutor support with subscription?\n"
+        "A: Yes! Subscribers get priority support from tutors.",
+        ConversationState.IDLE,
+    ),
+}
+
+# Constant replies shared across calls
+_REG_REQUIRED_HOMEWORK = Reply(
+    "❌ Registration Required\n\n"
+    "You need to create an account first to submit homework. "
+    "Choose 'Register' to get started.",
+    ConversationState.IDLE,
+)
+_REG_REQUIRED_PAY = Reply(
+    "❌ Registration Required\n\n"
+    "You need to create an account first to subscribe. "
+    "Choose 'Register' to get started.",
+    ConversationState.IDLE,
+)
+_REG_REQUIRED_CHECK = Reply(
+    "❌ Registration Required\n\n"
+    "You need to create an account first to check status. "
+    "Choose 'Register' to get started.",
+    ConversationState.IDLE,
+)
+_CONFIRM_REQUIRED = Reply(
+    "⚠️ Confirm Required\n\n"
+    "Tap 'Confirm Payment' to proceed, or 'Cancel' to go back.",
+    ConversationState.PAYMENT_PENDING,
+)
+
+# Profile summaries shown after registering/updating - filled with str.format
+_ALREADY_REGISTERED_TMPL = (
+    "✅ You are already registered!\n\n"
+    "📋 **Your Information:**\n\n"
+    "👤 Name: {name}\n"
+    "📧 Email: {email}\n"
+    "🎓 Class: {class_grade}\n\n"
+    "What would you like to do?"
+)
+_PROFILE_UPDATED_TMPL = (
+    "✅ Profile Updated!\n\n"
+    "📋 **Your Updated Information:**\n\n"
+    "👤 Name: {name}\n"
+    "📧 Email: {email}\n"
+    "🎓 Class: {class_grade}\n\n"
+    "What would you like to do next, {first_name}?"
+)
+
+
+@functools.lru_cache(maxsize=8)
+def _render_menu_template(content: str, bot_name: str, has_name: bool) -> str:
+    """
+    Pre-render the features menu template.
+    Leaves {full_name} in place when the caller will substitute a first name.
+    Keyed on the template content, so edited templates get a fresh entry.
+    """
+    if not has_name:
+        content = content.replace("{full_name}", "there")
+    return content.replace("{bot_name}", bot_name)
+
+
+@functools.lru_cache(maxsize=8)
+def _render_menu_body(content: str, bot_name: str) -> str:
+    """
+    Pre-render the features menu template without its greeting paragraph.
+    Keyed on the template content, so edited templates get a fresh entry.
+    """
+    body = content.split("\n\n", 1)[-1]
+    return body.replace("{full_name}", "there").replace("{bot_name}", bot_name)
+
+
+def _faq_key(intent: str) -> str:
+    """Map an FAQ intent (e.g. 'faq_register') to its _FAQ_TABLE key."""
+    return intent[4:] if intent.startswith("faq_") else intent
+
+
+def _keyword_pattern(keywords: List[str]) -> "re.Pattern":
+    """Compile a keyword list into one alternation that matches any of them as a substring."""
+    return re.compile("|".join(re.escape(kw) for kw in keywords))
+
+
 # In-memory storage for conversation state
 # In production, this should be stored in database
 _conversation_states: Dict[str, Dict[str, Any]] = {}
 
+# Shared session-data store. When REDIS_URL is set, per-user conversation data
+# (set_data/get_data) lives in a Redis hash "sess:{phone}" so every worker sees
+# the same registration/homework context; otherwise the in-process dict is used.
+_SESSION_KEY_PREFIX = "sess:"
+_session_redis = {'client': None, 'checked': False}
+
+
+def _get_session_redis():
+    """Return the Redis client for session data, or None to use in-process storage."""
+    if not _session_redis['checked']:
+        _session_redis['checked'] = True
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            try:
+                import redis
+                client = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+                client.ping()
+                _session_redis['client'] = client
+                logger.info("✅ Conversation session data stored in Redis")
+            except Exception as e:
+                logger.warning(f"Redis unavailable for session data, using in-process store: {str(e)}")
+    return _session_redis['client']
+
 
 class ConversationService:
     """Service for managing user conversation state."""
@@ -63,11 +239,13 @@ class ConversationService:
         Get the bot name from database cache or default.
         Caches for 1 hour to avoid repeated DB queries.
         """
+        global _bot_name_cache
         now = time.time()
+        timestamp, bot_name = _bot_name_cache
         
         # Return cached value if still valid
-        if _bot_name_cache['timestamp'] and (now - _bot_name_cache['timestamp']) < _BOT_NAME_CACHE_TTL:
-            return _bot_name_cache['value']
+        if timestamp and (now - timestamp) < _BOT_NAME_CACHE_TTL:
+            return bot_name
         
         # Try to fetch from database
         if db:
@@ -77,61 +255,122 @@ class ConversationService:
                     AdminSetting.key == 'bot_name'
                 ).first()
                 if setting and setting.value:
-                    _bot_name_cache['value'] = setting.value
-                    _bot_name_cache['timestamp'] = now
+                    with _settings_cache_lock:
+                        _bot_name_cache = (now, setting.value)
                     logger.info(f"Bot name updated to: {setting.value}")
                     return setting.value
             except Exception as e:
                 logger.warning(f"Failed to fetch bot name from DB: {e}")
         
         # Return cached value or default
-        return _bot_name_cache['value']
+        return bot_name
     
     @staticmethod
     def set_bot_name_cache(bot_name: str):
         """Update the cached bot name."""
-        _bot_name_cache['value'] = bot_name
-        _bot_name_cache['timestamp'] = time.time()
+        global _bot_name_cache
+        with _settings_cache_lock:
+            _bot_name_cache = (time.time(), bot_name)
         logger.info(f"Bot name cache updated to: {bot_name}")
 
     @staticmethod
-    def get_available_features_menu(db=None, first_name: str = "") -> str:
+    def _load_templates(db=None) -> Dict[str, str]:
         """
-        Get the available features menu message from database template.
-        Falls back to hardcoded version if template not found.
-        Substitutes variables like {full_name} and {bot_name}.
+        Get every template as {template_name: content}, loaded with one query.
+        Caches for 5 minutes (or until clear_template_cache) so a turn that needs
+        several templates never goes back to the DB for each one.
         """
-        # Try to fetch from database
+        global _template_cache
+        now = time.time()
+        entry = _template_cache
+        cached = entry[1] if entry is not None else None
+        if entry is not None and (now - entry[0]) < _TEMPLATE_CACHE_TTL:
+            return cached
+
         if db:
             try:
                 from models.bot_message import BotMessageTemplate
-                template = db.query(BotMessageTemplate).filter(
-                    BotMessageTemplate.template_name == "available_features"
-                ).first()
-                if template and template.template_content:
-                    content = template.template_content
-                    # Replace variables in template
-                    content = content.replace("{full_name}", first_name if first_name else "there")
-                    content = content.replace("{bot_name}", ConversationService.get_bot_name(db))
-                    return content
+                rows = db.query(
+                    BotMessageTemplate.template_name, BotMessageTemplate.template_content
+                ).all()
+                templates = {name: content for name, content in rows if content}
+                with _settings_cache_lock:
+                    _template_cache = (now, templates)
+                return templates
             except Exception as e:
-                logger.warning(f"Failed to fetch template from DB: {e}")
-        
+                logger.warning(f"Failed to fetch templates from DB: {e}")
+
+        return cached or {}
+
+    @staticmethod
+    def get_template_content(template_name: str, db=None) -> Optional[str]:
+        """
+        Get raw template content from the template cache or database.
+        """
+        return ConversationService._load_templates(db).get(template_name)
+
+    @staticmethod
+    def get_templates(
+        template_names: List[str], db=None, variables: Dict[str, str] = None
+    ) -> Dict[str, str]:
+        """
+        Fetch several templates at once, substituting variables in each.
+
+        Args:
+            template_names: Names of the templates to fetch
+            db: Database session
+            variables: Dict of variables to substitute (e.g., {full_name: "Victor"})
+
+        Returns:
+            Dict of template name -> content ("" if not found)
+        """
+        templates = ConversationService._load_templates(db)
+        result = {}
+        for name in template_names:
+            content = templates.get(name, "")
+            if content and variables:
+                for key, value in variables.items():
+                    content = content.replace(f"{{{key}}}", str(value))
+            result[name] = content
+        return result
+
+    @staticmethod
+    def clear_template_cache():
+        """Drop cached templates so edits made by admins show up immediately."""
+        global _template_cache
+        with _settings_cache_lock:
+            _template_cache = None
+        _render_menu_body.cache_clear()
+        logger.info("Template cache cleared")
+
+    @staticmethod
+    def get_available_features_menu(db=None, first_name: str = "") -> str:
+        """
+        Get the available features menu message from database template.
+        Falls back to hardcoded version if template not found.
+        Substitutes variables like {full_name} and {bot_name}.
+        """
+        content = ConversationService.get_template_content("available_features", db)
+        if content:
+            # Replace variables in template
+            menu = _render_menu_template(content, ConversationService.get_bot_name(db), bool(first_name))
+            return menu.replace("{full_name}", first_name) if first_name else menu
+
         # Fallback to hardcoded version
         greeting = f"Hey {first_name}!" if first_name else "Hey there!"
-        feature_text = (
-            f"{greeting}\n\n"
-            f"AVAILABLE FEATURES:\n\n"
-            f"[Home] **Home** - Return to home menu\n"
-            f"[?] **FAQ** - Get answers to common questions\n"
-            f"[Book] **Homework** - Submit your homework\n"
-            f"[Chat] **Support** - Chat with our team\n"
-            f"[Card] **Subscribe** - View subscription plans\n"
-            f"[Info] **Status** - Check your account details\n"
-            f"[Help] **Help** - Get help with the bot\n\n"
-            f"Just type a command above to get started!"
-        )
-        return feature_text
+        return f"{greeting}\n\n{ConversationService.get_features_menu_body(db)}"
+
+    @staticmethod
+    def get_features_menu_body(db=None) -> str:
+        """
+        Get the features menu without its greeting line.
+        Used when the caller supplies its own greeting (e.g. after cancel).
+        """
+        content = ConversationService.get_template_content("available_features", db)
+        if content:
+            return _render_menu_body(content, ConversationService.get_bot_name(db))
+
+        return _FEATURES_MENU_BODY
 
     @staticmethod
     def get_faq_menu(db=None) -> str:
@@ -139,17 +378,9 @@ class ConversationService:
         Get the FAQ menu message from database template.
         Falls back to hardcoded version if template not found.
         """
-        # Try to fetch from database
-        if db:
-            try:
-                from models.bot_message import BotMessageTemplate
-                template = db.query(BotMessageTemplate).filter(
-                    BotMessageTemplate.template_name == "faq_main"
-                ).first()
-                if template and template.template_content:
-                    return template.template_content
-            except Exception as e:
-                logger.warning(f"Failed to fetch FAQ template from DB: {e}")
+        content = ConversationService.get_template_content("faq_main", db)
+        if content:
+            return content
         
         # Fallback to hardcoded version
         faq_text = (
@@ -175,24 +406,7 @@ class ConversationService:
         Returns:
             Template content with variables substituted
         """
-        if db:
-            try:
-                from models.bot_message import BotMessageTemplate
-                template = db.query(BotMessageTemplate).filter(
-                    BotMessageTemplate.template_name == template_name
-                ).first()
-                if template and template.template_content:
-                    content = template.template_content
-                    # Substitute variables if provided
-                    if variables:
-                        for key, value in variables.items():
-                            content = content.replace(f"{{{key}}}", str(value))
-                    return content
-            except Exception as e:
-                logger.warning(f"Failed to fetch template '{template_name}' from DB: {e}")
-        
-        # Return empty string if not found
-        return ""
+        return ConversationService.get_templates([template_name], db, variables)[template_name]
 
     @staticmethod
     def get_state(phone_number: str) -> Dict[str, Any]:
@@ -253,6 +467,17 @@ class ConversationService:
         state["data"][key] = value
         state["last_updated"] = datetime.now()
 
+        client = _get_session_redis()
+        if client is not None:
+            try:
+                session_key = f"{_SESSION_KEY_PREFIX}{phone_number}"
+                pipe = client.pipeline(transaction=False)
+                pipe.hset(session_key, key, json.dumps(value, default=str))
+                pipe.expire(session_key, ConversationService.TIMEOUT_MINUTES * 60)
+                pipe.execute()
+            except Exception as e:
+                logger.warning(f"Could not store session data in Redis: {str(e)}")
+
     @staticmethod
     def get_data(phone_number: str, key: str, default: Any = None) -> Any:
         """
@@ -266,8 +491,34 @@ class ConversationService:
         Returns:
             Data value or default
         """
-        state = ConversationService.get_state(phone_number)
-        return state.get("data", {}).get(key, default)
+        return ConversationService.get_data_many(phone_number, [key], default)[key]
+
+    @staticmethod
+    def get_data_many(phone_number: str, keys: List[str], default: Any = None) -> Dict[str, Any]:
+        """
+        Get several values from conversation context in one round trip.
+
+        Args:
+            phone_number: User's phone number
+            keys: Data keys to fetch
+            default: Default value for keys that don't exist
+
+        Returns:
+            Dict of key -> value (or default)
+        """
+        client = _get_session_redis()
+        if client is not None:
+            try:
+                values = client.hmget(f"{_SESSION_KEY_PREFIX}{phone_number}", keys)
+                return {
+                    key: json.loads(raw) if raw is not None else default
+                    for key, raw in zip(keys, values)
+                }
+            except Exception as e:
+                logger.warning(f"Could not read session data from Redis: {str(e)}")
+
+        data = ConversationService.get_state(phone_number).get("data", {})
+        return {key: data.get(key, default) for key in keys}
 
     @staticmethod
     def clear_state(phone_number: str):
@@ -281,6 +532,13 @@ class ConversationService:
             del _conversation_states[phone_number]
             logger.info(f"Cleared conversation state for {phone_number}")
 
+        client = _get_session_redis()
+        if client is not None:
+            try:
+                client.delete(f"{_SESSION_KEY_PREFIX}{phone_number}")
+            except Exception as e:
+                logger.warning(f"Could not clear session data in Redis: {str(e)}")
+
     @staticmethod
     def get_registration_data(phone_number: str) -> Dict[str, Any]:
         """
@@ -292,12 +550,9 @@ class ConversationService:
         Returns:
             Registration data dict
         """
-        return {
-            "phone_number": phone_number,
-            "full_name": ConversationService.get_data(phone_number, "full_name"),
-            "email": ConversationService.get_data(phone_number, "email"),
-            "class_grade": ConversationService.get_data(phone_number, "class_grade"),
-        }
+        data = ConversationService.get_data_many(phone_number, ["full_name", "email", "class_grade"])
+        data["phone_number"] = phone_number
+        return data
 
     @staticmethod
     def get_homework_data(phone_number: str) -> Dict[str, Any]:
@@ -310,13 +565,14 @@ class ConversationService:
         Returns:
             Homework data dict
         """
+        data = ConversationService.get_data_many(
+            phone_number, ["homework_subject", "homework_type", "homework_content", "file_path"]
+        )
         return {
-            "subject": ConversationService.get_data(phone_number, "homework_subject"),
-            "submission_type": ConversationService.get_data(
-                phone_number, "homework_type"
-            ),
-            "content": ConversationService.get_data(phone_number, "homework_content"),
-            "file_path": ConversationService.get_data(phone_number, "file_path"),
+            "subject": data["homework_subject"],
+            "submission_type": data["homework_type"],
+            "content": data["homework_content"],
+            "file_path": data["file_path"],
         }
 
     @staticmethod
@@ -328,9 +584,16 @@ class ConversationService:
             phone_number: User's phone number
         """
         state = ConversationService.get_state(phone_number)
-        for key in ["homework_subject", "homework_type", "homework_content", "file_path"]:
+        homework_keys = ["homework_subject", "homework_type", "homework_content", "file_path"]
+        for key in homework_keys:
             if key in state.get("data", {}):
                 del state["data"][key]
+        client = _get_session_redis()
+        if client is not None:
+            try:
+                client.hdel(f"{_SESSION_KEY_PREFIX}{phone_number}", *homework_keys)
+            except Exception as e:
+                logger.warning(f"Could not reset homework data in Redis: {str(e)}")
         ConversationService.set_state(phone_number, ConversationState.IDLE)
         logger.debug(f"Reset homework state for {phone_number}")
 
@@ -353,6 +616,25 @@ class MessageRouter:
     KEYWORD_CANCEL = ["cancel", "stop", "reset", "clear", "menu"]
     KEYWORD_UPDATE = ["update", "edit", "change", "modify", "profile"]
 
+    # (intent, compiled keywords) in priority order - the first group with any match wins.
+    # main_menu goes first so "menu" isn't caught by help, and end_chat before support
+    # so "chat" isn't caught by support.
+    INTENT_PATTERNS = [
+        ("main_menu", _keyword_pattern(KEYWORD_MAIN_MENU)),
+        ("end_chat", _keyword_pattern(KEYWORD_END_CHAT)),
+        ("register", _keyword_pattern(KEYWORD_REGISTER)),
+        ("update", _keyword_pattern(KEYWORD_UPDATE)),
+        ("homework", _keyword_pattern(KEYWORD_HOMEWORK)),
+        ("pay", _keyword_pattern(KEYWORD_PAY)),
+        ("check", _keyword_pattern(KEYWORD_CHECK)),
+        ("image", _keyword_pattern(KEYWORD_IMAGE)),
+        ("text", _keyword_pattern(KEYWORD_TEXT)),
+        ("faq", _keyword_pattern(KEYWORD_FAQ)),
+        ("support", _keyword_pattern(KEYWORD_SUPPORT)),
+        ("help", _keyword_pattern(KEYWORD_HELP)),
+        ("cancel", _keyword_pattern(KEYWORD_CANCEL)),
+    ]
+
     @staticmethod
     def get_buttons(intent: str, current_state: ConversationState, is_registered: bool = False, phone_number: str = None) -> Optional[List[Dict[str, str]]]:
         """
@@ -404,9 +686,11 @@ class MessageRouter:
         return None
 
     @staticmethod
+    @functools.lru_cache(maxsize=512)
     def extract_intent(message_text: str) -> str:
         """
         Extract user intent from message text.
+        Memoized - most traffic is a small set of button ids and commands.
 
         Args:
             message_text: User's message text
@@ -416,44 +700,16 @@ class MessageRouter:
         """
         text_lower = message_text.lower().strip()
 
-        # Check for main_menu FIRST (highest priority) to prevent "menu" keyword from matching help
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_MAIN_MENU):
-            return "main_menu"
-        
-        # Check for end_chat BEFORE support (to prevent "chat" from being caught by support)
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_END_CHAT):
-            return "end_chat"
-        
-        # Check for other keywords
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_REGISTER):
-            return "register"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_UPDATE):
-            return "update"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_HOMEWORK):
-            return "homework"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_PAY):
-            return "pay"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_CHECK):
-            return "check"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_IMAGE):
-            return "image"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_TEXT):
-            return "text"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_FAQ):
-            return "faq"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_SUPPORT):
-            return "support"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_HELP):
-            return "help"
-        if any(kw in text_lower for kw in MessageRouter.KEYWORD_CANCEL):
-            return "cancel"
+        for intent, pattern in MessageRouter.INTENT_PATTERNS:
+            if pattern.search(text_lower):
+                return intent
 
         return "unknown"
 
     @staticmethod
     def get_next_response(
         phone_number: str, message_text: str, student_data: Optional[Dict] = None, db: Any = None
-    ) -> tuple[str, Optional[ConversationState]]:
+    ) -> Reply:
         """
         Get the next response based on conversation state and message.
 
@@ -464,666 +720,733 @@ class MessageRouter:
             db: Optional database session for notification triggers
 
         Returns:
-            Tuple of (response_message, next_state)
+            Reply of (response_message, next_state)
         """
         state = ConversationService.get_state(phone_number)
         current_state = state.get("state")
         intent = MessageRouter.extract_intent(message_text)
-        
+
+        # FAQ answers don't depend on the student - answer them before anything else
+        # (active chat still captures every message except end_chat)
+        if current_state != ConversationState.CHAT_SUPPORT_ACTIVE:
+            if intent.startswith("faq_"):
+                hit = _FAQ_TABLE.get(_faq_key(intent))
+                if hit:
+                    return hit
+            elif intent == "faq":
+                return Reply(ConversationService.get_faq_menu(db), ConversationState.IDLE)
+
+        student = StudentView.from_dict(student_data)
+
         # Extract first name for personalization
-        first_name = None
-        if student_data and student_data.get("name"):
-            first_name = student_data.get("name").split()[0]
+        first_name = student.name.split()[0] if student.name else None
+
+        turn = _Turn(phone_number, message_text, student, first_name, intent, current_state, db)
 
         # PRIORITY: If user is in active chat support, handle their message in chat context
         # (except for end_chat intent which is handled below)
         if current_state == ConversationState.CHAT_SUPPORT_ACTIVE and intent != "end_chat":
-            # User sent a message during active chat - store it and notify admin
-            # Mark chat session as active with timestamp
-            ConversationService.set_data(phone_number, "chat_support_active", True)
-            ConversationService.set_data(phone_number, "chat_last_message_time", datetime.now().isoformat())
-            
-            # Store the message content for admin review via conversations page
-            chat_messages = ConversationService.get_data(phone_number, "chat_messages") or []
-            if isinstance(chat_messages, str):
-                chat_messages = []
-            chat_messages.append({
-                "text": message_text,
-                "timestamp": datetime.now().isoformat(),
-                "sender": "user"
-            })
-            ConversationService.set_data(phone_number, "chat_messages", chat_messages)
-            
-            # Trigger admin notification for user message
-            if NotificationTrigger and db:
-                try:
-                    user_name = student_data.get("name") if student_data else "Unknown User"
-                    message_preview = message_text[:100]
-                    NotificationTrigger.on_chat_user_message_admin(
-                        phone_number=phone_number,
-                        user_name=user_name,
-                        message_preview=message_preview,
-                        admin_phone="admin",
-                        db=db
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send admin message notification: {str(e)}")
-            
-            # Acknowledge message to user
-            ack_message = (
-                "✓ Your message has been sent to support.\n\n"
-                "An admin will respond shortly. You can continue typing or select 'End Chat' to exit."
-            )
-            return (ack_message, ConversationState.CHAT_SUPPORT_ACTIVE)
+            return _on_chat_message(turn)
+
+        # Global commands (end chat, cancel, help, support) win over any state
+        handler = _INTENT_HANDLERS.get(intent)
+        if handler:
+            return handler(turn)
+
+        # States that consume the message themselves (registration, profile update)
+        handler = _INPUT_STATE_HANDLERS.get(current_state)
+        if handler:
+            return handler(turn)
+
+        # Main menu - show welcome and main options (CHECK BEFORE REGISTERED STATE)
+        if intent == "main_menu":
+            return _on_main_menu(turn)
+
+        # Registered, homework and payment flows
+        return _FLOW_STATE_HANDLERS.get(current_state, _on_unhandled)(turn)
+
+
+# ---------------------------------------------------------------------------
+# Message handlers used by MessageRouter.get_next_response
+# ---------------------------------------------------------------------------
+
+class StudentView(NamedTuple):
+    """Read-only view of the student_data dict, unpacked once per message."""
+
+    exists: bool
+    name: Optional[str]
+    email: Optional[str]
+    class_grade: Optional[str]
+    has_subscription: bool
+
+    @classmethod
+    def from_dict(cls, student_data: Optional[Dict]) -> "StudentView":
+        if not student_data:
+            return _NO_STUDENT
+        return cls(
+            True,
+            student_data.get("name"),
+            student_data.get("email"),
+            student_data.get("class_grade"),
+            bool(student_data.get("has_subscription")),
+        )
+
 
-        # Handle end chat command
-        if intent == "end_chat":
+_NO_STUDENT = StudentView(False, None, None, None, False)
+
+
+class _Turn(NamedTuple):
+    """Everything a handler needs to answer one inbound message."""
+
+    phone_number: str
+    message_text: str
+    student: StudentView
+    first_name: Optional[str]
+    intent: str
+    current_state: Optional[ConversationState]
+    db: Any
+
+
+def _on_chat_message(turn: _Turn) -> Reply:
+    """Store a message sent during live chat and notify the admin."""
+    phone_number, message_text, student, db = turn.phone_number, turn.message_text, turn.student, turn.db
+    # User sent a message during active chat - store it and notify admin
+    # Mark chat session as active with timestamp
+    ConversationService.set_data(phone_number, "chat_support_active", True)
+    ConversationService.set_data(phone_number, "chat_last_message_time", datetime.now().isoformat())
+
+    # Store the message content for admin review via conversations page
+    chat_messages = ConversationService.get_data(phone_number, "chat_messages") or []
+    if isinstance(chat_messages, str):
+        chat_messages = []
+    chat_messages.append({
+        "text": message_text,
+        "timestamp": datetime.now().isoformat(),
+        "sender": "user"
+    })
+    ConversationService.set_data(phone_number, "chat_messages", chat_messages)
+
+    # Trigger admin notification for user message
+    if NotificationTrigger and db:
+        try:
+            user_name = student.name if student.exists else "Unknown User"
+            message_preview = message_text[:100]
+            NotificationTrigger.on_chat_user_message_admin(
+                phone_number=phone_number,
+                user_name=user_name,
+                message_preview=message_preview,
+                admin_phone="admin",
+                db=db
+            )
+        except Exception as e:
+            logger.warning(f"Could not send admin message notification: {str(e)}")
+
+    # Acknowledge message to user
+    ack_message = (
+        "✓ Your message has been sent to support.\n\n"
+        "An admin will respond shortly. You can continue typing or select 'End Chat' to exit."
+    )
+    return Reply(ack_message, ConversationState.CHAT_SUPPORT_ACTIVE)
+
+
+def _on_end_chat(turn: _Turn) -> Reply:
+    """Close the support session and return to the menu."""
+    phone_number, student, db = turn.phone_number, turn.student, turn.db
+    try:
+        # Close the support ticket if one is open
+        ticket_id = ConversationService.get_data(phone_number, "support_ticket_id")
+        if ticket_id:
+            from services.support_service import SupportService
+            from config.database import SessionLocal
+            db_temp = SessionLocal()
             try:
-                # Close the support ticket if one is open
-                ticket_id = ConversationService.get_data(phone_number, "support_ticket_id")
-                if ticket_id:
-                    from services.support_service import SupportService
-                    from config.database import SessionLocal
-                    db_temp = SessionLocal()
-                    try:
-                        SupportService.update_ticket_status(db_temp, ticket_id, "CLOSED")
-                    finally:
-                        db_temp.close()
-                
-                # Calculate chat duration
-                duration_minutes = None
-                chat_start_time = ConversationService.get_data(phone_number, "chat_start_time")
-                if chat_start_time:
-                    try:
-                        start_dt = datetime.fromisoformat(chat_start_time)
-                        duration = datetime.now() - start_dt
-                        duration_minutes = int(duration.total_seconds() / 60)
-                    except:
-                        pass
-                
-                # Trigger notification that user ended chat
-                if NotificationTrigger and db:
-                    try:
-                        user_name = student_data.get("name") if student_data else "User"
-                        NotificationTrigger.on_chat_support_ended_admin(
-                            phone_number=phone_number,
-                            user_name=user_name,
-                            admin_phone="admin",
-                            duration_minutes=duration_minutes,
-                            db=db
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not send chat ended notification: {str(e)}")
-                
-                # Clear support data
-                ConversationService.set_data(phone_number, "requesting_support", False)
-                ConversationService.set_data(phone_number, "support_ticket_id", None)
-                # Clear chat support flags
-                ConversationService.set_data(phone_number, "in_chat_support", False)
-                ConversationService.set_data(phone_number, "chat_support_active", False)
-                ConversationService.set_data(phone_number, "chat_start_time", None)
-            except Exception as e:
-                logger.warning(f"Could not close support ticket: {str(e)}")
-            
-            # Return to appropriate state based on registration
-            if student_data and student_data.get("name"):
-                # Registered user - return to main menu
-                first_name = student_data.get("name", "").split()[0] if student_data.get("name") else ""
-                feature_text = ConversationService.get_available_features_menu(db, first_name)
-                return (
-                    feature_text,
-                    ConversationState.IDLE,
-                )
-            else:
-                # Unregistered user - return to idle menu, not back to initial registration
-                try:
-                    from models.admin_settings import AdminSettings
-                    from config.database import SessionLocal
-                    db = SessionLocal()
-                    try:
-                        settings = db.query(AdminSettings).first()
-                        bot_name = settings.bot_name if settings and settings.bot_name else "EduBot"
-                    finally:
-                        db.close()
-                except Exception as e:
-                    logger.warning(f"Could not fetch bot name: {str(e)}")
-                    bot_name = "EduBot"
-                
-                menu_text = (
-                    f"👋 Welcome back! I'm {bot_name}, your AI tutor assistant.\n\n"
-                    f"📚 **WHAT I CAN DO** 📚\n\n"
-                    f"✏️ **homework** - Get help with your assignments\n"
-                    f"❓ **faq** - Find answers to common questions\n"
-                    f"💬 **support** - Chat with our support team\n"
-                    f"💳 **subscribe** - Check subscription plans & pricing\n"
-                    f"📊 **status** - View your account info\n"
-                    f"ℹ️ **help** - Learn how to use me\n\n"
-                    f"Type any command above to get started or enter your name to register!"
-                )
-                return (
-                    menu_text,
-                    ConversationState.IDLE,
+                SupportService.update_ticket_status(db_temp, ticket_id, "CLOSED")
+            finally:
+                db_temp.close()
+
+        # Calculate chat duration
+        duration_minutes = None
+        chat_start_time = ConversationService.get_data(phone_number, "chat_start_time")
+        if chat_start_time:
+            try:
+                start_dt = datetime.fromisoformat(chat_start_time)
+                duration = datetime.now() - start_dt
+                duration_minutes = int(duration.total_seconds() / 60)
+            except:
+                pass
+
+        # Trigger notification that user ended chat
+        if NotificationTrigger and db:
+            try:
+                user_name = student.name if student.exists else "User"
+                NotificationTrigger.on_chat_support_ended_admin(
+                    phone_number=phone_number,
+                    user_name=user_name,
+                    admin_phone="admin",
+                    duration_minutes=duration_minutes,
+                    db=db
                 )
+            except Exception as e:
+                logger.warning(f"Could not send chat ended notification: {str(e)}")
+
+        # Clear support data
+        ConversationService.set_data(phone_number, "requesting_support", False)
+        ConversationService.set_data(phone_number, "support_ticket_id", None)
+        # Clear chat support flags
+        ConversationService.set_data(phone_number, "in_chat_support", False)
+        ConversationService.set_data(phone_number, "chat_support_active", False)
+        ConversationService.set_data(phone_number, "chat_start_time", None)
+    except Exception as e:
+        logger.warning(f"Could not close support ticket: {str(e)}")
+
+    # Return to appropriate state based on registration
+    if student.name:
+        # Registered user - return to main menu
+        first_name = student.name.split()[0]
+        feature_text = ConversationService.get_available_features_menu(db, first_name)
+        return Reply(
+            feature_text,
+            ConversationState.IDLE,
+        )
+    else:
+        # Unregistered user - return to idle menu, not back to initial registration
+        try:
+            from models.admin_settings import AdminSettings
+            from config.database import SessionLocal
+            db = SessionLocal()
+            try:
+                settings = db.query(AdminSettings).first()
+                bot_name = settings.bot_name if settings and settings.bot_name else "EduBot"
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning(f"Could not fetch bot name: {str(e)}")
+            bot_name = "EduBot"
+
+        menu_text = (
+            f"👋 Welcome back! I'm {bot_name}, your AI tutor assistant.\n\n"
+            f"📚 **WHAT I CAN DO** 📚\n\n"
+            f"✏️ **homework** - Get help with your assignments\n"
+            f"❓ **faq** - Find answers to common questions\n"
+            f"💬 **support** - Chat with our support team\n"
+            f"💳 **subscribe** - Check subscription plans & pricing\n"
+            f"📊 **status** - View your account info\n"
+            f"ℹ️ **help** - Learn how to use me\n\n"
+            f"Type any command above to get started or enter your name to register!"
+        )
+        return Reply(
+            menu_text,
+            ConversationState.IDLE,
+        )
 
-        # Handle cancel command - Clear current flow and return to menu
-        if intent == "cancel":
-            # Clear any in-progress homework data
-            if current_state in [ConversationState.HOMEWORK_SUBJECT, ConversationState.HOMEWORK_TYPE, ConversationState.HOMEWORK_CONTENT]:
-                # User cancelled homework submission - clear homework data
-                ConversationService.set_data(phone_number, "homework_subject", None)
-                ConversationService.set_data(phone_number, "homework_type", None)
-                ConversationService.set_data(phone_number, "homework_content", None)
-                
-                greeting = f"Homework submission cancelled, {first_name}." if first_name else "Homework submission cancelled."
-                # Use template if available, otherwise use greeting + fallback menu
-                menu_text = greeting + "\n\n" + ConversationService.get_available_features_menu(db).split("\n\n", 1)[1] if db else greeting + "\n\n" + ConversationService.get_available_features_menu(None).split("\n\n", 1)[1]
-                return (
-                    menu_text,
-                    ConversationState.IDLE,
-                )
-            else:
-                # Generic cancel - just show menu
-                menu_text = ConversationService.get_available_features_menu(db, first_name)
-                return (
-                    menu_text,
-                    ConversationState.IDLE,
-                )
 
-        # Handle help command - Show comprehensive feature list
-        if intent == "help":
-            help_text = ConversationService.get_template("help_main", db)
-            if not help_text:
-                # Fallback if template not found
-                help_text = (
-                    "[?] Help & Features\n\n"
-                    "[Book] HOMEWORK SUBMISSION\n"
-                    "• Submit text or images easily\n"
-                    "• Get detailed tutor feedback within 24 hours\n"
-                    "• Track all your submissions\n\n"
-                    "[Card] PAYMENT OPTIONS\n"
-                    "• FREE: Per-submission payment\n"
-                    "• PREMIUM: 5000/month unlimited\n"
-                    "• Priority support for subscribers\n\n"
-                    "[Chat] LIVE CHAT SUPPORT\n"
-                    "• Talk directly with support team\n\n"
-                    "Ready to get started? Type a command!"
-                )
-            return (help_text, ConversationState.IDLE)
-
-        # Handle chat support command
-        if intent == "support":
-            variables = {"first_name": first_name} if first_name else {}
-            support_text = ConversationService.get_template("support_welcome", db, variables)
-            if not support_text:
-                greeting = f"Hi {first_name}! 💬" if first_name else "💬"
-                support_text = (
-                    f"{greeting}\n\n"
-                    f"📞 Live Chat Support\n\n"
-                    f"You are now connected to our support team! 🎯\n\n"
-                    f"Please describe your issue and an admin will respond to you shortly.\n\n"
-                    f"You can continue chatting until you select 'End Chat' to return to the main menu."
-                )
-            # Store that user is now in active chat support
-            ConversationService.set_data(phone_number, "in_chat_support", True)
-            ConversationService.set_data(phone_number, "chat_support_active", True)
-            ConversationService.set_data(phone_number, "chat_start_time", datetime.now().isoformat())
-            
-            # Trigger admin notification
-            if NotificationTrigger and db:
-                try:
-                    user_name = student_data.get("name") if student_data else "Unknown User"
-                    NotificationTrigger.on_chat_support_initiated_admin(
-                        phone_number=phone_number,
-                        user_name=user_name,
-                        admin_phone="admin",
-                        db=db
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not send admin chat notification: {str(e)}")
-            
-            return (support_text, ConversationState.CHAT_SUPPORT_ACTIVE)
-
-        # Handle FAQ command
-        if intent == "faq":
-            faq_text = ConversationService.get_faq_menu(db)
-            return (faq_text, ConversationState.IDLE)
-
-        # Handle specific FAQ categories
-        if intent in ["faq_register", "faq_homework", "faq_payment", "faq_subscription"]:
-            if "register" in intent:
-                faq_text = (
-                    "📝 Registration FAQs\n\n"
-                    "Q: How do I create an account?\n"
-                    "A: Tap 'Register' and follow the prompts. You'll need your name, email, and class/grade.\n\n"
-                    "Q: Is registration free?\n"
-                    "A: Yes! Creating an account is completely free.\n\n"
-                    "Q: Can I change my details later?\n"
-                    "A: Contact our support team for account changes."
-                )
-            elif "homework" in intent:
-                faq_text = (
-                    "📚 Homework FAQs\n\n"
-                    "Q: Can I submit homework as text or image?\n"
-                    "A: Yes! Choose text for typed answers or image for handwritten/picture submissions.\n\n"
-                    "Q: How long does it take to get solutions?\n"
-                    "A: A tutor will review and respond within 24 hours.\n\n"
-                    "Q: Is there a limit to submissions?\n"
-                    "A: Free users can submit with payment per homework. Subscribers have unlimited submissions."
-                )
-            elif "payment" in intent:
-                faq_text = (
-                    "💳 Payment FAQs\n\n"
-                    "Q: What payment methods do you accept?\n"
-                    "A: We accept Paystack payments (card, bank transfer, USSD).\n\n"
-                    "Q: Is my payment information secure?\n"
-                    "A: Yes! We use Paystack's secure payment gateway.\n\n"
-                    "Q: Can I get a refund?\n"
-                    "A: Refund requests are handled on a case-by-case basis."
-                )
-            elif "subscription" in intent:
-                faq_text = (
-                    "⭐ Subscription FAQs\n\n"
-                    "Q: How much is the monthly subscription?\n"
-                    "A: ₦5,000/month for unlimited homework submissions.\n\n"
-                    "Q: Can I cancel my subscription?\n"
-                    "A: Yes, you can cancel anytime without penalty.\n\n"
-                    "Q: Do I get tutor support with subscription?\n"
-                    "A: Yes! Subscribers get priority support from tutors."
-                )
-            return (faq_text, ConversationState.IDLE)
-
-        # Initial state - user hasn't chosen action
-        if current_state == ConversationState.INITIAL or current_state == ConversationState.IDLE:
-            if intent == "register":
-                # Check if user is already registered
-                if student_data and student_data.get("name"):
-                    # User is already registered - show their info with update menu
-                    user_email = student_data.get("email", "Not provided")
-                    user_class = student_data.get("class_grade", "Not provided")
-                    return (
-                        f"✅ You are already registered!\n\n"
-                        f"📋 **Your Information:**\n\n"
-                        f"👤 Name: {student_data.get('name')}\n"
-                        f"📧 Email: {user_email}\n"
-                        f"🎓 Class: {user_class}\n\n"
-                        f"What would you like to do?",
-                        ConversationState.ALREADY_REGISTERED,
-                    )
-                # Not registered - proceed with registration
-                return (
-                    "👤 Let's create your account!\n\n"
-                    "What is your full name?",
-                    ConversationState.REGISTERING_NAME,
-                )
-            elif intent == "update":
-                # User wants to update their profile
-                if not student_data or not student_data.get("name"):
-                    return (
-                        "❌ No Account Found\n\n"
-                        "You don't have an account yet. Type 'Register' to create one.",
-                        ConversationState.IDLE,
-                    )
-                # Start update profile process - begin with name
-                current_name = student_data.get("name", "Not provided")
-                return (
-                    f"✏️ Update Your Profile\n\n"
-                    f"Current Name: {current_name}\n\n"
-                    f"Enter your new full name (or press skip to keep current name):",
-                    ConversationState.UPDATING_NAME,
-                )
-            elif intent == "homework":
-                if not student_data:
-                    return (
-                        "❌ Registration Required\n\n"
-                        "You need to create an account first to submit homework. "
-                        "Choose 'Register' to get started.",
-                        ConversationState.IDLE,
-                    )
-                greeting = f"Hey {first_name}! 📝" if first_name else "📝"
-                return (
-                    f"{greeting}\n\nWhat subject is your homework for?\n\n"
-                    "(e.g., Mathematics, English, Science)",
-                    ConversationState.HOMEWORK_SUBJECT,
-                )
-            elif intent == "pay":
-                if not student_data:
-                    return (
-                        "❌ Registration Required\n\n"
-                        "You need to create an account first to subscribe. "
-                        "Choose 'Register' to get started.",
-                        ConversationState.IDLE,
-                    )
-                greeting = f"Hi {first_name}! 💳" if first_name else "💳"
-                return (
-                    f"{greeting}\n\n💰 Monthly Subscription\n"
-                    f"Price: ₦5,000/month\n"
-                    f"Unlimited homework submissions\n\n"
-                    f"Tap 'Confirm Payment' to proceed.",
-                    ConversationState.PAYMENT_PENDING,
-                )
-            elif intent == "check":
-                if not student_data:
-                    return (
-                        "❌ Registration Required\n\n"
-                        "You need to create an account first to check status. "
-                        "Choose 'Register' to get started.",
-                        ConversationState.IDLE,
-                    )
-                variables = {
-                    "full_name": student_data.get("name", "User"),
-                    "email": student_data.get("email", "Not provided"),
-                    "has_subscription": "Yes" if student_data.get("has_subscription") else "No"
-                }
-                status_template = "status_subscribed" if student_data.get("has_subscription") else "status_not_subscribed"
-                status_text = ConversationService.get_template(status_template, db, variables)
-                if not status_text:
-                    status = "✅ ACTIVE" if student_data.get("has_subscription") else "❌ INACTIVE"
-                    greeting = f"{first_name}, y" if first_name else "Y"
-                    status_text = (
-                        f"📊 Subscription Status\n\n"
-                        f"User: {greeting}our subscription\n"
-                        f"Status: {status}"
-                    )
-                return (status_text, ConversationState.IDLE)
-            elif intent == "main_menu":
-                # If user clicks main menu from IDLE/INITIAL, return to main options
-                menu_text = ConversationService.get_available_features_menu(db, first_name)
-                return (
-                    menu_text,
-                    ConversationState.REGISTERED if student_data else ConversationState.IDLE,
-                )
-            else:
-                greeting = f"👋 Hey {first_name}!" if first_name else "👋 Hi!"
-                if first_name:
-                    # Registered user - show feature list
-                    menu_text = ConversationService.get_available_features_menu(db, first_name)
-                    return (
-                        menu_text,
-                        ConversationState.IDLE,
-                    )
-                else:
-                    # Unregistered user
-                    return (
-                        f"{greeting}\n\nWelcome to Study Bot! Get started below.",
-                        ConversationState.IDLE,
-                    )
-
-        # Already registered state - user tried to register but has account
-        elif current_state == ConversationState.ALREADY_REGISTERED:
-            if intent == "update":
-                # User chose to update profile
-                current_name = student_data.get("name", "Not provided")
-                return (
-                    f"✏️ Update Your Profile\n\n"
-                    f"Current Name: {current_name}\n\n"
-                    f"Enter your new full name (or type 'skip' to keep current name):",
-                    ConversationState.UPDATING_NAME,
-                )
-            elif intent == "home" or intent == "main_menu":
-                # User chose to return to main menu
-                menu_text = ConversationService.get_available_features_menu(db, first_name)
-                return (
-                    menu_text,
-                    ConversationState.IDLE,
-                )
-            else:
-                # User sent unexpected input - show options again
-                user_email = student_data.get("email", "Not provided") if student_data else "Not provided"
-                user_class = student_data.get("class_grade", "Not provided") if student_data else "Not provided"
-                return (
-                    f"✅ You are already registered!\n\n"
-                    f"📋 **Your Information:**\n\n"
-                    f"👤 Name: {student_data.get('name') if student_data else 'N/A'}\n"
-                    f"📧 Email: {user_email}\n"
-                    f"🎓 Class: {user_class}\n\n"
-                    f"What would you like to do?",
-                    ConversationState.ALREADY_REGISTERED,
-                )
+def _on_cancel(turn: _Turn) -> Reply:
+    """Abandon the current flow and return to the menu."""
+    phone_number, first_name, current_state, db = turn.phone_number, turn.first_name, turn.current_state, turn.db
+    # Clear any in-progress homework data
+    if current_state in [ConversationState.HOMEWORK_SUBJECT, ConversationState.HOMEWORK_TYPE, ConversationState.HOMEWORK_CONTENT]:
+        # User cancelled homework submission - clear homework data
+        ConversationService.set_data(phone_number, "homework_subject", None)
+        ConversationService.set_data(phone_number, "homework_type", None)
+        ConversationService.set_data(phone_number, "homework_content", None)
+
+        greeting = f"Homework submission cancelled, {first_name}." if first_name else "Homework submission cancelled."
+        # Use template if available, otherwise use greeting + fallback menu
+        menu_text = f"{greeting}\n\n{ConversationService.get_features_menu_body(db)}"
+        return Reply(
+            menu_text,
+            ConversationState.IDLE,
+        )
+    else:
+        # Generic cancel - just show menu
+        menu_text = ConversationService.get_available_features_menu(db, first_name)
+        return Reply(
+            menu_text,
+            ConversationState.IDLE,
+        )
 
-        # Registration flow
-        elif current_state == ConversationState.REGISTERING_NAME:
-            ConversationService.set_data(phone_number, "full_name", message_text)
-            return (
-                "📧 Great!\n\nWhat is your email address?",
-                ConversationState.REGISTERING_EMAIL,
-            )
 
-        elif current_state == ConversationState.REGISTERING_EMAIL:
-            ConversationService.set_data(phone_number, "email", message_text)
-            return (
-                "🎓 Perfect!\n\nWhat is your class/grade?\n\n(e.g., 10A, SS2, Form 4)",
-                ConversationState.REGISTERING_CLASS,
-            )
+def _on_help(turn: _Turn) -> Reply:
+    """Show the help text."""
+    db = turn.db
+    help_text = ConversationService.get_template("help_main", db)
+    if not help_text:
+        # Fallback if template not found
+        help_text = (
+            "[?] Help & Features\n\n"
+            "[Book] HOMEWORK SUBMISSION\n"
+            "• Submit text or images easily\n"
+            "• Get detailed tutor feedback within 24 hours\n"
+            "• Track all your submissions\n\n"
+            "[Card] PAYMENT OPTIONS\n"
+            "• FREE: Per-submission payment\n"
+            "• PREMIUM: 5000/month unlimited\n"
+            "• Priority support for subscribers\n\n"
+            "[Chat] LIVE CHAT SUPPORT\n"
+            "• Talk directly with support team\n\n"
+            "Ready to get started? Type a command!"
+        )
+    return Reply(help_text, ConversationState.IDLE)
 
-        elif current_state == ConversationState.REGISTERING_CLASS:
-            ConversationService.set_data(phone_number, "class_grade", message_text)
-            full_name = ConversationService.get_data(phone_number, "full_name")
-            first_name_reg = full_name.split()[0] if full_name else "there"
-            
-            # Show main menu after registration completion
-            menu_text = f"✅ Account Created!\n\n{ConversationService.get_available_features_menu(db, first_name_reg)}"
-            return (
-                menu_text,
-                ConversationState.REGISTERED,
-            )
 
-        # Profile update flow
-        elif current_state == ConversationState.UPDATING_NAME:
-            # Allow user to skip with "skip" command
-            if "skip" in message_text.lower():
-                # Keep existing name
-                existing_name = student_data.get("name") if student_data else ""
-                ConversationService.set_data(phone_number, "full_name", existing_name)
-            else:
-                ConversationService.set_data(phone_number, "full_name", message_text)
-            
-            current_email = student_data.get("email", "Not provided") if student_data else "Not provided"
-            return (
-                f"✅ Name updated!\n\n"
-                f"Current Email: {current_email}\n\n"
-                f"📧 Enter your new email address (or type 'skip' to keep current):",
-                ConversationState.UPDATING_EMAIL,
+def _on_support(turn: _Turn) -> Reply:
+    """Open a live chat support session."""
+    phone_number, student, first_name, db = turn.phone_number, turn.student, turn.first_name, turn.db
+    variables = {"first_name": first_name} if first_name else {}
+    support_text = ConversationService.get_template("support_welcome", db, variables)
+    if not support_text:
+        greeting = f"Hi {first_name}! 💬" if first_name else "💬"
+        support_text = (
+            f"{greeting}\n\n"
+            f"📞 Live Chat Support\n\n"
+            f"You are now connected to our support team! 🎯\n\n"
+            f"Please describe your issue and an admin will respond to you shortly.\n\n"
+            f"You can continue chatting until you select 'End Chat' to return to the main menu."
+        )
+    # Store that user is now in active chat support
+    ConversationService.set_data(phone_number, "in_chat_support", True)
+    ConversationService.set_data(phone_number, "chat_support_active", True)
+    ConversationService.set_data(phone_number, "chat_start_time", datetime.now().isoformat())
+
+    # Trigger admin notification
+    if NotificationTrigger and db:
+        try:
+            user_name = student.name if student.exists else "Unknown User"
+            NotificationTrigger.on_chat_support_initiated_admin(
+                phone_number=phone_number,
+                user_name=user_name,
+                admin_phone="admin",
+                db=db
             )
-
-        elif current_state == ConversationState.UPDATING_EMAIL:
-            # Allow user to skip
-            if "skip" in message_text.lower():
-                # Keep existing email
-                existing_email = student_data.get("email") if student_data else ""
-                ConversationService.set_data(phone_number, "email", existing_email)
-            else:
-                ConversationService.set_data(phone_number, "email", message_text)
-            
-            current_class = student_data.get("class_grade", "Not provided") if student_data else "Not provided"
-            return (
-                f"✅ Email updated!\n\n"
-                f"Current Class: {current_class}\n\n"
-                f"🎓 Enter your new class/grade (or type 'skip' to keep current):",
-                ConversationState.UPDATING_CLASS,
+        except Exception as e:
+            logger.warning(f"Could not send admin chat notification: {str(e)}")
+
+    return Reply(support_text, ConversationState.CHAT_SUPPORT_ACTIVE)
+
+
+def _on_idle(turn: _Turn) -> Reply:
+    """Route a command from the INITIAL/IDLE menu."""
+    student, first_name, intent, db = turn.student, turn.first_name, turn.intent, turn.db
+    if intent == "register":
+        # Check if user is already registered
+        if student.name:
+            # User is already registered - show their info with update menu
+            return Reply(
+                _ALREADY_REGISTERED_TMPL.format(
+                    name=student.name,
+                    email=student.email or "Not provided",
+                    class_grade=student.class_grade or "Not provided",
+                ),
+                ConversationState.ALREADY_REGISTERED,
             )
-
-        elif current_state == ConversationState.UPDATING_CLASS:
-            # Allow user to skip
-            if "skip" in message_text.lower():
-                # Keep existing class
-                existing_class = student_data.get("class_grade") if student_data else ""
-                ConversationService.set_data(phone_number, "class_grade", existing_class)
-            else:
-                ConversationService.set_data(phone_number, "class_grade", message_text)
-            
-            updated_name = ConversationService.get_data(phone_number, "full_name")
-            updated_email = ConversationService.get_data(phone_number, "email")
-            updated_class = ConversationService.get_data(phone_number, "class_grade")
-            first_name_updated = updated_name.split()[0] if updated_name else "there"
-            
-            return (
-                f"✅ Profile Updated!\n\n"
-                f"📋 **Your Updated Information:**\n\n"
-                f"👤 Name: {updated_name}\n"
-                f"📧 Email: {updated_email}\n"
-                f"🎓 Class: {updated_class}\n\n"
-                f"What would you like to do next, {first_name_updated}?",
+        # Not registered - proceed with registration
+        return Reply(
+            "👤 Let's create your account!\n\n"
+            "What is your full name?",
+            ConversationState.REGISTERING_NAME,
+        )
+    elif intent == "update":
+        # User wants to update their profile
+        if not student.name:
+            return Reply(
+                "❌ No Account Found\n\n"
+                "You don't have an account yet. Type 'Register' to create one.",
                 ConversationState.IDLE,
             )
-
-        # Chat support active - handle user messages during chat
-
-        # Main menu - show welcome and main options (CHECK BEFORE REGISTERED STATE)
-        elif intent == "main_menu":
+        # Start update profile process - begin with name
+        current_name = student.name or "Not provided"
+        return Reply(
+            f"✏️ Update Your Profile\n\n"
+            f"Current Name: {current_name}\n\n"
+            f"Enter your new full name (or press skip to keep current name):",
+            ConversationState.UPDATING_NAME,
+        )
+    elif intent == "homework":
+        if not student.exists:
+            return _REG_REQUIRED_HOMEWORK
+        greeting = f"Hey {first_name}! 📝" if first_name else "📝"
+        return Reply(
+            f"{greeting}\n\nWhat subject is your homework for?\n\n"
+            "(e.g., Mathematics, English, Science)",
+            ConversationState.HOMEWORK_SUBJECT,
+        )
+    elif intent == "pay":
+        if not student.exists:
+            return _REG_REQUIRED_PAY
+        greeting = f"Hi {first_name}! 💳" if first_name else "💳"
+        return Reply(
+            f"{greeting}\n\n💰 Monthly Subscription\n"
+            f"Price: ₦5,000/month\n"
+            f"Unlimited homework submissions\n\n"
+            f"Tap 'Confirm Payment' to proceed.",
+            ConversationState.PAYMENT_PENDING,
+        )
+    elif intent == "check":
+        if not student.exists:
+            return _REG_REQUIRED_CHECK
+        # Decide everything that depends on the subscription flag in one place
+        if student.has_subscription:
+            subscribed, status_template, status = "Yes", "status_subscribed", "✅ ACTIVE"
+        else:
+            subscribed, status_template, status = "No", "status_not_subscribed", "❌ INACTIVE"
+        variables = {
+            "full_name": student.name or "User",
+            "email": student.email or "Not provided",
+            "has_subscription": subscribed
+        }
+        status_text = ConversationService.get_template(status_template, db, variables)
+        if not status_text:
+            greeting = f"{first_name}, y" if first_name else "Y"
+            status_text = (
+                f"📊 Subscription Status\n\n"
+                f"User: {greeting}our subscription\n"
+                f"Status: {status}"
+            )
+        return Reply(status_text, ConversationState.IDLE)
+    elif intent == "main_menu":
+        # If user clicks main menu from IDLE/INITIAL, return to main options
+        menu_text = ConversationService.get_available_features_menu(db, first_name)
+        return Reply(
+            menu_text,
+            ConversationState.REGISTERED if student.exists else ConversationState.IDLE,
+        )
+    else:
+        if first_name:
+            # Registered user - show feature list
             menu_text = ConversationService.get_available_features_menu(db, first_name)
-            return (
+            return Reply(
                 menu_text,
-                ConversationState.REGISTERED,
+                ConversationState.IDLE,
+            )
+        else:
+            # Unregistered user
+            return Reply(
+                "👋 Hi!\n\nWelcome to Study Bot! Get started below.",
+                ConversationState.IDLE,
             )
 
-        # Registered user - handle intents
-        elif current_state == ConversationState.REGISTERED:
-            if intent == "homework":
-                variables = {"first_name": first_name}
-                homework_subject_text = ConversationService.get_template("homework_subject", db, variables)
-                if not homework_subject_text:
-                    greeting = f"Hey {first_name}! 📝" if first_name else "📝"
-                    homework_subject_text = (
-                        f"{greeting}\n\nWhat subject is your homework for?\n\n"
-                        "(e.g., Mathematics, English, Science)"
-                    )
-                return (homework_subject_text, ConversationState.HOMEWORK_SUBJECT)
-            elif intent == "pay":
-                variables = {"first_name": first_name}
-                payment_text = ConversationService.get_template("payment_info", db, variables)
-                if not payment_text:
-                    greeting = f"Hi {first_name}! 💳" if first_name else "💳"
-                    payment_text = (
-                        f"{greeting}\n\n💰 Monthly Subscription\n"
-                        f"Price: ₦5,000/month\n"
-                        f"Unlimited homework submissions\n\n"
-                        f"Tap 'Confirm Payment' to proceed."
-                    )
-                return (payment_text, ConversationState.PAYMENT_PENDING)
-            elif intent == "help":
-                help_text = ConversationService.get_template("help_main", db)
-                if not help_text:
-                    help_text = (
-                        f"📚 Help & Features\n\n"
-                        f"🎓 EduBot helps you with:"
-                        f"\n📝 Homework - Submit assignments and get tutor feedback"
-                        f"\n💳 Subscribe - Unlock unlimited homework submissions (₦5,000/month)"
-                        f"\n❓ FAQs - Quick answers to common questions"
-                        f"\n💬 Chat Support - Talk to our support team"
-                    )
-                return (help_text, ConversationState.REGISTERED)
-            else:
-                # Default response for other intents while registered
-                greeting = f"Hey {first_name}! 👋" if first_name else "👋"
-                return (
-                    f"{greeting}\n\nWhat would you like to do?",
-                    ConversationState.REGISTERED,
-                )
 
-        # Homework flow
-        elif current_state == ConversationState.HOMEWORK_SUBJECT:
-            ConversationService.set_data(phone_number, "homework_subject", message_text)
-            variables = {"subject": message_text}
-            homework_type_text = ConversationService.get_template("homework_type", db, variables)
-            if not homework_type_text:
-                homework_type_text = f"📚 Subject: {message_text}\n\nHow would you like to submit your homework?"
-            return (homework_type_text, ConversationState.HOMEWORK_TYPE)
-
-        elif current_state == ConversationState.HOMEWORK_TYPE:
-            submission_type = "IMAGE" if "image" in message_text.lower() else "TEXT"
-            ConversationService.set_data(phone_number, "homework_type", submission_type)
-            
-            # For IMAGE, skip intermediate message and go directly to upload link
-            if submission_type == "IMAGE":
-                name_ref = f"{first_name}, " if first_name else ""
-                return (
-                    f"📷 {name_ref}preparing your upload page...",
-                    ConversationState.HOMEWORK_SUBMITTED,
-                )
-            
-            # For TEXT, ask for content
-            else:
-                name_ref = f"{first_name}, " if first_name else ""
-                return (
-                    f"📄 Text Submission\n\n"
-                    f"{name_ref}Go ahead and send your homework now.",
-                    ConversationState.HOMEWORK_CONTENT,
-                )
+def _on_already_registered(turn: _Turn) -> Reply:
+    """Handle the choice offered to an already registered user."""
+    student, first_name, intent, db = turn.student, turn.first_name, turn.intent, turn.db
+    if intent == "update":
+        # User chose to update profile
+        current_name = student.name or "Not provided"
+        return Reply(
+            f"✏️ Update Your Profile\n\n"
+            f"Current Name: {current_name}\n\n"
+            f"Enter your new full name (or type 'skip' to keep current name):",
+            ConversationState.UPDATING_NAME,
+        )
+    elif intent == "home" or intent == "main_menu":
+        # User chose to return to main menu
+        menu_text = ConversationService.get_available_features_menu(db, first_name)
+        return Reply(
+            menu_text,
+            ConversationState.IDLE,
+        )
+    else:
+        # User sent unexpected input - show options again
+        return Reply(
+            _ALREADY_REGISTERED_TMPL.format(
+                name=student.name if student.exists else "N/A",
+                email=student.email or "Not provided",
+                class_grade=student.class_grade or "Not provided",
+            ),
+            ConversationState.ALREADY_REGISTERED,
+        )
 
-        elif current_state == ConversationState.HOMEWORK_CONTENT:
-            # Store the content (only TEXT submissions reach here)
-            ConversationService.set_data(phone_number, "homework_content", message_text)
-            name_ref = f"Thanks, {first_name}! " if first_name else ""
-            return (
-                f"{name_ref}📤 Processing your submission...\n\n"
-                f"Your homework has been received and is being reviewed by a tutor.",
-                ConversationState.HOMEWORK_SUBMITTED,
-            )
 
-        elif current_state == ConversationState.HOMEWORK_SUBMITTED:
-            # Homework is now submitted - user can proceed
-            # Show completion message and return to main menu
-            name_ref = f"{first_name}, " if first_name else ""
-            homework_subject = ConversationService.get_data(phone_number, "homework_subject")
-            homework_type = ConversationService.get_data(phone_number, "homework_type")
-            
-            # Show confirmation based on submission type
-            if homework_type == "IMAGE":
-                confirmation = "Your image has been uploaded and submitted successfully! ✅"
-            else:
-                confirmation = "Your homework has been submitted successfully! ✅"
-            
-            return (
-                f"{confirmation}\n\n"
-                f"Subject: {homework_subject}\n"
-                f"Type: {homework_type}\n\n"
-                f"A tutor will review your work shortly.\n\n"
-                f"What would you like to do next, {name_ref}?",
-                ConversationState.IDLE,
+def _on_registering_name(turn: _Turn) -> Reply:
+    phone_number, message_text = turn.phone_number, turn.message_text
+    ConversationService.set_data(phone_number, "full_name", message_text)
+    return Reply(
+        "📧 Great!\n\nWhat is your email address?",
+        ConversationState.REGISTERING_EMAIL,
+    )
+
+
+def _on_registering_email(turn: _Turn) -> Reply:
+    phone_number, message_text = turn.phone_number, turn.message_text
+    ConversationService.set_data(phone_number, "email", message_text)
+    return Reply(
+        "🎓 Perfect!\n\nWhat is your class/grade?\n\n(e.g., 10A, SS2, Form 4)",
+        ConversationState.REGISTERING_CLASS,
+    )
+
+
+def _on_registering_class(turn: _Turn) -> Reply:
+    phone_number, message_text, db = turn.phone_number, turn.message_text, turn.db
+    ConversationService.set_data(phone_number, "class_grade", message_text)
+    full_name = ConversationService.get_data(phone_number, "full_name")
+    first_name_reg = full_name.split()[0] if full_name else "there"
+
+    # Show main menu after registration completion
+    menu_text = f"✅ Account Created!\n\n{ConversationService.get_available_features_menu(db, first_name_reg)}"
+    return Reply(
+        menu_text,
+        ConversationState.REGISTERED,
+    )
+
+
+def _on_updating_name(turn: _Turn) -> Reply:
+    phone_number, message_text, student = turn.phone_number, turn.message_text, turn.student
+    # Allow user to skip with "skip" command
+    if "skip" in message_text.lower():
+        # Keep existing name
+        existing_name = student.name if student.exists else ""
+        ConversationService.set_data(phone_number, "full_name", existing_name)
+    else:
+        ConversationService.set_data(phone_number, "full_name", message_text)
+
+    current_email = student.email or "Not provided"
+    return Reply(
+        f"✅ Name updated!\n\n"
+        f"Current Email: {current_email}\n\n"
+        f"📧 Enter your new email address (or type 'skip' to keep current):",
+        ConversationState.UPDATING_EMAIL,
+    )
+
+
+def _on_updating_email(turn: _Turn) -> Reply:
+    phone_number, message_text, student = turn.phone_number, turn.message_text, turn.student
+    # Allow user to skip
+    if "skip" in message_text.lower():
+        # Keep existing email
+        existing_email = student.email if student.exists else ""
+        ConversationService.set_data(phone_number, "email", existing_email)
+    else:
+        ConversationService.set_data(phone_number, "email", message_text)
+
+    current_class = student.class_grade or "Not provided"
+    return Reply(
+        f"✅ Email updated!\n\n"
+        f"Current Class: {current_class}\n\n"
+        f"🎓 Enter your new class/grade (or type 'skip' to keep current):",
+        ConversationState.UPDATING_CLASS,
+    )
+
+
+def _on_updating_class(turn: _Turn) -> Reply:
+    phone_number, message_text, student = turn.phone_number, turn.message_text, turn.student
+    # Allow user to skip
+    if "skip" in message_text.lower():
+        # Keep existing class
+        existing_class = student.class_grade if student.exists else ""
+        ConversationService.set_data(phone_number, "class_grade", existing_class)
+    else:
+        ConversationService.set_data(phone_number, "class_grade", message_text)
+
+    updated = ConversationService.get_data_many(phone_number, ["full_name", "email", "class_grade"])
+    updated_name = updated["full_name"]
+    first_name_updated = updated_name.split()[0] if updated_name else "there"
+
+    return Reply(
+        _PROFILE_UPDATED_TMPL.format(
+            name=updated_name,
+            email=updated["email"],
+            class_grade=updated["class_grade"],
+            first_name=first_name_updated,
+        ),
+        ConversationState.IDLE,
+    )
+
+
+def _on_main_menu(turn: _Turn) -> Reply:
+    """Show the features menu."""
+    first_name, db = turn.first_name, turn.db
+    menu_text = ConversationService.get_available_features_menu(db, first_name)
+    return Reply(
+        menu_text,
+        ConversationState.REGISTERED,
+    )
+
+
+def _on_registered(turn: _Turn) -> Reply:
+    """Route a command from a registered user."""
+    first_name, intent, db = turn.first_name, turn.intent, turn.db
+    if intent == "homework":
+        variables = {"first_name": first_name}
+        homework_subject_text = ConversationService.get_template("homework_subject", db, variables)
+        if not homework_subject_text:
+            greeting = f"Hey {first_name}! 📝" if first_name else "📝"
+            homework_subject_text = (
+                f"{greeting}\n\nWhat subject is your homework for?\n\n"
+                "(e.g., Mathematics, English, Science)"
+            )
+        return Reply(homework_subject_text, ConversationState.HOMEWORK_SUBJECT)
+    elif intent == "pay":
+        variables = {"first_name": first_name}
+        payment_text = ConversationService.get_template("payment_info", db, variables)
+        if not payment_text:
+            greeting = f"Hi {first_name}! 💳" if first_name else "💳"
+            payment_text = (
+                f"{greeting}\n\n💰 Monthly Subscription\n"
+                f"Price: ₦5,000/month\n"
+                f"Unlimited homework submissions\n\n"
+                f"Tap 'Confirm Payment' to proceed."
+            )
+        return Reply(payment_text, ConversationState.PAYMENT_PENDING)
+    elif intent == "help":
+        help_text = ConversationService.get_template("help_main", db)
+        if not help_text:
+            help_text = (
+                f"📚 Help & Features\n\n"
+                f"🎓 EduBot helps you with:"
+                f"\n📝 Homework - Submit assignments and get tutor feedback"
+                f"\n💳 Subscribe - Unlock unlimited homework submissions (₦5,000/month)"
+                f"\n❓ FAQs - Quick answers to common questions"
+                f"\n💬 Chat Support - Talk to our support team"
             )
+        return Reply(help_text, ConversationState.REGISTERED)
+    else:
+        # Default response for other intents while registered
+        greeting = f"Hey {first_name}! 👋" if first_name else "👋"
+        return Reply(
+            f"{greeting}\n\nWhat would you like to do?",
+            ConversationState.REGISTERED,
+        )
 
-        # Payment flow
-        elif current_state == ConversationState.PAYMENT_PENDING:
-            if "confirm" in message_text.lower():
-                name_ref = f"{first_name}, your" if first_name else "Your"
-                return (
-                    f"🔗 Payment Link\n\n"
-                    f"{name_ref} payment link is ready. Click to complete payment on our secure gateway.\n\n"
-                    f"We'll confirm once payment is received!",
-                    ConversationState.PAYMENT_CONFIRMED,
-                )
-            else:
-                return (
-                    f"⚠️ Confirm Required\n\n"
-                    f"Tap 'Confirm Payment' to proceed, or 'Cancel' to go back.",
-                    ConversationState.PAYMENT_PENDING,
-                )
 
+def _on_homework_subject(turn: _Turn) -> Reply:
+    phone_number, message_text, db = turn.phone_number, turn.message_text, turn.db
+    ConversationService.set_data(phone_number, "homework_subject", message_text)
+    variables = {"subject": message_text}
+    homework_type_text = ConversationService.get_template("homework_type", db, variables)
+    if not homework_type_text:
+        homework_type_text = f"📚 Subject: {message_text}\n\nHow would you like to submit your homework?"
+    return Reply(homework_type_text, ConversationState.HOMEWORK_TYPE)
+
+
+def _on_homework_type(turn: _Turn) -> Reply:
+    phone_number, message_text, first_name = turn.phone_number, turn.message_text, turn.first_name
+    submission_type = "IMAGE" if "image" in message_text.lower() else "TEXT"
+    ConversationService.set_data(phone_number, "homework_type", submission_type)
+
+    # For IMAGE, skip intermediate message and go directly to upload link
+    if submission_type == "IMAGE":
+        name_ref = f"{first_name}, " if first_name else ""
+        return Reply(
+            f"📷 {name_ref}preparing your upload page...",
+            ConversationState.HOMEWORK_SUBMITTED,
+        )
+
+    # For TEXT, ask for content
+    else:
+        name_ref = f"{first_name}, " if first_name else ""
+        return Reply(
+            f"📄 Text Submission\n\n"
+            f"{name_ref}Go ahead and send your homework now.",
+            ConversationState.HOMEWORK_CONTENT,
+        )
+
+
+def _on_homework_content(turn: _Turn) -> Reply:
+    phone_number, message_text, first_name = turn.phone_number, turn.message_text, turn.first_name
+    ConversationService.set_data(phone_number, "homework_content", message_text)
+    name_ref = f"Thanks, {first_name}! " if first_name else ""
+    return Reply(
+        f"{name_ref}📤 Processing your submission...\n\n"
+        f"Your homework has been received and is being reviewed by a tutor.",
+        ConversationState.HOMEWORK_SUBMITTED,
+    )
+
+
+def _on_homework_submitted(turn: _Turn) -> Reply:
+    phone_number, first_name = turn.phone_number, turn.first_name
+    # Homework is now submitted - user can proceed
+    # Show completion message and return to main menu
+    name_ref = f"{first_name}, " if first_name else ""
+    homework = ConversationService.get_data_many(phone_number, ["homework_subject", "homework_type"])
+    homework_subject, homework_type = homework["homework_subject"], homework["homework_type"]
+
+    # Show confirmation based on submission type
+    if homework_type == "IMAGE":
+        confirmation = "Your image has been uploaded and submitted successfully! ✅"
+    else:
+        confirmation = "Your homework has been submitted successfully! ✅"
+
+    return Reply(
+        f"{confirmation}\n\n"
+        f"Subject: {homework_subject}\n"
+        f"Type: {homework_type}\n\n"
+        f"A tutor will review your work shortly.\n\n"
+        f"What would you like to do next, {name_ref}?",
+        ConversationState.IDLE,
+    )
+
+
+def _on_payment_pending(turn: _Turn) -> Reply:
+    message_text, first_name = turn.message_text, turn.first_name
+    if "confirm" in message_text.lower():
+        name_ref = f"{first_name}, your" if first_name else "Your"
+        return Reply(
+            f"🔗 Payment Link\n\n"
+            f"{name_ref} payment link is ready. Click to complete payment on our secure gateway.\n\n"
+            f"We'll confirm once payment is received!",
+            ConversationState.PAYMENT_CONFIRMED,
+        )
+    else:
+        return _CONFIRM_REQUIRED
+
+
+def _on_unhandled(turn: _Turn) -> Reply:
+    """Fall back to the features menu for unknown input."""
+    student, first_name, current_state, db = turn.student, turn.first_name, turn.current_state, turn.db
+    # Default response for unknown intent - show feature list
+    if current_state in [ConversationState.INITIAL, ConversationState.IDLE, ConversationState.IDENTIFYING]:
+        if student.name:
+            # Registered user - show main menu
+            return Reply(
+                ConversationService.get_available_features_menu(db, first_name),
+                ConversationState.IDLE,
+            )
         else:
-            # Default response for unknown intent - show feature list
-            if current_state in [ConversationState.INITIAL, ConversationState.IDLE, ConversationState.IDENTIFYING]:
-                if student_data and student_data.get("name"):
-                    # Registered user - show main menu
-                    return (
-                        ConversationService.get_available_features_menu(db, first_name),
-                        ConversationState.IDLE,
-                    )
-                else:
-                    # Unregistered user - show main menu
-                    return (
-                        ConversationService.get_available_features_menu(db, ""),
-                        ConversationState.INITIAL,
-                    )
-            else:
-                # In other states, return to idle with feature list
-                if student_data and student_data.get("name"):
-                    return (
-                        ConversationService.get_available_features_menu(db, first_name),
-                        ConversationState.IDLE,
-                    )
-                else:
-                    # Unregistered user in other state - show main menu
-                    return (
-                        ConversationService.get_available_features_menu(db, ""),
-                        ConversationState.INITIAL,
-                    )
+            # Unregistered user - show main menu
+            return Reply(
+                ConversationService.get_available_features_menu(db, ""),
+                ConversationState.INITIAL,
+            )
+    else:
+        # In other states, return to idle with feature list
+        if student.name:
+            return Reply(
+                ConversationService.get_available_features_menu(db, first_name),
+                ConversationState.IDLE,
+            )
+        else:
+            # Unregistered user in other state - show main menu
+            return Reply(
+                ConversationService.get_available_features_menu(db, ""),
+                ConversationState.INITIAL,
+            )
+
+_INTENT_HANDLERS: Dict[str, Callable[[_Turn], Reply]] = {
+    "end_chat": _on_end_chat,
+    "cancel": _on_cancel,
+    "help": _on_help,
+    "support": _on_support,
+}
+
+# Checked before the global "main_menu" intent
+_INPUT_STATE_HANDLERS: Dict[ConversationState, Callable[[_Turn], Reply]] = {
+    ConversationState.INITIAL: _on_idle,
+    ConversationState.IDLE: _on_idle,
+    ConversationState.ALREADY_REGISTERED: _on_already_registered,
+    ConversationState.REGISTERING_NAME: _on_registering_name,
+    ConversationState.REGISTERING_EMAIL: _on_registering_email,
+    ConversationState.REGISTERING_CLASS: _on_registering_class,
+    ConversationState.UPDATING_NAME: _on_updating_name,
+    ConversationState.UPDATING_EMAIL: _on_updating_email,
+    ConversationState.UPDATING_CLASS: _on_updating_class,
+}
+
+# Checked after the global "main_menu" intent
+_FLOW_STATE_HANDLERS: Dict[ConversationState, Callable[[_Turn], Reply]] = {
+    ConversationState.REGISTERED: _on_registered,
+    ConversationState.HOMEWORK_SUBJECT: _on_homework_subject,
+    ConversationState.HOMEWORK_TYPE: _on_homework_type,
+    ConversationState.HOMEWORK_CONTENT: _on_homework_content,
+    ConversationState.HOMEWORK_SUBMITTED: _on_homework_submitted,
+    ConversationState.PAYMENT_PENDING: _on_payment_pending,
+}
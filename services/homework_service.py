@@ -1,15 +1,75 @@
 """
 Homework service - handles homework submissions.
 """
-from typing import Optional
-from sqlalchemy.orm import Session
+from typing import Optional, Tuple, List, Dict, Any
+from sqlalchemy import func
+from sqlalchemy.orm import Session, defer, selectinload
 import os
+import time
 from models.homework import Homework, SubmissionType, PaymentType
 from models.student import Student
 from utils.logger import get_logger
 
 logger = get_logger("homework_service")
 
+# String -> enum lookups for the common spellings ("TEXT"/"text"); other casings fall back to .upper()
+_SUBMISSION_TYPES = {key: member for member in SubmissionType for key in (member.name, member.name.lower())}
+_PAYMENT_TYPES = {key: member for member in PaymentType for key in (member.name, member.name.lower())}
+
+# Short-lived os.stat cache so retried/duplicate IMAGE submissions don't re-stat the same paths
+_STAT_CACHE: Dict[str, Tuple[float, Optional[os.stat_result]]] = {}
+_STAT_CACHE_TTL = 2.0  # seconds
+_STAT_CACHE_MAX = 1024
+
+
+def _cached_stat(path: str) -> Optional[os.stat_result]:
+    """os.stat(path) cached for a couple of seconds; None if the file doesn't exist."""
+    now = time.monotonic()
+    cached = _STAT_CACHE.get(path)
+    if cached and (now - cached[0]) < _STAT_CACHE_TTL:
+        return cached[1]
+
+    try:
+        result = os.stat(path)
+    except OSError:
+        result = None
+
+    if len(_STAT_CACHE) >= _STAT_CACHE_MAX:
+        _STAT_CACHE.clear()
+    _STAT_CACHE[path] = (now, result)
+    return result
+
+
+def _validate_text(content: Optional[str], file_path: Optional[str]) -> None:
+    """TEXT submissions need non-blank content."""
+    if not content or len(content.strip()) == 0:
+        raise ValueError("Content required for TEXT submissions")
+
+
+def _validate_image(content: Optional[str], file_path: Optional[str]) -> None:
+    """IMAGE submissions may arrive before the upload; when a path is given, check it exists."""
+    if not file_path:
+        logger.info("ℹ️ IMAGE submission - no file yet (will be uploaded later)")
+        return
+
+    # Verify file exists - one stat each for the path as given and with the uploads prefix
+    found_path = file_path
+    file_stat = _cached_stat(file_path)
+    if file_stat is None and not file_path.startswith('uploads/'):
+        found_path = f"uploads/{file_path}"
+        file_stat = _cached_stat(found_path)
+    if file_stat is not None:
+        logger.info("✓ IMAGE file verified: %s (%d bytes)", found_path, file_stat.st_size)
+    else:
+        logger.warning("⚠️ IMAGE submission - file not found at: %s", file_path)
+
+
+# Per-type content checks, keyed by the resolved SubmissionType
+_CONTENT_VALIDATORS = {
+    SubmissionType.TEXT: _validate_text,
+    SubmissionType.IMAGE: _validate_image,
+}
+
 
 class HomeworkService:
     """Service for homework operations."""
@@ -46,64 +106,97 @@ class HomeworkService:
         Raises:
             ValueError: If validation fails
         """
-        # Validate student exists
-        student = db.query(Student).filter(Student.id == student_id).first()
-        if not student:
-            raise ValueError(f"Student {student_id} not found")
+        homework = HomeworkService.bulk_submit(db, [{
+            "student_id": student_id,
+            "subject": subject,
+            "submission_type": submission_type,
+            "content": content,
+            "file_path": file_path,
+            "payment_type": payment_type,
+            "payment_id": payment_id,
+        }])[0]
+
+        # %-style args: the logging framework only formats these when INFO is enabled
+        logger.info(
+            "✅ Homework submitted: ID=%s, Student=%s, Type=%s, Subject=%s",
+            homework.id, student_id, submission_type, subject,
+        )
+        if file_path:
+            logger.info("   📎 File: %s", file_path)
+
+        return homework
+
+    @staticmethod
+    def bulk_submit(db: Session, items: List[Dict[str, Any]]) -> List[Homework]:
+        """
+        Submit several homeworks with a single commit.
+        
+        Args:
+            db: Database session
+            items: One dict per homework with the submit_homework arguments
+                (student_id, subject, submission_type, content, file_path,
+                payment_type, payment_id)
+        
+        Returns:
+            Created Homework objects, in the same order as items
+        
+        Raises:
+            ValueError: If any item fails validation (nothing is written)
+        """
+        if not items:
+            return []
+
+        # Validate students exist - selects ids only, no Student rows are hydrated
+        student_ids = {item["student_id"] for item in items}
+        if len(student_ids) == 1:
+            (student_id,) = student_ids
+            exists = db.query(Student.id).filter(Student.id == student_id).scalar()
+            found = student_ids if exists is not None else set()
+        else:
+            found = {row.id for row in db.query(Student.id).filter(Student.id.in_(student_ids))}
+        missing = student_ids - found
+        if missing:
+            raise ValueError(f"Student {sorted(missing)[0]} not found")
+
+        homeworks = [HomeworkService._build_homework(item) for item in items]
+
+        db.add_all(homeworks)
+        db.commit()
+
+        if len(homeworks) > 1:
+            logger.info("✅ Bulk homework submit: %d homeworks saved", len(homeworks))
+
+        return homeworks
+
+    @staticmethod
+    def _build_homework(item: Dict[str, Any]) -> Homework:
+        """Validate one submission dict and build its (unsaved) Homework."""
+        submission_type = item["submission_type"]
+        content = item.get("content")
+        file_path = item.get("file_path")
+        payment_type = item.get("payment_type", "ONE_TIME")
 
         # Validate submission type
-        if submission_type.upper() not in ["TEXT", "IMAGE"]:
+        submission_enum = _SUBMISSION_TYPES.get(submission_type) or _SUBMISSION_TYPES.get(submission_type.upper())
+        if submission_enum is None:
             raise ValueError("Submission type must be TEXT or IMAGE")
 
         # Validate content based on type
-        if submission_type.upper() == "TEXT":
-            if not content or len(content.strip()) == 0:
-                raise ValueError("Content required for TEXT submissions")
-        elif submission_type.upper() == "IMAGE":
-            # For IMAGE submissions, file_path can be None initially
-            # (will be set after user uploads the image)
-            if file_path:
-                # Verify file exists - try both relative and with uploads prefix
-                file_exists = os.path.exists(file_path)
-                if not file_exists and not file_path.startswith('uploads/'):
-                    # Try with uploads prefix
-                    alt_path = f"uploads/{file_path}"
-                    file_exists = os.path.exists(alt_path)
-                    if file_exists:
-                        logger.info(f"✓ IMAGE file found at: {alt_path}")
-                        file_size = os.path.getsize(alt_path)
-                        logger.info(f"  File size: {file_size} bytes")
-                elif file_exists:
-                    file_size = os.path.getsize(file_path)
-                    logger.info(f"✓ IMAGE file verified: {file_path} ({file_size} bytes)")
-                else:
-                    logger.warning(f"⚠️ IMAGE submission - file not found at: {file_path}")
-            else:
-                logger.info(f"ℹ️ IMAGE submission - no file yet (will be uploaded later)")
-
-        # Create homework record
-        homework = Homework(
-            student_id=student_id,
-            subject=subject,
-            submission_type=SubmissionType[submission_type.upper()],
-            content=content,
-            file_path=file_path,
-            payment_type=PaymentType[payment_type.upper()],
-            payment_id=payment_id,
-        )
+        _CONTENT_VALIDATORS[submission_enum](content, file_path)
 
-        db.add(homework)
-        db.commit()
-        db.refresh(homework)
+        payment_enum = _PAYMENT_TYPES.get(payment_type) or _PAYMENT_TYPES.get(payment_type.upper())
+        if payment_enum is None:
+            raise ValueError("Payment type must be ONE_TIME or SUBSCRIPTION")
 
-        logger.info(
-            f"✅ Homework submitted: ID={homework.id}, Student={student_id}, "
-            f"Type={submission_type}, Subject={subject}"
+        return Homework(
+            student_id=item["student_id"],
+            subject=item["subject"],
+            submission_type=submission_enum,
+            content=content,
+            file_path=file_path,
+            payment_type=payment_enum,
+            payment_id=item.get("payment_id"),
         )
-        if file_path:
-            logger.info(f"   📎 File: {file_path}")
-
-        return homework
 
     @staticmethod
     def get_homework_by_id(db: Session, homework_id: int) -> Optional[Homework]:
@@ -112,7 +205,8 @@ class HomeworkService:
 
     @staticmethod
     def get_student_homeworks(
-        db: Session, student_id: int, limit: int = 50, offset: int = 0
+        db: Session, student_id: int, limit: int = 50, offset: int = 0,
+        load_relations: bool = False
     ) -> list[Homework]:
         """
         Get student's homework submissions.
@@ -122,18 +216,58 @@ class HomeworkService:
             student_id: Student ID
             limit: Max results
             offset: Pagination offset
+            load_relations: Eager-load student and assigned tutor for the page
         
         Returns:
             List of Homework objects
         """
-        return (
-            db.query(Homework)
+        homeworks, _ = HomeworkService.get_student_homeworks_with_count(
+            db, student_id, limit, offset, load_relations
+        )
+        return homeworks
+
+    @staticmethod
+    def get_student_homeworks_with_count(
+        db: Session, student_id: int, limit: int = 50, offset: int = 0,
+        load_relations: bool = False
+    ) -> Tuple[list[Homework], int]:
+        """
+        Get a page of student's homework submissions together with the total count.
+        
+        Uses COUNT(*) OVER () so the page and the total come back in one query.
+        The text content column is deferred - use get_homework_by_id for the full row.
+        With load_relations, student and assigned tutor are fetched with one
+        SELECT ... IN per relationship instead of a lazy load per row.
+        
+        Args:
+            db: Database session
+            student_id: Student ID
+            limit: Max results
+            offset: Pagination offset
+            load_relations: Eager-load student and assigned tutor for the page
+        
+        Returns:
+            Tuple of (list of Homework objects, total homework count)
+        """
+        query = db.query(Homework, func.count().over().label("total")).options(defer(Homework.content))
+        if load_relations:
+            query = query.options(
+                selectinload(Homework.student),
+                selectinload(Homework.assigned_tutor),
+            )
+        rows = (
+            query
             .filter(Homework.student_id == student_id)
             .order_by(Homework.created_at.desc())
             .limit(limit)
             .offset(offset)
             .all()
         )
+        if rows:
+            return [row.Homework for row in rows], rows[0].total
+        # Past the last page there are no rows to carry the window count
+        total = HomeworkService.get_student_homework_count(db, student_id) if offset else 0
+        return [], total
 
     @staticmethod
     def get_student_homework_count(db: Session, student_id: int) -> int:
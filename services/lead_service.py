@@ -1,14 +1,62 @@
 """
 Lead service - handles lead tracking and conversion to students.
 """
-from typing import Optional
+import threading
+from typing import Optional, Dict, Any
+from sqlalchemy import bindparam, case, func, or_, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 from models.lead import Lead
+from utils.background import BackgroundFlusher
+from utils.db import update_by_key
 from utils.logger import get_logger
 from datetime import datetime
 
 logger = get_logger("lead_service")
 
+# Message-count/last-message bumps for existing leads, keyed by phone number.
+# Written by a background thread so a burst of messages costs one commit, not one each.
+_LEAD_UPDATE_BUFFER: Dict[str, Dict[str, Any]] = {}
+_lead_buffer_lock = threading.Lock()
+_LEAD_FLUSH_INTERVAL = 0.5  # seconds
+_lead_flusher = BackgroundFlusher(
+    "lead-flusher", lambda: LeadService.flush_pending_updates(), _LEAD_FLUSH_INTERVAL
+)
+
+_leads = Lead.__table__
+_LEAD_BUMP_STMT = (
+    update(_leads)
+    .where(_leads.c.phone_number == bindparam("p_phone"))
+    .values(
+        message_count=_leads.c.message_count + bindparam("p_count"),
+        last_message=bindparam("p_message"),
+        last_message_time=bindparam("p_time"),
+        updated_at=bindparam("p_time"),
+        sender_name=case(
+            (
+                or_(_leads.c.sender_name.is_(None), _leads.c.sender_name == ""),
+                func.coalesce(bindparam("p_sender"), _leads.c.sender_name),
+            ),
+            else_=_leads.c.sender_name,
+        ),
+    )
+)
+
+
+def _merge_into_buffer(rows) -> None:
+    """Put lead updates that failed to write back into the buffer, combined with any newer ones."""
+    with _lead_buffer_lock:
+        for row in rows:
+            pending = _LEAD_UPDATE_BUFFER.get(row["p_phone"])
+            if pending is None:
+                _LEAD_UPDATE_BUFFER[row["p_phone"]] = row
+                continue
+            # Newer bumps keep their last message/time; the failed ones still count
+            pending["p_count"] += row["p_count"]
+            if not pending["p_sender"]:
+                pending["p_sender"] = row["p_sender"]
+
 
 class LeadService:
     """Service for lead operations."""
@@ -33,37 +81,99 @@ class LeadService:
         lead = db.query(Lead).filter(Lead.phone_number == phone_number).first()
         
         if lead:
-            # Update last message info
-            lead.message_count += 1
-            lead.last_message = first_message
-            lead.last_message_time = datetime.utcnow()
-            lead.updated_at = datetime.utcnow()
+            # Queue the last message info - written in batches by the flusher thread
+            now = datetime.utcnow()
+            with _lead_buffer_lock:
+                pending = _LEAD_UPDATE_BUFFER.get(phone_number)
+                if pending is None:
+                    pending = _LEAD_UPDATE_BUFFER[phone_number] = {
+                        "p_phone": phone_number,
+                        "p_count": 0,
+                        "p_sender": None,
+                    }
+                pending["p_count"] += 1
+                pending["p_message"] = first_message
+                pending["p_time"] = now
+                if sender_name and not pending["p_sender"]:
+                    pending["p_sender"] = sender_name
+                pending_count = pending["p_count"]
+            _lead_flusher.ensure_running()
             
+            # Show the buffered values on the caller's instance as already-committed state,
+            # so the caller's next commit doesn't write them a second time
+            set_committed_value(lead, "message_count", (lead.message_count or 0) + pending_count)
+            set_committed_value(lead, "last_message", first_message)
+            set_committed_value(lead, "last_message_time", now)
+            set_committed_value(lead, "updated_at", now)
             if sender_name and not lead.sender_name:
-                lead.sender_name = sender_name
+                set_committed_value(lead, "sender_name", sender_name)
             
-            db.commit()
-            db.refresh(lead)
             logger.info(f"Updated lead: {phone_number} (message count: {lead.message_count})")
             return lead
         
-        # Create new lead
-        lead = Lead(
-            phone_number=phone_number,
-            sender_name=sender_name or phone_number,
-            first_message=first_message,
-            last_message=first_message,
-            message_count=1,
-            is_active=True,
-            converted_to_student=False,
+        # Create new lead - an upsert, so a concurrent first message from the same
+        # number bumps the row the other request inserted instead of hitting the unique key
+        now = datetime.utcnow()
+        values = {
+            "phone_number": phone_number,
+            "sender_name": sender_name or phone_number,
+            "first_message": first_message,
+            "last_message": first_message,
+            "message_count": 1,
+            "is_active": True,
+            "converted_to_student": False,
+            "created_at": now,
+            "updated_at": now,
+            "last_message_time": now,
+        }
+        stmt = mysql_insert(_leads).values(**values)
+        stmt = stmt.on_duplicate_key_update(
+            message_count=_leads.c.message_count + 1,
+            last_message=stmt.inserted.last_message,
+            last_message_time=stmt.inserted.last_message_time,
+            updated_at=stmt.inserted.updated_at,
         )
-        
-        db.add(lead)
+        result = db.execute(stmt)
         db.commit()
-        db.refresh(lead)
+        
+        # MySQL reports 1 affected row for an insert, 2 when the duplicate-key update ran
+        if result.rowcount != 1:
+            logger.info(f"Lead {phone_number} was created concurrently - counted this message")
+            return db.query(Lead).filter(Lead.phone_number == phone_number).first()
         
         logger.info(f"Created new lead: {phone_number} - {sender_name}")
-        return lead
+        return Lead(id=result.lastrowid, **values)
+
+    @staticmethod
+    def flush_pending_updates() -> int:
+        """
+        Write buffered lead updates in one transaction.
+        
+        Updates that fail to write go back into the buffer for the next flush.
+        
+        Returns:
+            Number of leads updated
+        """
+        with _lead_buffer_lock:
+            if not _LEAD_UPDATE_BUFFER:
+                return 0
+            rows = list(_LEAD_UPDATE_BUFFER.values())
+            _LEAD_UPDATE_BUFFER.clear()
+        
+        from config.database import SessionLocal
+        db = SessionLocal()
+        try:
+            db.connection().execute(_LEAD_BUMP_STMT, rows)
+            db.commit()
+            logger.debug(f"Flushed {len(rows)} buffered lead updates")
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            _merge_into_buffer(rows)
+            logger.error(f"Error writing lead updates ({len(rows)} kept for retry): {str(e)}")
+            return 0
+        finally:
+            db.close()
 
     @staticmethod
     def get_lead_by_phone(db: Session, phone_number: str) -> Optional[Lead]:
@@ -82,47 +192,47 @@ class LeadService:
         )
 
     @staticmethod
-    def convert_lead_to_student(db: Session, phone_number: str, student_id: int) -> Lead:
+    def convert_lead_to_student(db: Session, phone_number: str, student_id: int) -> None:
         """
         Mark a lead as converted to student.
         
+        Issued as a single UPDATE - the lead row is not loaded or refreshed.
+        
         Args:
             db: Database session
             phone_number: Lead phone number
             student_id: The new Student ID
         
-        Returns:
-            Updated Lead object
+        Raises:
+            ValueError: If no lead exists for the phone number
         """
-        lead = db.query(Lead).filter(Lead.phone_number == phone_number).first()
-        
-        if not lead:
-            raise ValueError(f"Lead with phone number {phone_number} not found")
-        
-        lead.converted_to_student = True
-        lead.student_id = student_id
-        lead.updated_at = datetime.utcnow()
+        update_by_key(
+            db,
+            Lead.phone_number,
+            phone_number,
+            f"Lead with phone number {phone_number} not found",
+            converted_to_student=True,
+            student_id=student_id,
+            updated_at=datetime.utcnow(),
+        )
         db.commit()
-        db.refresh(lead)
         
         logger.info(f"Converted lead {phone_number} to student {student_id}")
-        return lead
 
     @staticmethod
-    def deactivate_lead(db: Session, phone_number: str) -> Lead:
-        """Deactivate a lead."""
-        lead = db.query(Lead).filter(Lead.phone_number == phone_number).first()
-        
-        if not lead:
-            raise ValueError(f"Lead with phone number {phone_number} not found")
-        
-        lead.is_active = False
-        lead.updated_at = datetime.utcnow()
+    def deactivate_lead(db: Session, phone_number: str) -> None:
+        """Deactivate a lead with a single UPDATE; raises ValueError if it doesn't exist."""
+        update_by_key(
+            db,
+            Lead.phone_number,
+            phone_number,
+            f"Lead with phone number {phone_number} not found",
+            is_active=False,
+            updated_at=datetime.utcnow(),
+        )
         db.commit()
-        db.refresh(lead)
         
         logger.info(f"Deactivated lead: {phone_number}")
-        return lead
 
     @staticmethod
     def delete_lead(db: Session, phone_number: str) -> bool:
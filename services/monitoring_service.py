@@ -1,51 +1,73 @@
 """
 Monitoring service - Track errors, performance, and health in production.
 """
+import asyncio
+import os
 import time
+from bisect import bisect_left
+import threading
 import psutil
+from collections import deque
 import json
 import logging
 from datetime import datetime
-from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import Dict, Any, NamedTuple, Optional
 from sqlalchemy import text
 from config.settings import settings
 from utils.logger import get_logger
 
 logger = get_logger("monitoring")
 
+# Built once so every health probe reuses the same compiled statement
+_HEALTHCHECK_STMT = text("SELECT 1")
 
-@dataclass
-class PerformanceMetric:
-    """Performance metric data point."""
+# Prime psutil's CPU counter so non-blocking cpu_percent() calls report usage since the last call
+psutil.cpu_percent(interval=None)
+
+
+class PerformanceMetric(NamedTuple):
+    """Performance metric data point (immutable, no per-instance __dict__)."""
     endpoint: str
     method: str
     status_code: int
     response_time_ms: float
-    timestamp: datetime
+    timestamp: float  # unix epoch seconds, formatted only when reported
     request_id: str
     error: Optional[str] = None
 
 
-@dataclass
-class HealthStatus:
+class HealthStatus(NamedTuple):
     """Health check result."""
     service: str
     status: str  # "healthy", "degraded", "down"
     message: str
     response_time_ms: float
-    timestamp: datetime
+    timestamp: float  # unix epoch seconds
 
 
 class MonitoringService:
     """Service for production monitoring."""
     
-    # Store recent metrics in memory (last 1000)
-    metrics_buffer = []
+    # Store recent metrics in memory (last 1000) - the deque drops the oldest on append
     MAX_METRICS = 1000
+    metrics_buffer = deque(maxlen=MAX_METRICS)
+    
+    # Rolling aggregates over metrics_buffer, kept in step with appends/evictions
+    _totals = {"count": 0, "errors": 0, "sum_time": 0.0}
+    _per_endpoint: Dict[str, Dict[str, Any]] = {}
+    _metrics_lock = threading.Lock()
+    
+    # Fixed-bucket latency histogram over the same window (upper bounds in ms, plus an overflow bucket)
+    LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 5000)
+    _latency_counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
     
     # Store health check results
     health_status = {}
+    _health_lock = threading.Lock()
+    
+    # Fixed for the lifetime of the process - read once instead of per metrics call
+    _cpu_count = psutil.cpu_count()
+    _process: Optional[psutil.Process] = None
     
     @staticmethod
     def record_request(
@@ -62,16 +84,51 @@ class MonitoringService:
             method=method,
             status_code=status_code,
             response_time_ms=response_time_ms,
-            timestamp=datetime.utcnow(),
+            timestamp=time.time(),
             request_id=request_id,
             error=error,
         )
         
-        MonitoringService.metrics_buffer.append(metric)
-        
-        # Keep buffer size manageable
-        if len(MonitoringService.metrics_buffer) > MonitoringService.MAX_METRICS:
-            MonitoringService.metrics_buffer.pop(0)
+        buffer = MonitoringService.metrics_buffer
+        totals = MonitoringService._totals
+        per_endpoint = MonitoringService._per_endpoint
+        latency_counts = MonitoringService._latency_counts
+        bounds = MonitoringService.LATENCY_BUCKETS_MS
+        is_error = status_code >= 400
+        with MonitoringService._metrics_lock:
+            # Take the oldest metric out of the aggregates before the deque drops it
+            if len(buffer) == buffer.maxlen:
+                evicted = buffer[0]
+                evicted_error = evicted.status_code >= 400
+                totals["count"] -= 1
+                totals["sum_time"] -= evicted.response_time_ms
+                if evicted_error:
+                    totals["errors"] -= 1
+                latency_counts[bisect_left(bounds, evicted.response_time_ms)] -= 1
+                evicted_key = f"{evicted.method} {evicted.endpoint}"
+                stats = per_endpoint[evicted_key]
+                stats["count"] -= 1
+                stats["sum_time"] -= evicted.response_time_ms
+                if evicted_error:
+                    stats["errors"] -= 1
+                if stats["count"] == 0:
+                    del per_endpoint[evicted_key]
+            
+            buffer.append(metric)
+            
+            totals["count"] += 1
+            totals["sum_time"] += response_time_ms
+            latency_counts[bisect_left(bounds, response_time_ms)] += 1
+            key = f"{method} {endpoint}"
+            stats = per_endpoint.get(key)
+            if stats is None:
+                stats = per_endpoint[key] = {"count": 0, "errors": 0, "sum_time": 0.0, "last_seen": None}
+            stats["count"] += 1
+            stats["sum_time"] += response_time_ms
+            stats["last_seen"] = metric.timestamp
+            if is_error:
+                totals["errors"] += 1
+                stats["errors"] += 1
         
         # Log slow requests
         if response_time_ms > 1000:  # > 1 second
@@ -97,61 +154,69 @@ class MonitoringService:
                 }
             )
     
+    @staticmethod
+    def _latency_percentile(latency_counts: list, total: int, quantile: float) -> float:
+        """Upper bound (ms) of the histogram bucket holding the quantile; overflow reports the last bound."""
+        bounds = MonitoringService.LATENCY_BUCKETS_MS
+        target = quantile * total
+        seen = 0
+        for index, count in enumerate(latency_counts):
+            seen += count
+            if seen >= target:
+                return bounds[min(index, len(bounds) - 1)]
+        return bounds[-1]
+    
     @staticmethod
     def get_metrics_summary() -> Dict[str, Any]:
         """Get summary of recent metrics."""
-        if not MonitoringService.metrics_buffer:
-            return {
-                "total_requests": 0,
-                "error_rate": 0,
-                "average_response_time": 0,
-                "endpoints": {},
-            }
-        
-        metrics = MonitoringService.metrics_buffer
-        total = len(metrics)
-        errors = sum(1 for m in metrics if m.status_code >= 400)
-        avg_time = sum(m.response_time_ms for m in metrics) / total if total > 0 else 0
-        
-        # Group by endpoint
-        endpoints = {}
-        for metric in metrics:
-            key = f"{metric.method} {metric.endpoint}"
-            if key not in endpoints:
-                endpoints[key] = {
-                    "count": 0,
-                    "errors": 0,
-                    "avg_response_time": 0,
-                    "last_seen": None,
+        with MonitoringService._metrics_lock:
+            if not MonitoringService._totals["count"]:
+                return {
+                    "total_requests": 0,
+                    "error_rate": 0,
+                    "average_response_time": 0,
+                    "endpoints": {},
                 }
-            
-            endpoints[key]["count"] += 1
-            if metric.status_code >= 400:
-                endpoints[key]["errors"] += 1
-            endpoints[key]["last_seen"] = metric.timestamp.isoformat()
+            totals = dict(MonitoringService._totals)
+            latency_counts = list(MonitoringService._latency_counts)
+            endpoints = {
+                key: {
+                    "count": stats["count"],
+                    "errors": stats["errors"],
+                    "avg_response_time": stats["sum_time"] / stats["count"],
+                    "last_seen": datetime.utcfromtimestamp(stats["last_seen"]).isoformat(),
+                }
+                for key, stats in MonitoringService._per_endpoint.items()
+            }
         
-        # Calculate averages per endpoint
-        for key in endpoints:
-            endpoint_metrics = [m for m in metrics if f"{m.method} {m.endpoint}" == key]
-            endpoints[key]["avg_response_time"] = (
-                sum(m.response_time_ms for m in endpoint_metrics) / len(endpoint_metrics)
-                if endpoint_metrics else 0
-            )
+        total = totals["count"]
+        errors = totals["errors"]
+        avg_time = totals["sum_time"] / total if total > 0 else 0
         
         return {
             "total_requests": total,
             "error_rate": (errors / total * 100) if total > 0 else 0,
             "average_response_time": avg_time,
+            "p95_response_time": MonitoringService._latency_percentile(latency_counts, total, 0.95),
+            "p99_response_time": MonitoringService._latency_percentile(latency_counts, total, 0.99),
             "endpoints": endpoints,
             "timestamp": datetime.utcnow().isoformat(),
         }
     
+    @staticmethod
+    def _get_process() -> psutil.Process:
+        """Return a cached handle for this process (re-created after a fork)."""
+        process = MonitoringService._process
+        if process is None or process.pid != os.getpid():
+            process = MonitoringService._process = psutil.Process()
+        return process
+    
     @staticmethod
     def get_system_metrics() -> Dict[str, Any]:
         """Get system resource metrics."""
         try:
-            # CPU
-            cpu_percent = psutil.cpu_percent(interval=0.1)
+            # CPU - non-blocking, measured since the previous call
+            cpu_percent = psutil.cpu_percent(interval=None)
             
             # Memory
             memory = psutil.virtual_memory()
@@ -160,14 +225,14 @@ class MonitoringService:
             disk = psutil.disk_usage('/')
             
             # Process
-            process = psutil.Process()
+            process = MonitoringService._get_process()
             process_memory = process.memory_info()
             process_cpu = process.cpu_percent()
             
             return {
                 "cpu": {
                     "percent": cpu_percent,
-                    "cores": psutil.cpu_count(),
+                    "cores": MonitoringService._cpu_count,
                 },
                 "memory": {
                     "percent": memory.percent,
@@ -205,10 +270,11 @@ class MonitoringService:
             status=status,
             message=message,
             response_time_ms=response_time_ms,
-            timestamp=datetime.utcnow(),
+            timestamp=time.time(),
         )
         
-        MonitoringService.health_status[service] = health
+        with MonitoringService._health_lock:
+            MonitoringService.health_status[service] = health
         
         # Log health issues
         if status != "healthy":
@@ -224,14 +290,17 @@ class MonitoringService:
     @staticmethod
     def get_health_status() -> Dict[str, Any]:
         """Get health status of all services."""
+        # Snapshot under the lock - a concurrent update would otherwise break dict iteration
+        with MonitoringService._health_lock:
+            services = list(MonitoringService.health_status.items())
         status_dict = {
             k: {
                 "status": v.status,
                 "message": v.message,
                 "response_time_ms": v.response_time_ms,
-                "timestamp": v.timestamp.isoformat(),
+                "timestamp": datetime.utcfromtimestamp(v.timestamp).isoformat(),
             }
-            for k, v in MonitoringService.health_status.items()
+            for k, v in services
         }
         
         # Overall status
@@ -251,9 +320,9 @@ class MonitoringService:
     def check_database_health(db) -> tuple[str, str, float]:
         """Check database health."""
         try:
-            start = time.time()
-            db.execute(text("SELECT 1"))
-            response_time = (time.time() - start) * 1000
+            start = time.perf_counter()
+            db.execute(_HEALTHCHECK_STMT)
+            response_time = (time.perf_counter() - start) * 1000
             return "healthy", "Database connection OK", response_time
         except Exception as e:
             logger.error(f"Database health check failed: {str(e)}")
@@ -282,30 +351,58 @@ class MonitoringService:
             return "healthy", "Paystack API configured", 0
         except Exception as e:
             return "degraded", f"Paystack check failed: {str(e)}", 0
+    
+    @staticmethod
+    async def get_all_health(db) -> Dict[str, tuple]:
+        """
+        Run every service health check without blocking the event loop.
+        
+        The database probe is the only check doing I/O, so it runs in a worker thread
+        while the configuration-only WhatsApp/Paystack checks run inline alongside it.
+        
+        Returns:
+            Dict of service name -> (status, message, response_time_ms)
+        """
+        db_check = asyncio.ensure_future(asyncio.to_thread(MonitoringService.check_database_health, db))
+        results = {
+            "whatsapp": MonitoringService.check_whatsapp_health(),
+            "paystack": MonitoringService.check_paystack_health(),
+        }
+        results["database"] = await db_check
+        return results
 
 
 # Initialize Sentry if configured
+_sentry_initialized = False
+
+
 def init_sentry():
-    """Initialize Sentry error tracking."""
+    """Initialize Sentry error tracking (once per process)."""
+    global _sentry_initialized
+    if _sentry_initialized:
+        return
+    
+    sentry_dsn = getattr(settings, 'sentry_dsn', None)
+    if not sentry_dsn:
+        logger.info("Sentry DSN not configured - error tracking disabled")
+        return
+    
     try:
+        # Imported only when a DSN is set, so unconfigured deployments never load the SDK
         import sentry_sdk
         from sentry_sdk.integrations.fastapi import FastApiIntegration
         from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
         
-        sentry_dsn = getattr(settings, 'sentry_dsn', None)
-        
-        if sentry_dsn:
-            sentry_sdk.init(
-                dsn=sentry_dsn,
-                integrations=[
-                    FastApiIntegration(),
-                    SqlalchemyIntegration(),
-                ],
-                traces_sample_rate=0.1,  # 10% of transactions
-                environment=getattr(settings, 'environment', 'production'),
-            )
-            logger.info("Sentry initialized successfully")
-        else:
-            logger.info("Sentry DSN not configured - error tracking disabled")
+        sentry_sdk.init(
+            dsn=sentry_dsn,
+            integrations=[
+                FastApiIntegration(),
+                SqlalchemyIntegration(),
+            ],
+            traces_sample_rate=0.1,  # 10% of transactions
+            environment=getattr(settings, 'environment', 'production'),
+        )
+        _sentry_initialized = True
+        logger.info("Sentry initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize Sentry: {str(e)}")
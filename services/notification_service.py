@@ -1,14 +1,21 @@
 """Notification Service for managing alerts and messages."""
 
+import functools
 import logging
-import json
+import os
+import time as time_module
 from datetime import datetime, time
-from typing import Optional, Dict, Any, List
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy.orm import Session, raiseload
+from sqlalchemy import and_, case, func, insert, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from models.notification import (
     Notification, 
     NotificationPreference, 
+    NotificationCounter,
     NotificationType, 
     NotificationPriority,
     NotificationChannel
@@ -16,10 +23,153 @@ from models.notification import (
 
 logger = logging.getLogger(__name__)
 
+# Read-only preference snapshots for the notification send path, keyed by phone number.
+# Preferences change rarely; update_preferences drops the entry so edits apply immediately.
+_PREFS_CACHE: Dict[str, Tuple[float, SimpleNamespace]] = {}
+_PREFS_CACHE_TTL = 300  # seconds
+_PREF_COLUMNS = tuple(column.key for column in NotificationPreference.__table__.columns)
+
+# Preference flag that gates each notification type (types not listed are always sent)
+_TYPE_TO_PREF_ATTR = {
+    NotificationType.HOMEWORK_SUBMITTED: "homework_submitted",
+    NotificationType.HOMEWORK_REVIEWED: "homework_reviewed",
+    NotificationType.CHAT_MESSAGE: "chat_messages",
+    NotificationType.CHAT_SUPPORT_STARTED: "chat_messages",
+    NotificationType.CHAT_SUPPORT_ENDED: "chat_messages",
+    NotificationType.SUBSCRIPTION_ACTIVATED: "subscription_alerts",
+    NotificationType.SUBSCRIPTION_EXPIRING: "subscription_alerts",
+    NotificationType.PAYMENT_CONFIRMED: "subscription_alerts",
+    NotificationType.ACCOUNT_UPDATED: "account_updates",
+    NotificationType.REGISTRATION_COMPLETE: "account_updates",
+    NotificationType.SYSTEM_ALERT: "system_alerts",
+}
+
+_GATING_PREF_ATTRS = frozenset(_TYPE_TO_PREF_ATTR.values())
+
+# Preference fields update_preferences accepts from callers
+_UPDATABLE_PREF_FIELDS = frozenset({
+    'homework_submitted', 'homework_reviewed', 'chat_messages',
+    'subscription_alerts', 'account_updates', 'system_alerts',
+    'prefer_whatsapp', 'prefer_email', 'quiet_hours_enabled',
+    'quiet_hours_start', 'quiet_hours_end', 'batch_notifications'
+})
+
+# Fail loudly on lazy loads from notification list queries (enable in dev/CI) so a
+# relationship added later cannot silently turn a page read into N+1 queries.
+_STRICT_LOADING = os.getenv("SQL_STRICT_LOADING", "False").lower() == "true"
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_hm(value: str) -> time:
+    """Parse an "HH:MM" quiet-hours string (memoized - users share a handful of values)."""
+    hours, minutes = value.split(":", 1)
+    return time(int(hours), int(minutes))
+
+
+def _channel_from_prefs(prefs) -> Optional[NotificationChannel]:
+    """Delivery channel the user's preferences ask for, or None to keep the caller's choice."""
+    if prefs.prefer_whatsapp and prefs.prefer_email:
+        return NotificationChannel.BOTH
+    if prefs.prefer_whatsapp:
+        return NotificationChannel.WHATSAPP
+    if prefs.prefer_email:
+        return NotificationChannel.EMAIL
+    return None
+
+
+def _pref_snapshot(values: Dict[str, Any]) -> SimpleNamespace:
+    """
+    Build a read-only preferences snapshot with the send-path decisions precomputed.
+    
+    allows_all is True when every gated notification type is enabled, so senders can skip
+    the per-type check; delivery_channel is the channel the preferences pick (or None);
+    quiet_window is the parsed (start, end) quiet hours, or None when they do not apply.
+    """
+    snapshot = SimpleNamespace(**values)
+    snapshot.allows_all = all(values[attr] for attr in _GATING_PREF_ATTRS)
+    snapshot.delivery_channel = _channel_from_prefs(snapshot)
+    snapshot.quiet_window = None
+    if values.get("quiet_hours_enabled") and values.get("quiet_hours_start") and values.get("quiet_hours_end"):
+        try:
+            snapshot.quiet_window = (_parse_hm(values["quiet_hours_start"]), _parse_hm(values["quiet_hours_end"]))
+        except ValueError:
+            logger.warning(f"Ignoring malformed quiet hours for {values.get('phone_number')}")
+    return snapshot
+
+
+# What a user without a preferences row gets - the column defaults, applied in Python
+# so reading preferences never has to INSERT a default row
+DEFAULT_PREFS = _pref_snapshot({
+    column.key: column.default.arg if column.default is not None and column.default.is_scalar else None
+    for column in NotificationPreference.__table__.columns
+})
+
+
+def _floored_at_zero(expr):
+    """expr, or 0 where it would go negative (GREATEST(expr, 0) on every dialect)."""
+    return case((expr > 0, expr), else_=0)
+
+
+def _upsert(db: Session, table, values, conflict_columns, on_conflict: Dict[str, Any]):
+    """
+    INSERT row(s), applying on_conflict to the existing row when a unique key collides.
+    
+    MySQL gets INSERT ... ON DUPLICATE KEY UPDATE; other dialects (the SQLite test
+    scripts) get INSERT ... ON CONFLICT (conflict_columns) DO UPDATE.
+    """
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql_insert(table).values(values).on_duplicate_key_update(**on_conflict)
+    else:
+        stmt = sqlite_insert(table).values(values).on_conflict_do_update(
+            index_elements=conflict_columns, set_=on_conflict
+        )
+    return db.execute(stmt)
+
 
 class NotificationService:
     """Service for creating, managing, and sending notifications."""
     
+    @staticmethod
+    def adjust_unread_counter(db: Session, phone_number: str, delta: Optional[int] = None) -> None:
+        """
+        Keep notification_counters in step with a change the session has already flushed.
+        
+        Adds delta to the stored count (never below zero), or resets it to 0 when delta is None.
+        A missing counter row is seeded from COUNT(*) over the notifications table, so counts
+        for recipients that predate the counter table start out correct.
+        """
+        counters = NotificationCounter.__table__
+        actual_unread = (
+            select(func.count())
+            .select_from(Notification.__table__)
+            .where(Notification.phone_number == phone_number, Notification.is_read == False)
+            .scalar_subquery()
+        )
+        if delta is None:
+            new_count = 0
+        else:
+            new_count = _floored_at_zero(counters.c.unread_count + delta)
+        _upsert(
+            db,
+            counters,
+            {"phone_number": phone_number, "unread_count": actual_unread},
+            [counters.c.phone_number],
+            {"unread_count": new_count, "updated_at": func.now()},
+        )
+    
+    @staticmethod
+    def _decrement_unread_for(db: Session, notification_id: int, unread_only: bool = False) -> None:
+        """Take one off the unread counter of a notification's recipient, without loading the row."""
+        counters = NotificationCounter.__table__
+        recipient = select(Notification.phone_number).where(Notification.id == notification_id)
+        if unread_only:
+            recipient = recipient.where(Notification.is_read == False)
+        db.execute(
+            update(counters)
+            .where(counters.c.phone_number == recipient.scalar_subquery())
+            .values(unread_count=_floored_at_zero(counters.c.unread_count - 1), updated_at=func.now())
+        )
+    
     @staticmethod
     def create_notification(
         phone_number: str,
@@ -31,7 +181,8 @@ class NotificationService:
         data: Optional[Dict[str, Any]] = None,
         related_entity_type: Optional[str] = None,
         related_entity_id: Optional[str] = None,
-        db: Optional[Session] = None
+        db: Optional[Session] = None,
+        dedup_key: Optional[str] = None
     ) -> Notification:
         """
         Create a new notification.
@@ -47,31 +198,25 @@ class NotificationService:
             related_entity_type: Type of related entity (homework, chat_support, etc.)
             related_entity_id: ID of related entity
             db: Database session
+            dedup_key: Key for one-off notifications - a second notification with the same
+                recipient, type and key is not stored
         
         Returns:
-            Created Notification object
+            Created Notification object (None if disabled or a duplicate)
         """
         try:
             # Check user preferences
             if db:
-                prefs = NotificationService.get_preferences(phone_number, db)
-                
-                # Check if this notification type is enabled
-                if not NotificationService._is_notification_enabled(notification_type, prefs):
-                    logger.debug(f"Notification {notification_type} disabled for {phone_number}")
-                    return None
+                prefs = NotificationService.get_cached_preferences(phone_number, db)
                 
-                # Determine channel based on preferences
-                if prefs:
-                    if prefs.prefer_whatsapp and prefs.prefer_email:
-                        channel = NotificationChannel.BOTH
-                    elif prefs.prefer_whatsapp:
-                        channel = NotificationChannel.WHATSAPP
-                    elif prefs.prefer_email:
-                        channel = NotificationChannel.EMAIL
-            
-            # Serialize data if provided
-            data_str = json.dumps(data) if data else None
+                if prefs is not None:
+                    # Check if this notification type is enabled (nothing to check when all are)
+                    if not prefs.allows_all and not NotificationService._is_notification_enabled(notification_type, prefs):
+                        logger.debug(f"Notification {notification_type} disabled for {phone_number}")
+                        return None
+                    
+                    # Determine channel based on preferences
+                    channel = prefs.delivery_channel or channel
             
             # Create notification
             notification = Notification(
@@ -81,48 +226,151 @@ class NotificationService:
                 channel=channel,
                 title=title,
                 message=message,
-                data=data_str,
+                data=data or None,
                 related_entity_type=related_entity_type,
                 related_entity_id=related_entity_id,
+                dedup_key=dedup_key,
                 is_read=False,
                 is_sent=False
             )
             
             if db:
                 db.add(notification)
+                db.flush()  # populates the autoincrement id from the INSERT
+                notification_id = notification.id
+                NotificationService.adjust_unread_counter(db, phone_number, 1)
                 db.commit()
-                db.refresh(notification)
-                logger.info(f"Created notification {notification.id} for {phone_number}")
+                logger.info(f"Created notification {notification_id} for {phone_number}")
             
             return notification
             
+        except IntegrityError:
+            # uq_notif_dedup: this one-off notification was already stored
+            logger.debug(f"Duplicate notification {notification_type} ({dedup_key}) for {phone_number} skipped")
+            db.rollback()
+            return None
+            
         except Exception as e:
             logger.error(f"Error creating notification: {str(e)}")
             if db:
                 db.rollback()
             return None
     
+    @staticmethod
+    def create_notifications_bulk(specs: List[Dict[str, Any]], db: Session) -> int:
+        """
+        Create many notifications in one transaction.
+        
+        Preferences for every recipient are resolved with at most one query, the rows go
+        out as a single executemany INSERT, and unread counters are bumped once per recipient.
+        
+        Args:
+            specs: One dict per notification with the create_notification arguments
+                (phone_number, notification_type, title, message and optionally priority,
+                channel, data, related_entity_type, related_entity_id, dedup_key)
+            db: Database session
+        
+        Returns:
+            Number of notifications written (disabled types and duplicate dedup_keys are skipped)
+        
+        Raises:
+            SQLAlchemyError: If the write fails; the session is rolled back first
+        """
+        if not specs:
+            return 0
+        
+        try:
+            prefs_by_phone = NotificationService.get_cached_preferences_many(
+                {spec["phone_number"] for spec in specs}, db
+            )
+            
+            rows = []
+            deduped_rows = []
+            keyed_rows = []
+            new_per_phone: Dict[str, int] = {}
+            for spec in specs:
+                phone_number = spec["phone_number"]
+                prefs = prefs_by_phone[phone_number]
+                if not prefs.allows_all and not NotificationService._is_notification_enabled(spec["notification_type"], prefs):
+                    continue
+                
+                data = spec.get("data")
+                row = {
+                    "phone_number": phone_number,
+                    "notification_type": spec["notification_type"],
+                    "title": spec["title"],
+                    "message": spec["message"],
+                    "priority": spec.get("priority", NotificationPriority.NORMAL),
+                    "channel": prefs.delivery_channel or spec.get("channel", NotificationChannel.IN_APP),
+                    "data": data or None,
+                    "related_entity_type": spec.get("related_entity_type"),
+                    "related_entity_id": spec.get("related_entity_id"),
+                    "dedup_key": spec.get("dedup_key"),
+                    "is_read": False,
+                    "is_sent": False,
+                }
+                if row["dedup_key"] is None:
+                    rows.append(row)
+                else:
+                    deduped_rows.append(row)
+            
+            # One-off notifications: drop any whose (recipient, type, dedup_key) is already
+            # stored or repeated within this batch
+            if deduped_rows:
+                seen = set(db.execute(
+                    select(Notification.phone_number, Notification.notification_type, Notification.dedup_key)
+                    .where(
+                        Notification.phone_number.in_({row["phone_number"] for row in deduped_rows}),
+                        Notification.dedup_key.in_({row["dedup_key"] for row in deduped_rows}),
+                    )
+                ).all())
+                for row in deduped_rows:
+                    key = (row["phone_number"], row["notification_type"], row["dedup_key"])
+                    if key not in seen:
+                        seen.add(key)
+                        keyed_rows.append(row)
+            
+            if not rows and not keyed_rows:
+                return 0
+            
+            # ORM bulk INSERT: one executemany, which the MySQL driver sends as multi-row VALUES
+            if rows:
+                db.execute(insert(Notification), rows)
+            # A duplicate written concurrently since the check above becomes a no-op update on
+            # uq_notif_dedup; unlike INSERT IGNORE, any other error still raises
+            if keyed_rows:
+                notifications = Notification.__table__
+                _upsert(
+                    db,
+                    notifications,
+                    keyed_rows,
+                    [notifications.c.phone_number, notifications.c.notification_type, notifications.c.dedup_key],
+                    {"id": notifications.c.id},
+                )
+            for row in rows + keyed_rows:
+                new_per_phone[row["phone_number"]] = new_per_phone.get(row["phone_number"], 0) + 1
+            
+            written = 0
+            for phone_number, count in new_per_phone.items():
+                NotificationService.adjust_unread_counter(db, phone_number, count)
+                written += count
+            db.commit()
+            logger.info(f"Created {written} notifications for {len(new_per_phone)} recipients")
+            return written
+            
+        except Exception as e:
+            logger.error(f"Error creating notifications in bulk: {str(e)}")
+            db.rollback()
+            raise
+    
     @staticmethod
     def _is_notification_enabled(notification_type: NotificationType, prefs: NotificationPreference) -> bool:
         """Check if notification type is enabled in user preferences."""
         if not prefs:
             return True  # Default to enabled if no preferences
         
-        type_map = {
-            NotificationType.HOMEWORK_SUBMITTED: prefs.homework_submitted,
-            NotificationType.HOMEWORK_REVIEWED: prefs.homework_reviewed,
-            NotificationType.CHAT_MESSAGE: prefs.chat_messages,
-            NotificationType.CHAT_SUPPORT_STARTED: prefs.chat_messages,
-            NotificationType.CHAT_SUPPORT_ENDED: prefs.chat_messages,
-            NotificationType.SUBSCRIPTION_ACTIVATED: prefs.subscription_alerts,
-            NotificationType.SUBSCRIPTION_EXPIRING: prefs.subscription_alerts,
-            NotificationType.PAYMENT_CONFIRMED: prefs.subscription_alerts,
-            NotificationType.ACCOUNT_UPDATED: prefs.account_updates,
-            NotificationType.REGISTRATION_COMPLETE: prefs.account_updates,
-            NotificationType.SYSTEM_ALERT: prefs.system_alerts,
-        }
-        
-        return type_map.get(notification_type, True)
+        attr = _TYPE_TO_PREF_ATTR.get(notification_type)
+        return True if attr is None else getattr(prefs, attr)
     
     @staticmethod
     def get_notifications(
@@ -131,18 +379,26 @@ class NotificationService:
         limit: int = 50,
         offset: int = 0,
         unread_only: bool = False,
-        notification_type: Optional[NotificationType] = None
+        notification_type: Optional[NotificationType] = None,
+        before_created_at: Optional[datetime] = None,
+        before_id: Optional[int] = None
     ) -> List[Notification]:
         """
-        Get notifications for a user.
+        Get notifications for a user, newest first.
+        
+        Pass the created_at/id of the last notification already shown as
+        before_created_at/before_id to get the next page by keyset - each page
+        then costs an index range read instead of skipping `offset` rows.
         
         Args:
             phone_number: User's phone number
             db: Database session
             limit: Maximum results to return
-            offset: Number of results to skip
+            offset: Number of results to skip (ignored when a keyset cursor is given)
             unread_only: Only return unread notifications
             notification_type: Filter by notification type
+            before_created_at: Keyset cursor - created_at of the last row of the previous page
+            before_id: Keyset cursor - id of the last row of the previous page
         
         Returns:
             List of Notification objects
@@ -150,7 +406,7 @@ class NotificationService:
         try:
             query = db.query(Notification).filter(
                 Notification.phone_number == phone_number
-            ).order_by(Notification.created_at.desc())
+            ).order_by(Notification.created_at.desc(), Notification.id.desc())
             
             if unread_only:
                 query = query.filter(Notification.is_read == False)
@@ -158,7 +414,18 @@ class NotificationService:
             if notification_type:
                 query = query.filter(Notification.notification_type == notification_type)
             
-            return query.offset(offset).limit(limit).all()
+            if before_created_at is not None and before_id is not None:
+                query = query.filter(or_(
+                    Notification.created_at < before_created_at,
+                    and_(Notification.created_at == before_created_at, Notification.id < before_id),
+                ))
+            elif offset:
+                query = query.offset(offset)
+            
+            if _STRICT_LOADING:
+                query = query.options(raiseload("*"))
+            
+            return query.limit(limit).all()
             
         except Exception as e:
             logger.error(f"Error getting notifications: {str(e)}")
@@ -166,8 +433,14 @@ class NotificationService:
     
     @staticmethod
     def get_unread_count(phone_number: str, db: Session) -> int:
-        """Get count of unread notifications for a user."""
+        """Get count of unread notifications for a user (primary-key read of the counter row)."""
         try:
+            count = db.query(NotificationCounter.unread_count).filter(
+                NotificationCounter.phone_number == phone_number
+            ).scalar()
+            if count is not None:
+                return count
+            # No counter yet - nothing has been written for this recipient since counters were added
             return db.query(Notification).filter(
                 Notification.phone_number == phone_number,
                 Notification.is_read == False
@@ -180,17 +453,24 @@ class NotificationService:
     def mark_as_read(notification_id: int, db: Session) -> bool:
         """Mark a notification as read."""
         try:
-            notification = db.query(Notification).filter(
-                Notification.id == notification_id
-            ).first()
+            # Single UPDATE; the WHERE on is_read makes rowcount say whether it was unread
+            updated = db.query(Notification).filter(
+                Notification.id == notification_id,
+                Notification.is_read == False
+            ).update({
+                Notification.is_read: True,
+                Notification.read_at: func.now()
+            }, synchronize_session=False)
             
-            if notification:
-                notification.is_read = True
-                notification.read_at = datetime.now()
+            if updated:
+                NotificationService._decrement_unread_for(db, notification_id)
                 db.commit()
                 logger.info(f"Marked notification {notification_id} as read")
                 return True
-            return False
+            
+            # Nothing changed - report whether it exists (already read) or not
+            db.rollback()
+            return db.query(Notification.id).filter(Notification.id == notification_id).first() is not None
             
         except Exception as e:
             logger.error(f"Error marking notification as read: {str(e)}")
@@ -198,36 +478,43 @@ class NotificationService:
             return False
     
     @staticmethod
-    def mark_all_as_read(phone_number: str, db: Session) -> bool:
-        """Mark all notifications for a user as read."""
+    def mark_all_as_read(phone_number: str, db: Session) -> Optional[int]:
+        """
+        Mark all notifications for a user as read.
+        
+        Returns:
+            Number of notifications marked (0 when none were unread), or None on failure
+        """
         try:
-            db.query(Notification).filter(
+            marked = db.query(Notification).filter(
                 Notification.phone_number == phone_number,
                 Notification.is_read == False
             ).update({
                 Notification.is_read: True,
-                Notification.read_at: datetime.now()
-            })
+                Notification.read_at: func.now()
+            }, synchronize_session=False)
+            NotificationService.adjust_unread_counter(db, phone_number)
             db.commit()
-            logger.info(f"Marked all notifications as read for {phone_number}")
-            return True
+            logger.info(f"Marked {marked} notifications as read for {phone_number}")
+            return marked
             
         except Exception as e:
             logger.error(f"Error marking all notifications as read: {str(e)}")
             db.rollback()
-            return False
+            return None
     
     @staticmethod
     def delete_notification(notification_id: int, db: Session) -> bool:
         """Delete a notification."""
         try:
-            notification = db.query(Notification).filter(
+            # Counter first - once the row is gone there is no phone number to look up
+            NotificationService._decrement_unread_for(db, notification_id, unread_only=True)
+            deleted = db.query(Notification).filter(
                 Notification.id == notification_id
-            ).first()
+            ).delete(synchronize_session=False)
+            db.commit()
             
-            if notification:
-                db.delete(notification)
-                db.commit()
+            if deleted:
                 logger.info(f"Deleted notification {notification_id}")
                 return True
             return False
@@ -244,6 +531,7 @@ class NotificationService:
             db.query(Notification).filter(
                 Notification.phone_number == phone_number
             ).delete()
+            NotificationService.adjust_unread_counter(db, phone_number)
             db.commit()
             logger.info(f"Cleared all notifications for {phone_number}")
             return True
@@ -255,18 +543,29 @@ class NotificationService:
     
     @staticmethod
     def get_preferences(phone_number: str, db: Session) -> Optional[NotificationPreference]:
-        """Get notification preferences for a user."""
+        """
+        Get notification preferences for a user, creating the default row if none exists.
+        
+        The default row is written with a no-op upsert, so concurrent first reads for the
+        same new user both succeed instead of one failing on the unique phone_number.
+        """
         try:
-            prefs = db.query(NotificationPreference).filter(
+            query = db.query(NotificationPreference).filter(
                 NotificationPreference.phone_number == phone_number
-            ).first()
+            )
+            prefs = query.first()
             
-            # Create default preferences if none exist
             if not prefs:
-                prefs = NotificationPreference(phone_number=phone_number)
-                db.add(prefs)
+                preferences = NotificationPreference.__table__
+                _upsert(
+                    db,
+                    preferences,
+                    {"phone_number": phone_number},
+                    [preferences.c.phone_number],
+                    {"phone_number": preferences.c.phone_number},
+                )
                 db.commit()
-                db.refresh(prefs)
+                prefs = query.first()
             
             return prefs
             
@@ -274,6 +573,55 @@ class NotificationService:
             logger.error(f"Error getting preferences: {str(e)}")
             return None
     
+    @staticmethod
+    def get_cached_preferences(phone_number: str, db: Session) -> Optional[SimpleNamespace]:
+        """
+        Get a read-only snapshot of a user's preferences, cached for a few minutes.
+        
+        For callers that only read preference flags (the notification send path);
+        use get_preferences when the ORM object itself is needed. A single SELECT on a
+        miss - users without a preferences row get DEFAULT_PREFS and nothing is written.
+        """
+        cached = _PREFS_CACHE.get(phone_number)
+        if cached and (time_module.monotonic() - cached[0]) < _PREFS_CACHE_TTL:
+            return cached[1]
+        
+        try:
+            row = db.query(*(getattr(NotificationPreference, key) for key in _PREF_COLUMNS)).filter(
+                NotificationPreference.phone_number == phone_number
+            ).first()
+        except Exception as e:
+            logger.error(f"Error getting preferences: {str(e)}")
+            return None
+        
+        snapshot = _pref_snapshot(row._asdict()) if row is not None else DEFAULT_PREFS
+        _PREFS_CACHE[phone_number] = (time_module.monotonic(), snapshot)
+        return snapshot
+    
+    @staticmethod
+    def get_cached_preferences_many(phone_numbers, db: Session) -> Dict[str, SimpleNamespace]:
+        """Preference snapshots for several users - cache hits plus one IN query for the rest."""
+        now = time_module.monotonic()
+        result: Dict[str, SimpleNamespace] = {}
+        missing = []
+        for phone_number in phone_numbers:
+            cached = _PREFS_CACHE.get(phone_number)
+            if cached and (now - cached[0]) < _PREFS_CACHE_TTL:
+                result[phone_number] = cached[1]
+            else:
+                missing.append(phone_number)
+        
+        if missing:
+            rows = db.query(*(getattr(NotificationPreference, key) for key in _PREF_COLUMNS)).filter(
+                NotificationPreference.phone_number.in_(missing)
+            ).all()
+            found = {row.phone_number: _pref_snapshot(row._asdict()) for row in rows}
+            for phone_number in missing:
+                snapshot = found.get(phone_number, DEFAULT_PREFS)
+                _PREFS_CACHE[phone_number] = (now, snapshot)
+                result[phone_number] = snapshot
+        return result
+    
     @staticmethod
     def update_preferences(
         phone_number: str,
@@ -299,19 +647,13 @@ class NotificationService:
                 db.add(prefs)
             
             # Update allowed fields
-            allowed_fields = {
-                'homework_submitted', 'homework_reviewed', 'chat_messages',
-                'subscription_alerts', 'account_updates', 'system_alerts',
-                'prefer_whatsapp', 'prefer_email', 'quiet_hours_enabled',
-                'quiet_hours_start', 'quiet_hours_end', 'batch_notifications'
-            }
-            
             for key, value in kwargs.items():
-                if key in allowed_fields:
+                if key in _UPDATABLE_PREF_FIELDS:
                     setattr(prefs, key, value)
             
-            prefs.updated_at = datetime.now()
+            # updated_at is maintained by the column's onupdate=func.now()
             db.commit()
+            _PREFS_CACHE.pop(phone_number, None)
             db.refresh(prefs)
             logger.info(f"Updated preferences for {phone_number}")
             return prefs
@@ -337,17 +679,14 @@ class NotificationService:
             True if notification should be sent, False if in quiet hours
         """
         try:
-            prefs = NotificationService.get_preferences(phone_number, db)
+            prefs = NotificationService.get_cached_preferences(phone_number, db)
             
-            if not prefs or not prefs.quiet_hours_enabled:
-                return True
-            
-            if not prefs.quiet_hours_start or not prefs.quiet_hours_end:
+            # Quiet hours are parsed once, when the preferences snapshot is built
+            if not prefs or prefs.quiet_window is None:
                 return True
             
             current_time = datetime.now().time()
-            start_time = datetime.strptime(prefs.quiet_hours_start, "%H:%M").time()
-            end_time = datetime.strptime(prefs.quiet_hours_end, "%H:%M").time()
+            start_time, end_time = prefs.quiet_window
             
             # Check if current time is within quiet hours
             if start_time <= end_time:
@@ -369,23 +708,22 @@ class NotificationService:
     def get_notification_stats(phone_number: str, db: Session) -> Dict[str, Any]:
         """Get notification statistics for a user."""
         try:
-            total = db.query(Notification).filter(
-                Notification.phone_number == phone_number
-            ).count()
-            
-            unread = db.query(Notification).filter(
-                Notification.phone_number == phone_number,
-                Notification.is_read == False
-            ).count()
-            
+            # One grouped query; total and unread are summed from the per-type rows
             by_type = db.query(
                 Notification.notification_type,
-                func.count(Notification.id)
+                func.count(Notification.id),
+                func.sum(case((Notification.is_read == False, 1), else_=0))
             ).filter(
                 Notification.phone_number == phone_number
             ).group_by(Notification.notification_type).all()
             
-            type_counts = {str(n_type): count for n_type, count in by_type}
+            total = 0
+            unread = 0
+            type_counts = {}
+            for n_type, count, unread_count in by_type:
+                type_counts[str(n_type)] = count
+                total += count
+                unread += int(unread_count or 0)
             
             return {
                 "total": total,
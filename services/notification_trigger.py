@@ -1,17 +1,141 @@
 """Notification triggers for key bot events."""
 
 import logging
-from typing import Optional
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy.orm import Session
 from models.notification import NotificationType, NotificationPriority, NotificationChannel
 from services.notification_service import NotificationService
+from utils.background import BackgroundFlusher
 
 logger = logging.getLogger(__name__)
 
+# Trigger notifications are queued here and written in batches by a background
+# thread, so webhooks and chat bursts don't block on DB inserts.
+_NOTIF_QUEUE: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+_NOTIF_FLUSH_INTERVAL = 0.5  # seconds
+_NOTIF_BATCH_SIZE = 100
+# A batch that fails to write goes back on the queue; each notification gets this many
+# tries (about 5s of retries at the flush interval) before it is dropped
+_NOTIF_MAX_ATTEMPTS = 10
+_notif_flusher = BackgroundFlusher(
+    "notif-flusher", lambda: NotificationTrigger.flush_pending(), _NOTIF_FLUSH_INTERVAL
+)
+
+# Admin chat-message notifications are debounced per (admin, user): messages arriving within
+# the window collapse into one notification carrying the latest preview and a message count.
+_CHAT_DEBOUNCE_WINDOW = 3.0  # seconds
+_pending_chat: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_pending_chat_lock = threading.Lock()
+
+
+# Fixed text of the chat-support-started notification
+_CHAT_SUPPORT_STARTED_MESSAGE = "💬 Chat support session started.\n\nAn admin will be with you shortly."
+
+# System alert type -> notification priority
+_ALERT_PRIORITIES = {
+    "info": NotificationPriority.NORMAL,
+    "warning": NotificationPriority.HIGH,
+    "error": NotificationPriority.URGENT,
+}
+
+# Notifications raised inside NotificationTrigger.batch() on this thread, or None outside a batch
+_batch_state = threading.local()
+
+
+def _create_notification(**kwargs):
+    """
+    Hand a trigger's notification off for writing.
+    
+    Inside NotificationTrigger.batch() it joins the batch; otherwise it goes on the
+    background queue, so the request that fired the trigger never waits on the INSERT.
+    Without a db session nothing is persisted, as before.
+    """
+    if kwargs.get("db") is None:
+        return NotificationService.create_notification(**kwargs)
+    
+    kwargs.pop("db")
+    pending = getattr(_batch_state, "pending", None)
+    if pending is not None:
+        pending.append(kwargs)
+    else:
+        _NOTIF_QUEUE.put(kwargs)
+        _notif_flusher.ensure_running()
+    return None
+
+
+def _requeue_failed(items: List[Dict[str, Any]]) -> int:
+    """Put a batch that failed to write back on the queue; returns how many were requeued."""
+    requeued = 0
+    for item in items:
+        # "_attempts" is bookkeeping only; create_notifications_bulk ignores unknown keys
+        attempts = item.get("_attempts", 0) + 1
+        if attempts < _NOTIF_MAX_ATTEMPTS:
+            _NOTIF_QUEUE.put({**item, "_attempts": attempts})
+            requeued += 1
+    return requeued
+
 
 class NotificationTrigger:
     """Handle notification triggers for various bot events."""
     
+    @staticmethod
+    def bulk_create(events: List[Dict[str, Any]], db: Session) -> int:
+        """
+        Write a fan-out of notifications (broadcasts, expiry sweeps) in one batched INSERT.
+        
+        Build the full list of events first and call this once, instead of calling an
+        on_* trigger per recipient - that costs one INSERT and commit per notification.
+        
+        Args:
+            events: One dict per notification in the NotificationService.create_notifications_bulk
+                format (phone_number, notification_type, title, message, ...)
+            db: Database session
+        
+        Returns:
+            Number of notifications written
+        
+        Raises:
+            SQLAlchemyError: If the write fails (nothing is written)
+        """
+        return NotificationService.create_notifications_bulk(events, db)
+    
+    @staticmethod
+    @contextmanager
+    def batch(db: Session):
+        """
+        Collect the notifications of several triggers and write them in one transaction.
+        
+        Use when one bot event fires more than one trigger, e.g.
+        
+            with NotificationTrigger.batch(db):
+                NotificationTrigger.on_payment_confirmed(..., db=db)
+                NotificationTrigger.on_subscription_activated(..., db=db)
+        
+        The buffered notifications go out as one INSERT with a single commit when the block
+        exits; if the block raises they are discarded. Nested batches join the outer one.
+        Like the triggers themselves, a failed write is logged rather than raised.
+        """
+        if getattr(_batch_state, "pending", None) is not None:
+            yield
+            return
+        
+        pending: List[Dict[str, Any]] = []
+        _batch_state.pending = pending
+        try:
+            yield
+        finally:
+            _batch_state.pending = None
+        
+        if pending:
+            try:
+                NotificationTrigger.bulk_create(pending, db)
+            except Exception as e:
+                logger.error(f"Error writing {len(pending)} batched notifications: {str(e)}")
+    
     @staticmethod
     def on_homework_submitted(
         phone_number: str,
@@ -24,12 +148,10 @@ class NotificationTrigger:
         try:
             # Notify admins (would need admin list)
             # For now, create a notification that admins can see
-            message = f"📝 New homework submission from {student_name}\n\n"
-            message += f"Subject: {subject}\n"
-            message += f"ID: {homework_id}"
+            message = f"📝 New homework submission from {student_name}\n\nSubject: {subject}\nID: {homework_id}"
             
             # This would be sent to admin dashboard
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.HOMEWORK_SUBMITTED,
                 title="Homework Submitted",
@@ -42,6 +164,7 @@ class NotificationTrigger:
                 },
                 related_entity_type="homework",
                 related_entity_id=homework_id,
+                dedup_key=homework_id,
                 db=db
             )
             
@@ -60,12 +183,10 @@ class NotificationTrigger:
     ):
         """Trigger when admin reviews homework."""
         try:
-            message = f"✅ Your {subject} homework has been reviewed!\n\n"
-            if tutor_name:
-                message += f"Reviewed by: {tutor_name}\n"
-            message += "Check the app for detailed feedback."
+            reviewer_line = f"Reviewed by: {tutor_name}\n" if tutor_name else ""
+            message = f"✅ Your {subject} homework has been reviewed!\n\n{reviewer_line}Check the app for detailed feedback."
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.HOMEWORK_REVIEWED,
                 title="Homework Reviewed",
@@ -78,6 +199,7 @@ class NotificationTrigger:
                 },
                 related_entity_type="homework",
                 related_entity_id=homework_id,
+                dedup_key=homework_id,
                 db=db
             )
             
@@ -94,14 +216,11 @@ class NotificationTrigger:
     ):
         """Trigger when user initiates chat support."""
         try:
-            message = "💬 Chat support session started.\n\n"
-            message += "An admin will be with you shortly."
-            
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.CHAT_SUPPORT_STARTED,
                 title="Chat Support Connected",
-                message=message,
+                message=_CHAT_SUPPORT_STARTED_MESSAGE,
                 priority=NotificationPriority.NORMAL,
                 channel=NotificationChannel.IN_APP,
                 db=db
@@ -121,12 +240,10 @@ class NotificationTrigger:
     ):
         """Trigger when new chat message received."""
         try:
-            message = f"💬 New message from {sender_name}\n\n"
-            message += message_preview[:100]  # First 100 chars
-            if len(message_preview) > 100:
-                message += "..."
+            ellipsis = "..." if len(message_preview) > 100 else ""
+            message = f"💬 New message from {sender_name}\n\n{message_preview[:100]}{ellipsis}"  # First 100 chars
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.CHAT_MESSAGE,
                 title="New Chat Message",
@@ -149,11 +266,9 @@ class NotificationTrigger:
     ):
         """Trigger when user completes registration."""
         try:
-            message = f"👋 Welcome {student_name}!\n\n"
-            message += "Your account is now active.\n"
-            message += "You can now submit homework and access all features."
+            message = f"👋 Welcome {student_name}!\n\nYour account is now active.\nYou can now submit homework and access all features."
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.REGISTRATION_COMPLETE,
                 title="Registration Complete",
@@ -161,6 +276,7 @@ class NotificationTrigger:
                 priority=NotificationPriority.HIGH,
                 channel=NotificationChannel.WHATSAPP,
                 data={"student_name": student_name},
+                dedup_key="registration",
                 db=db
             )
             
@@ -178,13 +294,10 @@ class NotificationTrigger:
     ):
         """Trigger when user activates subscription."""
         try:
-            message = f"🎉 Subscription Activated!\n\n"
-            message += f"Plan: {plan_name}\n"
-            if duration_days:
-                message += f"Duration: {duration_days} days\n"
-            message += "\nYou now have unlimited homework submissions!"
+            duration_line = f"Duration: {duration_days} days\n" if duration_days else ""
+            message = f"🎉 Subscription Activated!\n\nPlan: {plan_name}\n{duration_line}\nYou now have unlimited homework submissions!"
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.SUBSCRIPTION_ACTIVATED,
                 title="Subscription Active",
@@ -212,12 +325,9 @@ class NotificationTrigger:
     ):
         """Trigger when subscription is about to expire."""
         try:
-            message = f"⏰ Subscription Expiring Soon\n\n"
-            message += f"Days remaining: {days_remaining}\n"
-            message += f"Expires: {expiration_date}\n\n"
-            message += "Renew now to avoid interruption!"
+            message = f"⏰ Subscription Expiring Soon\n\nDays remaining: {days_remaining}\nExpires: {expiration_date}\n\nRenew now to avoid interruption!"
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.SUBSCRIPTION_EXPIRING,
                 title="Subscription Expiring",
@@ -245,12 +355,9 @@ class NotificationTrigger:
     ):
         """Trigger when payment is confirmed."""
         try:
-            message = f"✅ Payment Confirmed\n\n"
-            message += f"Amount: ${amount:.2f}\n"
-            message += f"Transaction ID: {transaction_id}\n\n"
-            message += "Thank you for your purchase!"
+            message = f"✅ Payment Confirmed\n\nAmount: ${amount:.2f}\nTransaction ID: {transaction_id}\n\nThank you for your purchase!"
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.PAYMENT_CONFIRMED,
                 title="Payment Received",
@@ -261,6 +368,7 @@ class NotificationTrigger:
                     "amount": amount,
                     "transaction_id": transaction_id
                 },
+                dedup_key=transaction_id,
                 db=db
             )
             
@@ -277,11 +385,9 @@ class NotificationTrigger:
     ):
         """Trigger when account is updated."""
         try:
-            message = f"📝 Account Updated\n\n"
-            message += f"Updated: {update_type.replace('_', ' ').title()}\n\n"
-            message += "Your changes have been saved."
+            message = f"📝 Account Updated\n\nUpdated: {update_type.replace('_', ' ').title()}\n\nYour changes have been saved."
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.ACCOUNT_UPDATED,
                 title="Account Updated",
@@ -306,18 +412,12 @@ class NotificationTrigger:
     ):
         """Trigger system alert notification."""
         try:
-            priority_map = {
-                "info": NotificationPriority.NORMAL,
-                "warning": NotificationPriority.HIGH,
-                "error": NotificationPriority.URGENT
-            }
-            
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=phone_number,
                 notification_type=NotificationType.SYSTEM_ALERT,
                 title="System Alert",
                 message=alert_message,
-                priority=priority_map.get(alert_type, NotificationPriority.NORMAL),
+                priority=_ALERT_PRIORITIES.get(alert_type, NotificationPriority.NORMAL),
                 channel=NotificationChannel.IN_APP,
                 data={"alert_type": alert_type},
                 db=db
@@ -337,13 +437,10 @@ class NotificationTrigger:
     ):
         """Trigger notification to admins when user initiates chat support."""
         try:
-            message = f"💬 New Chat Support Request\n\n"
-            if user_name:
-                message += f"From: {user_name}\n"
-            message += f"Phone: {phone_number}\n\n"
-            message += "Click to view conversation and respond."
+            from_line = f"From: {user_name}\n" if user_name else ""
+            message = f"💬 New Chat Support Request\n\n{from_line}Phone: {phone_number}\n\nClick to view conversation and respond."
             
-            NotificationService.create_notification(
+            _create_notification(
                 phone_number=admin_phone,  # Send to admin
                 notification_type=NotificationType.CHAT_SUPPORT_STARTED,
                 title="New Chat Support Request",
@@ -372,38 +469,115 @@ class NotificationTrigger:
         admin_phone: str = "admin",
         db: Optional[Session] = None
     ):
-        """Trigger notification to admins when user sends message in chat."""
+        """
+        Trigger notification to admins when user sends message in chat.
+
+        Messages from the same user within a few seconds are coalesced into one
+        notification, which the background flusher writes - this returns without
+        touching the database.
+        """
         try:
-            message = f"💬 New Message from User\n\n"
-            if user_name:
-                message += f"From: {user_name}\n"
-            message += f"Phone: {phone_number}\n\n"
-            message += f"Message: {message_preview[:80]}"
-            if len(message_preview) > 80:
-                message += "..."
-            
-            NotificationService.create_notification(
-                phone_number=admin_phone,  # Send to admin
-                notification_type=NotificationType.CHAT_MESSAGE,
-                title="New Chat Message",
-                message=message,
-                priority=NotificationPriority.NORMAL,
-                channel=NotificationChannel.IN_APP,  # In-app for admins
-                data={
-                    "user_phone": phone_number,
-                    "user_name": user_name,
-                    "message_preview": message_preview
-                },
-                related_entity_type="chat_support",
-                related_entity_id=phone_number,
-                db=db
-            )
-            
-            logger.info(f"Admin notified: Chat message from {phone_number}")
+            key = (admin_phone, phone_number)
+            with _pending_chat_lock:
+                entry = _pending_chat.get(key)
+                if entry is None:
+                    _pending_chat[key] = {
+                        "first_at": time.monotonic(),
+                        "count": 1,
+                        "user_name": user_name,
+                        "message_preview": message_preview,
+                    }
+                else:
+                    entry["count"] += 1
+                    entry["user_name"] = user_name or entry["user_name"]
+                    entry["message_preview"] = message_preview
+            _notif_flusher.ensure_running()
+            
+            logger.info(f"Admin notification queued: Chat message from {phone_number}")
             
         except Exception as e:
             logger.error(f"Error triggering admin chat_message notification: {str(e)}")
     
+    @staticmethod
+    def _release_chat_messages(force: bool = False) -> None:
+        """Move debounced chat-message notifications whose window has passed onto the queue."""
+        now = time.monotonic()
+        with _pending_chat_lock:
+            due = [
+                key for key, entry in _pending_chat.items()
+                if force or now - entry["first_at"] >= _CHAT_DEBOUNCE_WINDOW
+            ]
+            released = [(key, _pending_chat.pop(key)) for key in due]
+        
+        for (admin_phone, phone_number), entry in released:
+            user_name = entry["user_name"]
+            message_preview = entry["message_preview"]
+            count = entry["count"]
+            
+            heading = f"💬 {count} New Messages from User" if count > 1 else "💬 New Message from User"
+            from_line = f"From: {user_name}\n" if user_name else ""
+            ellipsis = "..." if len(message_preview) > 80 else ""
+            message = f"{heading}\n\n{from_line}Phone: {phone_number}\n\nMessage: {message_preview[:80]}{ellipsis}"
+            
+            _NOTIF_QUEUE.put({
+                "phone_number": admin_phone,  # Send to admin
+                "notification_type": NotificationType.CHAT_MESSAGE,
+                "title": "New Chat Message",
+                "message": message,
+                "priority": NotificationPriority.NORMAL,
+                "channel": NotificationChannel.IN_APP,  # In-app for admins
+                "data": {
+                    "user_phone": phone_number,
+                    "user_name": user_name,
+                    "message_preview": message_preview,
+                    "message_count": count
+                },
+                "related_entity_type": "chat_support",
+                "related_entity_id": phone_number,
+            })
+    
+    @staticmethod
+    def flush_pending(force: bool = False) -> int:
+        """
+        Write queued notifications to the database in batches.
+        
+        A batch that fails is put back on the queue for the next call (see _NOTIF_MAX_ATTEMPTS).
+        
+        Args:
+            force: Also release debounced chat-message notifications still inside their window
+        
+        Returns:
+            Number of notifications written
+        """
+        NotificationTrigger._release_chat_messages(force)
+        written = 0
+        while True:
+            items: List[Dict[str, Any]] = []
+            while len(items) < _NOTIF_BATCH_SIZE:
+                try:
+                    items.append(_NOTIF_QUEUE.get_nowait())
+                except queue.Empty:
+                    break
+            if not items:
+                return written
+            
+            from config.database import SessionLocal
+            db = SessionLocal()
+            try:
+                count = NotificationTrigger.bulk_create(items, db)
+                if count:
+                    written += count
+                    logger.info(f"Flushed {count} queued notifications")
+            except Exception as e:
+                requeued = _requeue_failed(items)
+                logger.error(
+                    f"Error writing queued notifications ({requeued} of {len(items)} requeued): {str(e)}"
+                )
+                # Retry on the next flush rather than spinning on a failing database
+                return written
+            finally:
+                db.close()
+    
     @staticmethod
     def on_chat_support_ended_admin(
         phone_number: str,
@@ -414,15 +588,11 @@ class NotificationTrigger:
     ):
         """Trigger notification to admins when chat support session ends."""
         try:
-            message = f"↩️ Chat Support Ended\n\n"
-            if user_name:
-                message += f"User: {user_name}\n"
-            message += f"Phone: {phone_number}\n"
-            if duration_minutes:
-                message += f"Duration: {duration_minutes} minutes\n"
-            message += "\nConversation has been archived."
-            
-            NotificationService.create_notification(
+            user_line = f"User: {user_name}\n" if user_name else ""
+            duration_line = f"Duration: {duration_minutes} minutes\n" if duration_minutes else ""
+            message = f"↩️ Chat Support Ended\n\n{user_line}Phone: {phone_number}\n{duration_line}\nConversation has been archived."
+            
+            _create_notification(
                 phone_number=admin_phone,
                 notification_type=NotificationType.CHAT_SUPPORT_ENDED,
                 title="Chat Support Ended",
@@ -2,14 +2,41 @@
 Payment service - handles payment transactions.
 """
 from typing import Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.engine import Row
+from sqlalchemy import and_, exists
+from sqlalchemy.exc import IntegrityError
 from models.payment import Payment, PaymentStatus
 from models.student import Student
+from utils.db import update_by_key
 from utils.logger import get_logger
 
 logger = get_logger("payment_service")
 
+# Columns a payment history listing needs (see get_student_payments(listing_only=True))
+_PAYMENT_LISTING_COLUMNS = (
+    Payment.id,
+    Payment.student_id,
+    Payment.amount,
+    Payment.currency,
+    Payment.status,
+    Payment.payment_reference,
+    Payment.is_subscription,
+    Payment.created_at,
+)
+
+
+def _update_payment(db: Session, payment_id: int, **values) -> Payment:
+    """
+    Apply a single UPDATE to a payment by id and commit; raises ValueError if no row matched
+    (without committing or rolling back the caller's session).
+    
+    Returns the payment from the session's identity map when already loaded.
+    """
+    update_by_key(db, Payment.id, payment_id, f"Payment {payment_id} not found", **values)
+    db.commit()
+    return db.get(Payment, payment_id)
+
 
 class PaymentService:
     """Service for payment operations."""
@@ -44,17 +71,8 @@ class PaymentService:
         Raises:
             ValueError: If validation fails
         """
-        # Check student exists
-        student = db.query(Student).filter(Student.id == student_id).first()
-        if not student:
-            raise ValueError(f"Student {student_id} not found")
-
-        # Check if reference already exists
-        existing = db.query(Payment).filter(Payment.payment_reference == reference).first()
-        if existing:
-            raise ValueError(f"Payment with reference {reference} already exists")
-
-        # Create payment
+        # Student existence and reference uniqueness are enforced by the payments table's
+        # foreign key and unique constraints, so the INSERT is the only round trip
         payment = Payment(
             student_id=student_id,
             amount=amount,
@@ -68,8 +86,17 @@ class PaymentService:
         )
 
         db.add(payment)
+        try:
+            db.flush()
+        except IntegrityError as e:
+            db.rollback()
+            error = str(e.orig).lower()
+            if "foreign key" in error:
+                raise ValueError(f"Student {student_id} not found")
+            if "idempotency_key" in error:
+                raise ValueError(f"Payment with idempotency key {idempotency_key} already exists")
+            raise ValueError(f"Payment with reference {reference} already exists")
         db.commit()
-        db.refresh(payment)
 
         logger.info(
             f"Payment created: {payment.id} - Student: {student_id}, "
@@ -88,6 +115,15 @@ class PaymentService:
         """Get payment by reference."""
         return db.query(Payment).filter(Payment.payment_reference == reference).first()
 
+    @staticmethod
+    def get_payment_status(db: Session, reference: str) -> Optional[Row]:
+        """Get just (id, status) of a payment by reference, without loading the full row."""
+        return (
+            db.query(Payment.id, Payment.status)
+            .filter(Payment.payment_reference == reference)
+            .first()
+        )
+
     @staticmethod
     def update_payment_status(
         db: Session, payment_id: int, status: PaymentStatus
@@ -106,13 +142,7 @@ class PaymentService:
         Raises:
             ValueError: If payment not found
         """
-        payment = PaymentService.get_payment_by_id(db, payment_id)
-        if not payment:
-            raise ValueError(f"Payment {payment_id} not found")
-
-        payment.status = status
-        db.commit()
-        db.refresh(payment)
+        payment = _update_payment(db, payment_id, status=status)
 
         logger.info(f"Payment status updated: {payment_id} -> {status.value}")
         return payment
@@ -129,13 +159,7 @@ class PaymentService:
         Returns:
             Updated Payment object
         """
-        payment = PaymentService.get_payment_by_id(db, payment_id)
-        if not payment:
-            raise ValueError(f"Payment {payment_id} not found")
-
-        payment.webhook_processed = True
-        db.commit()
-        db.refresh(payment)
+        payment = _update_payment(db, payment_id, webhook_processed=True)
 
         logger.info(f"Webhook marked as processed for payment {payment_id}")
         return payment
@@ -147,6 +171,7 @@ class PaymentService:
         status: Optional[PaymentStatus] = None,
         limit: int = 50,
         offset: int = 0,
+        listing_only: bool = False,
     ) -> list[Payment]:
         """
         Get student's payments.
@@ -157,12 +182,18 @@ class PaymentService:
             status: Filter by status (optional)
             limit: Max results
             offset: Pagination offset
+            listing_only: Load only the columns a payment history listing shows; the
+                Paystack checkout fields (authorization_url, access_code, ...) are left
+                unloaded and would cost a query per row if accessed
         
         Returns:
             List of Payment objects
         """
         query = db.query(Payment).filter(Payment.student_id == student_id)
 
+        if listing_only:
+            query = query.options(load_only(*_PAYMENT_LISTING_COLUMNS))
+
         if status:
             query = query.filter(Payment.status == status)
 
@@ -171,27 +202,23 @@ class PaymentService:
     @staticmethod
     def has_pending_payment(db: Session, student_id: int) -> bool:
         """Check if student has pending payment."""
-        return (
-            db.query(Payment)
-            .filter(
+        return db.query(
+            exists().where(
                 and_(
                     Payment.student_id == student_id,
                     Payment.status == PaymentStatus.PENDING,
                 )
             )
-            .first()
-        ) is not None
+        ).scalar()
 
     @staticmethod
     def has_successful_payment(db: Session, student_id: int) -> bool:
         """Check if student has any successful payment."""
-        return (
-            db.query(Payment)
-            .filter(
+        return db.query(
+            exists().where(
                 and_(
                     Payment.student_id == student_id,
                     Payment.status == PaymentStatus.SUCCESS,
                 )
             )
-            .first()
-        ) is not None
+        ).scalar()
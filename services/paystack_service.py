@@ -1,10 +1,15 @@
 """
 Paystack service - integration with Paystack payment gateway.
 """
+import httpx
+import orjson
 import requests
-import json
-from typing import Optional
-from decimal import Decimal
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Optional, Tuple
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from utils.logger import get_logger
 from utils.security import verify_paystack_webhook_signature, generate_idempotency_key
 from config.settings import settings
@@ -12,14 +17,75 @@ from config.settings import settings
 logger = get_logger("paystack_service")
 
 
+def _create_session(headers: dict) -> requests.Session:
+    """HTTP session shared by all Paystack calls, keeping TLS connections alive between requests."""
+    session = requests.Session()
+    session.headers.update(headers)
+    # Retries cover connection failures and gateway errors; POST is not in urllib3's default
+    # retry methods, so a transaction is never initialized twice once the request went out
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+    return session
+
+
+_async_client: Optional[httpx.AsyncClient] = None
+
+# Verification results for references that reached a final status, so webhook retries and
+# repeated verify calls for the same reference don't hit the Paystack API (and rate limit)
+# again. Pending/ongoing results are never cached - they are expected to change.
+_VERIFY_CACHE: Dict[str, Tuple[float, dict]] = {}
+_VERIFY_CACHE_TTL = 60  # seconds
+_VERIFY_CACHE_MAX = 10000
+_VERIFY_FINAL_STATUSES = frozenset({"success", "failed"})
+_verify_cache_lock = threading.Lock()
+
+
+def _cached_verification(reference: str) -> Optional[dict]:
+    """Recent final verification result for a reference, if any."""
+    with _verify_cache_lock:
+        cached = _VERIFY_CACHE.get(reference)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] >= _VERIFY_CACHE_TTL:
+            del _VERIFY_CACHE[reference]
+            return None
+        return cached[1]
+
+
+def _remember_verification(reference: str, result: dict) -> dict:
+    """Cache a verification result if its status is final; returns the result."""
+    if result["status"] in _VERIFY_FINAL_STATUSES:
+        with _verify_cache_lock:
+            if len(_VERIFY_CACHE) >= _VERIFY_CACHE_MAX:
+                _VERIFY_CACHE.clear()
+            _VERIFY_CACHE[reference] = (time.monotonic(), result)
+    return result
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Shared async client for Paystack, created on first use inside the running event loop."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            headers=PaystackService.HEADERS,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+            timeout=30.0,
+        )
+    return _async_client
+
+
 class PaystackService:
     """Service for Paystack integration."""
 
     BASE_URL = "https://api.paystack.co"
+    INITIALIZE_URL = BASE_URL + "/transaction/initialize"
+    VERIFY_URL = (BASE_URL + "/transaction/verify/{}").format
+    MAX_AMOUNT_KOBO = 10_000_000 * 100  # 10M NGN sanity limit per transaction
     HEADERS = {
         "Authorization": f"Bearer {settings.paystack_secret_key}",
         "Content-Type": "application/json",
     }
+    _session = _create_session(HEADERS)
 
     @staticmethod
     def initialize_payment(
@@ -41,11 +107,17 @@ class PaystackService:
         Raises:
             ValueError: If API call fails
         """
-        # Convert naira to kobo
-        amount_kobo = int(amount_naira * 100)
+        # Convert naira to kobo exactly (19.99 * 100 is 1998.999... as a float)
+        try:
+            amount_kobo = int((Decimal(str(amount_naira)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+        except (InvalidOperation, ValueError):
+            raise ValueError(f"Invalid amount: {amount_naira}")
 
+        # Reject bad amounts before spending a Paystack round trip on them
         if amount_kobo <= 0:
             raise ValueError("Amount must be greater than 0")
+        if amount_kobo > PaystackService.MAX_AMOUNT_KOBO:
+            raise ValueError(f"Amount exceeds the maximum of {PaystackService.MAX_AMOUNT_KOBO // 100} NGN")
 
         payload = {
             "email": email,
@@ -54,10 +126,9 @@ class PaystackService:
         }
 
         try:
-            response = requests.post(
-                f"{PaystackService.BASE_URL}/transaction/initialize",
-                headers=PaystackService.HEADERS,
-                json=payload,
+            response = PaystackService._session.post(
+                PaystackService.INITIALIZE_URL,
+                data=orjson.dumps(payload),
                 timeout=30,
             )
 
@@ -69,7 +140,7 @@ class PaystackService:
                     f"Failed to initialize payment: {response.status_code}"
                 )
 
-            data = response.json()
+            data = orjson.loads(response.content)
 
             if not data.get("status"):
                 raise ValueError(f"Paystack error: {data.get('message', 'Unknown error')}")
@@ -105,58 +176,96 @@ class PaystackService:
         Raises:
             ValueError: If API call fails
         """
+        cached = _cached_verification(reference)
+        if cached is not None:
+            return cached
+
         try:
-            response = requests.get(
-                f"{PaystackService.BASE_URL}/transaction/verify/{reference}",
-                headers=PaystackService.HEADERS,
+            response = PaystackService._session.get(
+                PaystackService.VERIFY_URL(reference),
                 timeout=30,
             )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Paystack verification error: {str(e)}")
+            raise ValueError(f"Failed to verify payment: {str(e)}")
 
-            if response.status_code != 200:
-                logger.error(
-                    f"Paystack verification failed: {response.status_code} - {response.text}"
-                )
-                raise ValueError(
-                    f"Failed to verify payment: {response.status_code}"
-                )
+        return _remember_verification(reference, PaystackService._verification_result(reference, response))
+
+    @staticmethod
+    async def verify_payment_async(reference: str) -> dict:
+        """
+        Verify payment with Paystack without blocking the event loop.
+        
+        Uses a shared httpx.AsyncClient, so several references can be verified
+        concurrently with asyncio.gather over pooled keep-alive connections.
+        
+        Args:
+            reference: Paystack transaction reference
+        
+        Returns:
+            Dictionary with verification status and details
+        
+        Raises:
+            ValueError: If API call fails
+        """
+        cached = _cached_verification(reference)
+        if cached is not None:
+            return cached
 
-            data = response.json()
+        try:
+            response = await _get_async_client().get(
+                PaystackService.VERIFY_URL(reference)
+            )
+        except httpx.HTTPError as e:
+            logger.error(f"Paystack verification error: {str(e)}")
+            raise ValueError(f"Failed to verify payment: {str(e)}")
 
-            if not data.get("status"):
-                raise ValueError(
-                    f"Paystack error: {data.get('message', 'Unknown error')}"
-                )
+        return _remember_verification(reference, PaystackService._verification_result(reference, response))
 
-            result = data.get("data", {})
+    @staticmethod
+    def _verification_result(reference: str, response) -> dict:
+        """Turn a /transaction/verify response (requests or httpx) into the verification dict."""
+        if response.status_code != 200:
+            logger.error(
+                f"Paystack verification failed: {response.status_code} - {response.text}"
+            )
+            raise ValueError(
+                f"Failed to verify payment: {response.status_code}"
+            )
 
-            # Check if payment was successful
-            payment_status = result.get("status")
-            is_success = payment_status == "success"
+        data = orjson.loads(response.content)
 
-            logger.info(
-                f"Payment verified: {reference} - Status: {payment_status}"
+        if not data.get("status"):
+            raise ValueError(
+                f"Paystack error: {data.get('message', 'Unknown error')}"
             )
 
-            return {
-                "status": payment_status,
-                "is_success": is_success,
-                "amount": result.get("amount") / 100,  # Convert kobo to naira
-                "customer_email": result.get("customer", {}).get("email"),
-                "authorization": result.get("authorization", {}),
-                "metadata": result.get("metadata", {}),
-            }
+        result = data.get("data", {})
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Paystack verification error: {str(e)}")
-            raise ValueError(f"Failed to verify payment: {str(e)}")
+        # Check if payment was successful
+        payment_status = result.get("status")
+        is_success = payment_status == "success"
+
+        logger.info(
+            f"Payment verified: {reference} - Status: {payment_status}"
+        )
+
+        return {
+            "status": payment_status,
+            "is_success": is_success,
+            "amount": result.get("amount") / 100,  # Convert kobo to naira
+            "customer_email": result.get("customer", {}).get("email"),
+            "authorization": result.get("authorization", {}),
+            "metadata": result.get("metadata", {}),
+        }
 
     @staticmethod
-    def verify_webhook_signature(payload_body: str, signature: str) -> bool:
+    def verify_webhook_signature(payload_body: bytes, signature: str) -> bool:
         """
         Verify Paystack webhook signature.
         
         Args:
-            payload_body: Raw request body
+            payload_body: Raw request body bytes
             signature: X-Paystack-Signature header
         
         Returns:
@@ -1,13 +1,93 @@
 """
 Student service - handles student registration and identification.
 """
-from typing import Optional
-from sqlalchemy.orm import Session
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+from sqlalchemy import and_, bindparam, exists, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from models.student import Student, UserStatus
+from models.subscription import Subscription
 from utils.logger import get_logger
 
 logger = get_logger("student_service")
 
+# Lookups built once at import and executed with bound values, so each call skips
+# statement construction and hits SQLAlchemy's compiled-SQL cache
+_STUDENT_BY_ID = select(Student).where(Student.id == bindparam("student_id"))
+_STUDENT_BY_PHONE = select(Student).where(Student.phone_number == bindparam("phone_number"))
+
+# Process-local student cache for the per-message lookups: detached Student rows by id
+# (short TTL, least recently used evicted first) and the phone -> id mapping, which only
+# changes when a student is deleted and the number re-registered.
+_STUDENT_CACHE_TTL = 60  # seconds
+_STUDENT_CACHE_MAX = 5000
+_student_by_id_cache: "OrderedDict[int, Tuple[float, Student]]" = OrderedDict()
+_student_id_by_phone_cache: "OrderedDict[str, int]" = OrderedDict()
+_student_cache_lock = threading.Lock()
+_STUDENT_COLUMN_KEYS = tuple(attr.key for attr in inspect(Student).column_attrs)
+
+
+def _cached_student(db: Session, student_id: Optional[int]) -> Optional[Student]:
+    """Cached student attached to this session, or None on a miss."""
+    if student_id is None:
+        return None
+    with _student_cache_lock:
+        cached = _student_by_id_cache.get(student_id)
+        if cached is None:
+            return None
+        if time.monotonic() - cached[0] >= _STUDENT_CACHE_TTL:
+            del _student_by_id_cache[student_id]
+            return None
+        _student_by_id_cache.move_to_end(student_id)
+    # The session's own copy wins; otherwise attach the cached row without a SELECT
+    existing = db.identity_map.get(identity_key(Student, student_id))
+    return existing if existing is not None else db.merge(cached[1], load=False)
+
+
+def _remember_student(db: Session, student: Optional[Student]) -> Optional[Student]:
+    """Cache a detached copy of a freshly loaded student; returns the session's own instance."""
+    if student is None or student in db.dirty:
+        return student
+    # The caller's instance stays attached - the cache holds a copy of its column values
+    cached = Student(**{key: getattr(student, key) for key in _STUDENT_COLUMN_KEYS})
+    make_transient_to_detached(cached)
+    with _student_cache_lock:
+        _student_by_id_cache[cached.id] = (time.monotonic(), cached)
+        _student_by_id_cache.move_to_end(cached.id)
+        _student_id_by_phone_cache[cached.phone_number] = cached.id
+        _student_id_by_phone_cache.move_to_end(cached.phone_number)
+        while len(_student_by_id_cache) > _STUDENT_CACHE_MAX:
+            _student_by_id_cache.popitem(last=False)
+        while len(_student_id_by_phone_cache) > _STUDENT_CACHE_MAX:
+            _student_id_by_phone_cache.popitem(last=False)
+    return student
+
+
+def _active_subscription_exists(student_id, now):
+    """EXISTS clause for a subscription of the given student (id or column) active at `now`."""
+    return exists().where(
+        and_(
+            Subscription.student_id == student_id,
+            Subscription.is_active == True,
+            Subscription.end_date > now,
+        )
+    )
+
+
+# identify_user only needs these columns - plain rows, no Student objects to build
+_IDENTIFY_USER = select(
+    Student.id,
+    Student.phone_number,
+    Student.status,
+    Student.full_name,
+    Student.email,
+    _active_subscription_exists(Student.id, bindparam("now")).label("has_sub"),
+).where(Student.phone_number == bindparam("phone_number"))
+
 
 class StudentService:
     """Service for student operations."""
@@ -24,11 +104,12 @@ class StudentService:
         Returns:
             Dictionary with user info or None if not found
         """
-        student = db.query(Student).filter(
-            Student.phone_number == phone_number
+        # Student columns and subscription check in one round trip (correlated EXISTS)
+        row = db.execute(
+            _IDENTIFY_USER, {"phone_number": phone_number, "now": datetime.utcnow()}
         ).first()
 
-        if not student:
+        if not row:
             return {
                 "status": "NEW_USER",
                 "student_id": None,
@@ -39,17 +120,14 @@ class StudentService:
                 "has_active_subscription": False,
             }
 
-        # Check if has active subscription
-        has_active = StudentService.has_active_subscription(db, student.id)
-
         return {
             "status": "RETURNING_USER",
-            "student_id": student.id,
-            "phone_number": student.phone_number,
-            "user_status": student.status.value,
-            "name": student.full_name,
-            "email": student.email,
-            "has_active_subscription": has_active,
+            "student_id": row.id,
+            "phone_number": row.phone_number,
+            "user_status": row.status.value,
+            "name": row.full_name,
+            "email": row.email,
+            "has_active_subscription": bool(row.has_sub),
         }
 
     @staticmethod
@@ -90,6 +168,7 @@ class StudentService:
         db.add(student)
         db.commit()
         db.refresh(student)
+        StudentService.invalidate_cached_student(student.id, phone_number)
 
         logger.info(f"Student registered: {student.id} - {phone_number}")
         return student
@@ -136,13 +215,33 @@ class StudentService:
 
     @staticmethod
     def get_student_by_id(db: Session, student_id: int) -> Optional[Student]:
-        """Get student by ID."""
-        return db.query(Student).filter(Student.id == student_id).first()
+        """Get student by ID (served from the student cache when fresh)."""
+        student = _cached_student(db, student_id)
+        if student is not None:
+            return student
+        return _remember_student(
+            db, db.execute(_STUDENT_BY_ID, {"student_id": student_id}).scalars().first()
+        )
 
     @staticmethod
     def get_student_by_phone(db: Session, phone_number: str) -> Optional[Student]:
-        """Get student by phone number."""
-        return db.query(Student).filter(Student.phone_number == phone_number).first()
+        """Get student by phone number (served from the student cache when fresh)."""
+        with _student_cache_lock:
+            student_id = _student_id_by_phone_cache.get(phone_number)
+        student = _cached_student(db, student_id)
+        if student is not None:
+            return student
+        return _remember_student(
+            db, db.execute(_STUDENT_BY_PHONE, {"phone_number": phone_number}).scalars().first()
+        )
+
+    @staticmethod
+    def invalidate_cached_student(student_id: int, phone_number: Optional[str] = None) -> None:
+        """Drop a student from the lookup cache; call after changing or deleting the row."""
+        with _student_cache_lock:
+            _student_by_id_cache.pop(student_id, None)
+            if phone_number is not None:
+                _student_id_by_phone_cache.pop(phone_number, None)
 
     @staticmethod
     def has_active_subscription(db: Session, student_id: int) -> bool:
@@ -156,20 +255,7 @@ class StudentService:
         Returns:
             True if has valid subscription, False otherwise
         """
-        from models.subscription import Subscription
-        from datetime import datetime
-
-        subscription = (
-            db.query(Subscription)
-            .filter(
-                Subscription.student_id == student_id,
-                Subscription.is_active == True,
-                Subscription.end_date > datetime.utcnow(),
-            )
-            .first()
-        )
-
-        return subscription is not None
+        return db.query(_active_subscription_exists(student_id, datetime.utcnow())).scalar()
 
     @staticmethod
     def update_student_status(db: Session, student_id: int, new_status: UserStatus) -> Student:
@@ -181,6 +267,7 @@ class StudentService:
         student.status = new_status
         db.commit()
         db.refresh(student)
+        StudentService.invalidate_cached_student(student_id)
 
         logger.info(f"Student status updated: {student_id} -> {new_status.value}")
         return student
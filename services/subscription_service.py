@@ -2,15 +2,29 @@
 Subscription service - handles student subscriptions.
 """
 from typing import Optional
+from sqlalchemy import and_, bindparam, select, update
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from models.subscription import Subscription
 from models.payment import Payment
 from models.student import Student, UserStatus
+from services.student_service import StudentService
+from utils.db import begin_locking_transaction
 from utils.logger import get_logger
 
 logger = get_logger("subscription_service")
 
+# Built once and executed with bound values (see student_service)
+_ACTIVE_SUBSCRIPTION = (
+    select(Subscription)
+    .where(
+        Subscription.student_id == bindparam("student_id"),
+        Subscription.is_active == True,
+        Subscription.end_date > bindparam("now"),
+    )
+    .limit(1)
+)
+
 
 class SubscriptionService:
     """Service for subscription operations."""
@@ -35,8 +49,10 @@ class SubscriptionService:
         Raises:
             ValueError: If validation fails
         """
-        # Check student exists
-        student = db.query(Student).filter(Student.id == student_id).first()
+        # Check student exists, locking the row until commit so concurrent verify/webhook
+        # calls for the same student can't both end up with an active subscription
+        begin_locking_transaction(db)
+        student = db.query(Student).filter(Student.id == student_id).with_for_update().first()
         if not student:
             raise ValueError(f"Student {student_id} not found")
 
@@ -47,18 +63,11 @@ class SubscriptionService:
         if payment.status.value != "SUCCESS":
             raise ValueError(f"Payment {payment_id} is not verified")
 
-        # Deactivate any existing active subscription
-        existing_active = (
-            db.query(Subscription)
-            .filter(
-                Subscription.student_id == student_id,
-                Subscription.is_active == True,
-            )
-            .first()
-        )
-        if existing_active:
-            existing_active.is_active = False
-            db.add(existing_active)
+        # Deactivate any existing active subscription (one UPDATE, no row loading)
+        db.query(Subscription).filter(
+            Subscription.student_id == student_id,
+            Subscription.is_active == True,
+        ).update({Subscription.is_active: False})
 
         # Create new subscription
         start_date = datetime.utcnow()
@@ -78,10 +87,10 @@ class SubscriptionService:
 
         # Update student status to ACTIVE_SUBSCRIBER
         student.status = UserStatus.ACTIVE_SUBSCRIBER
-        db.add(student)
 
         db.commit()
         db.refresh(subscription)
+        StudentService.invalidate_cached_student(student_id)
 
         logger.info(
             f"Subscription created: {subscription.id} for student {student_id} "
@@ -102,17 +111,9 @@ class SubscriptionService:
         Returns:
             Active Subscription or None
         """
-        subscription = (
-            db.query(Subscription)
-            .filter(
-                Subscription.student_id == student_id,
-                Subscription.is_active == True,
-                Subscription.end_date > datetime.utcnow(),
-            )
-            .first()
-        )
-
-        return subscription
+        return db.execute(
+            _ACTIVE_SUBSCRIPTION, {"student_id": student_id, "now": datetime.utcnow()}
+        ).scalars().first()
 
     @staticmethod
     def check_subscription_status(db: Session, student_id: int) -> dict:
@@ -167,15 +168,14 @@ class SubscriptionService:
             return False
 
         subscription.is_active = False
-        db.add(subscription)
 
         # Update student status
         student = db.query(Student).filter(Student.id == student_id).first()
         if student:
             student.status = UserStatus.REGISTERED_FREE
-            db.add(student)
 
         db.commit()
+        StudentService.invalidate_cached_student(student_id)
 
         logger.info(f"Subscription expired for student {student_id}")
         return True
@@ -204,21 +204,29 @@ class SubscriptionService:
         Returns:
             Number of subscriptions expired
         """
-        expired = SubscriptionService.get_all_expired_subscriptions(db)
-
-        for subscription in expired:
-            subscription.is_active = False
-
-            # Update student status
-            student = db.query(Student).filter(
-                Student.id == subscription.student_id
-            ).first()
-            if student:
-                student.status = UserStatus.REGISTERED_FREE
-                db.add(student)
-
-        if expired:
-            db.commit()
-            logger.info(f"Cleaned up {len(expired)} expired subscriptions")
+        expired = and_(
+            Subscription.is_active == True,
+            Subscription.end_date <= datetime.utcnow(),
+        )
+        student_ids = db.scalars(select(Subscription.student_id).where(expired).distinct()).all()
+        if not student_ids:
+            return 0
+
+        # Two set-based UPDATEs instead of loading every row; students first, while
+        # their subscriptions still match the expiry predicate
+        db.execute(
+            update(Student)
+            .where(Student.id.in_(select(Subscription.student_id).where(expired)))
+            .values(status=UserStatus.REGISTERED_FREE),
+            execution_options={"synchronize_session": False},
+        )
+        count = db.execute(
+            update(Subscription).where(expired).values(is_active=False),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
 
-        return len(expired)
+        for student_id in student_ids:
+            StudentService.invalidate_cached_student(student_id)
+        logger.info(f"Cleaned up {count} expired subscriptions")
+        return count
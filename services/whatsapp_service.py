@@ -3,6 +3,7 @@ WhatsApp Cloud API Integration Service.
 
 Handles sending messages, receiving webhooks, and managing WhatsApp communication.
 """
+import functools
 import httpx
 import json
 import logging
@@ -14,6 +15,24 @@ logger = logging.getLogger(__name__)
 # WhatsApp Cloud API endpoints
 WHATSAPP_API_URL = "https://graph.facebook.com/v22.0"
 
+
+@functools.lru_cache(maxsize=256)
+def _encoded_text_body(text: Optional[str]) -> bytes:
+    """JSON-encode a message body once - bot replies are mostly a small set of fixed texts."""
+    return json.dumps(text).encode("utf-8")
+
+
+def _text_payload(clean_phone: str, text: Optional[str]) -> bytes:
+    """Build the JSON request body for a plain text message around the cached encoded body."""
+    return (
+        b'{"messaging_product": "whatsapp", "recipient_type": "individual", "to": '
+        + json.dumps(clean_phone).encode("utf-8")
+        + b', "type": "text", "text": {"preview_url": true, "body": '
+        + _encoded_text_body(text)
+        + b'}}'
+    )
+
+
 # Credential cache (loaded once on startup, updated when admin changes settings)
 _credentials_cache: Optional[tuple[Optional[str], Optional[str]]] = None
 
@@ -31,24 +50,18 @@ async def load_whatsapp_credentials_from_db() -> tuple[Optional[str], Optional[s
         from models.settings import AdminSetting
         
         async with async_session_maker() as session:
-            # Query for API key
+            # Both keys in one query
             from sqlalchemy import select
-            api_key_query = select(AdminSetting).where(
-                AdminSetting.key == "WHATSAPP_API_KEY"
-            )
-            api_key_result = await session.execute(api_key_query)
-            api_key_obj = api_key_result.scalar_one_or_none()
-            
-            # Query for phone ID
-            phone_id_query = select(AdminSetting).where(
-                AdminSetting.key == "WHATSAPP_PHONE_NUMBER_ID"
+            result = await session.execute(
+                select(AdminSetting.key, AdminSetting.value).where(
+                    AdminSetting.key.in_(("WHATSAPP_API_KEY", "WHATSAPP_PHONE_NUMBER_ID"))
+                )
             )
-            phone_id_result = await session.execute(phone_id_query)
-            phone_id_obj = phone_id_result.scalar_one_or_none()
+            stored = dict(result.all())
             
             # Extract values with fallback to env vars
-            api_key = api_key_obj.value if api_key_obj and api_key_obj.value else settings.whatsapp_api_key
-            phone_id = phone_id_obj.value if phone_id_obj and phone_id_obj.value else settings.whatsapp_phone_number_id
+            api_key = stored.get("WHATSAPP_API_KEY") or settings.whatsapp_api_key
+            phone_id = stored.get("WHATSAPP_PHONE_NUMBER_ID") or settings.whatsapp_phone_number_id
             
             if api_key and phone_id:
                 logger.info("✅ [WhatsApp] Loaded credentials from database")
@@ -257,14 +270,9 @@ class WhatsAppService:
 
         try:
             async with httpx.AsyncClient(timeout=30.0) as client:
-                if message_type == "text":
-                    payload = {
-                        "messaging_product": "whatsapp",
-                        "recipient_type": "individual",
-                        "to": clean_phone,
-                        "type": "text",
-                        "text": {"preview_url": True, "body": text},
-                    }
+                if message_type in ("text", "button"):
+                    # Text with button is sent as a plain text message
+                    payload = _text_payload(clean_phone, text)
 
                 elif message_type == "template":
                     payload = {
@@ -287,16 +295,6 @@ class WhatsAppService:
                             }
                         ]
 
-                elif message_type == "button":
-                    # Send text with button
-                    payload = {
-                        "messaging_product": "whatsapp",
-                        "recipient_type": "individual",
-                        "to": clean_phone,
-                        "type": "text",
-                        "text": {"preview_url": True, "body": text},
-                    }
-
                 else:
                     return {
                         "status": "error",
@@ -315,7 +313,10 @@ class WhatsAppService:
                 logger.info(f"🔵 [send_message] Payload type: {message_type}")
                 logger.info(f"🔵 [send_message] Making POST request to WhatsApp API...")
                 
-                response = await client.post(url, json=payload, headers=headers)
+                if isinstance(payload, bytes):
+                    response = await client.post(url, content=payload, headers=headers)
+                else:
+                    response = await client.post(url, json=payload, headers=headers)
                 
                 logger.info(f"🔵 [send_message] API response status: {response.status_code}")
 
@@ -140,50 +140,52 @@ def test_notification_system():
         print("TEST 10: Notification Triggers")
         print("-" * 60)
         
-        print("  Trigger: Homework Submitted")
-        NotificationTrigger.on_homework_submitted(
-            phone_number=test_phone,
-            student_name="John Doe",
-            subject="Mathematics",
-            homework_id="hw_001",
-            db=db
-        )
-        print("  ✓ Homework submission notification created")
-        
-        print("  Trigger: Homework Reviewed")
-        NotificationTrigger.on_homework_reviewed(
-            phone_number=test_phone,
-            subject="Mathematics",
-            tutor_name="Ms. Smith",
-            homework_id="hw_001",
-            db=db
-        )
-        print("  ✓ Homework review notification created")
-        
-        print("  Trigger: Registration Complete")
-        NotificationTrigger.on_registration_complete(
-            phone_number=test_phone,
-            student_name="John Doe",
-            db=db
-        )
-        print("  ✓ Registration complete notification created")
-        
-        print("  Trigger: Chat Support Started")
-        NotificationTrigger.on_chat_support_started(
-            phone_number=test_phone,
-            user_name="John Doe",
-            db=db
-        )
-        print("  ✓ Chat support notification created")
-        
-        print("  Trigger: Subscription Activated")
-        NotificationTrigger.on_subscription_activated(
-            phone_number=test_phone,
-            plan_name="Premium",
-            duration_days=30,
-            db=db
-        )
-        print("  ✓ Subscription notification created\n")
+        # Write the trigger notifications here instead of via the background queue
+        with NotificationTrigger.batch(db):
+            print("  Trigger: Homework Submitted")
+            NotificationTrigger.on_homework_submitted(
+                phone_number=test_phone,
+                student_name="John Doe",
+                subject="Mathematics",
+                homework_id="hw_001",
+                db=db
+            )
+            print("  ✓ Homework submission notification created")
+        
+            print("  Trigger: Homework Reviewed")
+            NotificationTrigger.on_homework_reviewed(
+                phone_number=test_phone,
+                subject="Mathematics",
+                tutor_name="Ms. Smith",
+                homework_id="hw_001",
+                db=db
+            )
+            print("  ✓ Homework review notification created")
+        
+            print("  Trigger: Registration Complete")
+            NotificationTrigger.on_registration_complete(
+                phone_number=test_phone,
+                student_name="John Doe",
+                db=db
+            )
+            print("  ✓ Registration complete notification created")
+        
+            print("  Trigger: Chat Support Started")
+            NotificationTrigger.on_chat_support_started(
+                phone_number=test_phone,
+                user_name="John Doe",
+                db=db
+            )
+            print("  ✓ Chat support notification created")
+        
+            print("  Trigger: Subscription Activated")
+            NotificationTrigger.on_subscription_activated(
+                phone_number=test_phone,
+                plan_name="Premium",
+                duration_days=30,
+                db=db
+            )
+            print("  ✓ Subscription notification created\n")
         
         # Test 11: Filter by type
         print("TEST 11: Filter Notifications by Type")
@@ -208,9 +210,9 @@ def test_notification_system():
         unread_before = NotificationService.get_unread_count(test_phone, db)
         print(f"✓ Unread before: {unread_before}")
         
-        success = NotificationService.mark_all_as_read(test_phone, db)
+        marked = NotificationService.mark_all_as_read(test_phone, db)
         unread_after = NotificationService.get_unread_count(test_phone, db)
-        print(f"✓ Mark all operation: {success}")
+        print(f"✓ Marked as read: {marked}")
         print(f"✓ Unread after: {unread_after}\n")
         
         print("="*60)
@@ -230,10 +232,9 @@ def test_notification_system():
         return True
         
     except Exception as e:
+        # Re-raise so pytest (and the script's exit code) report the failure
         logger.error(f"Test failed: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
+        raise
         
     finally:
         db.close()
@@ -0,0 +1,42 @@
+"""
+Background helpers - daemon threads that periodically write buffered work to the database.
+"""
+import threading
+import time
+from typing import Callable, Optional
+from utils.logger import get_logger
+
+logger = get_logger("background")
+
+
+class BackgroundFlusher:
+    """
+    Daemon thread that calls flush() every interval seconds, started on first use.
+
+    Buffers using it should also be flushed once at shutdown (see main.lifespan), since
+    the thread dies with the process.
+    """
+
+    def __init__(self, name: str, flush: Callable[[], object], interval: float):
+        self.name = name
+        self.flush = flush
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self) -> None:
+        """Start the thread if it isn't running yet."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in {self.name}: {str(e)}")
@@ -0,0 +1,42 @@
+"""
+Database helpers shared by the services.
+"""
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+
+def update_by_key(db: Session, column, key, not_found: str, **values) -> None:
+    """
+    Apply a single UPDATE to the rows whose column equals key.
+
+    Objects of that model already loaded in the session are updated in place. Neither
+    commits nor rolls back - transaction handling stays with the caller.
+
+    Args:
+        db: Database session
+        column: Mapped key attribute, e.g. Payment.id
+        key: Key value
+        not_found: ValueError message when no row matched
+        **values: Column values to set
+
+    Raises:
+        ValueError: If no row matched
+    """
+    result = db.execute(update(column.class_).where(column == key).values(**values))
+    if result.rowcount == 0:
+        raise ValueError(not_found)
+
+
+def begin_locking_transaction(db: Session) -> None:
+    """
+    Open a real transaction on the session's connection before a SELECT ... FOR UPDATE.
+
+    The MySQL engines connect with autocommit on, where SQLAlchemy's BEGIN is a no-op and a
+    row lock would be released as soon as its SELECT finished. START TRANSACTION holds locks
+    until the session commits or rolls back, after which autocommit resumes. Statements the
+    session ran earlier were already autocommitted, so it is safe mid-session. Other
+    dialects already run inside a transaction.
+    """
+    connection = db.connection()
+    if connection.dialect.name == "mysql":
+        connection.exec_driver_sql("START TRANSACTION")
@@ -7,7 +7,7 @@ import json
 import secrets
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Tuple
+from typing import Dict, Tuple, Union
 from fastapi import Request
 from config.settings import settings
 from utils.logger import get_logger
@@ -24,7 +24,7 @@ session_store: Dict[str, Dict[str, any]] = {}
 failed_attempts: Dict[str, Dict[str, any]] = {}
 
 
-def verify_paystack_webhook_signature(payload_body: str, signature: str) -> bool:
+def verify_paystack_webhook_signature(payload_body: Union[bytes, str], signature: str) -> bool:
     """
     Verify Paystack webhook signature.
     
@@ -32,7 +32,7 @@ def verify_paystack_webhook_signature(payload_body: str, signature: str) -> bool
     Signature should match: HMAC-SHA512(secret, payload)
     
     Args:
-        payload_body: Raw request body as string
+        payload_body: Raw request body - pass the bytes as received; str is encoded first
         signature: X-Paystack-Signature header value
     
     Returns: